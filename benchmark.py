@@ -0,0 +1,259 @@
+"""
+Benchmarks for the overhead snot adds to a test run.  Run them with:
+
+    python benchmark.py [--sizes 1000,10000] [--latency SECONDS] [benchmark name ...]
+
+Each benchmark prints a table, with no arguments all of them are run.
+"""
+from __future__ import print_function
+import datetime
+import multiprocessing
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import time
+import timeit
+import unittest
+
+import nose.case
+import nose.config
+import nose.core
+import nose.loader
+import nose.plugins.manager
+
+import snot
+from fakeslick import FakeSlick
+from slickqa import Result, ResultStatus
+
+__author__ = 'agent'
+
+
+def synthetic_test():
+    pass
+
+
+def nose_test(config, name):
+    test = nose.case.Test(nose.case.FunctionTestCase(synthetic_test), config=config)
+    test.id = lambda: "benchmark.{}".format(name)
+    return test
+
+
+def bench_result_lookup(sizes=(100, 1000, 10000, 100000), samples=1000):
+    """Time addSlickResult with results already filed for 100 to 100k tests, the per test time should stay flat."""
+    print("{:>10} {:>18}".format("tests", "usec per result"))
+    config = nose.config.Config()
+    # the plugin isn't configured here, so load slick the way configure would
+    snot.load_slick()
+    for size in sizes:
+        plugin = snot.SlickAsSnotPlugin()
+        plugin.enabled = True
+        plugin.mode = 'normal'
+        plugin.results = dict()
+        plugin.results_by_suffix = dict()
+        for index in range(size):
+            result = Result()
+            result.attributes = {}
+            result.started = datetime.datetime.now()
+            result.update = lambda: None
+            plugin.indexSlickResult("benchmark.test_{}".format(index), result)
+        step = max(1, size // samples)
+        tests = [nose_test(config, "test_{}".format(index)) for index in range(0, size, step)]
+
+        def report_all():
+            for test in tests:
+                plugin.addSlickResult(test, ResultStatus.PASS)
+        elapsed = min(timeit.repeat(report_all, number=1, repeat=3))
+        print("{:>10} {:>18.2f}".format(size, elapsed / len(tests) * 1000000))
+
+
+def bench_graph_writes(samples=100000, columns=4):
+    """Time writing graph values one at a time with write_to_graph against all at once with write_values_to_graph."""
+    print("{:>22} {:>18}".format("api", "usec per value"))
+    dates = [1500000000000 + index for index in range(samples)]
+    rows = [[index + column for column in range(columns)] for index in range(samples)]
+
+    def new_result():
+        result = Result()
+        result.graph = {'columns': [{'type': 'line', 'name': str(column)} for column in range(columns)], 'values': []}
+        result.update = lambda: None
+        snot.current_result = result
+        snot.graph_buffer = snot.GraphBuffer(result)
+
+    def one_at_a_time():
+        new_result()
+        for date, row in zip(dates, rows):
+            snot.write_to_graph({'date': date, 'measurements': row})
+        snot.graph_buffer.flush()
+
+    def all_at_once():
+        new_result()
+        snot.write_values_to_graph(dates, rows)
+        snot.graph_buffer.flush()
+
+    for api in [one_at_a_time, all_at_once]:
+        elapsed = min(timeit.repeat(api, number=1, repeat=3))
+        print("{:>22} {:>18.2f}".format(api.__name__, elapsed / samples * 1000000))
+    snot.current_result = None
+    snot.graph_buffer = None
+
+
+generated_cases = 0
+
+
+def synthetic_case(index):
+    pass
+
+
+def synthetic_generator():
+    for index in range(generated_cases):
+        yield synthetic_case, index
+
+
+def synthetic_suite(kind, size):
+    """
+    A suite of size tests of one kind: plain test functions, tests yielded by a generator, or data driven tests
+    (one function called with a different argument for each case).
+    """
+    global generated_cases
+    if kind == 'generator':
+        generated_cases = size
+        return nose.loader.TestLoader().loadTestsFromGenerator(synthetic_generator, sys.modules[__name__])
+    if kind == 'data_driven':
+        return unittest.TestSuite(nose.case.Test(nose.case.FunctionTestCase(synthetic_case, arg=(index,)))
+                                  for index in range(size))
+    tests = []
+    for index in range(size):
+        test = nose.case.Test(nose.case.FunctionTestCase(synthetic_test))
+        test.id = lambda name="benchmark.synthetic_test_{}".format(index): name
+        tests.append(test)
+    return unittest.TestSuite(tests)
+
+
+def run_suite(kind, size, mode, latency):
+    """
+    Run a synthetic suite with nose, with snot reporting to a fake slick unless mode is None.  Returns the seconds it
+    took and the peak memory of the process in kilobytes.
+    """
+    argv = ['benchmark']
+    plugins = []
+    slick = None
+    if mode is not None:
+        slick = FakeSlick(latency=latency).start()
+        plugins.append(snot.SlickAsSnotPlugin())
+        argv.extend(['--with-snot', '--slick-url', slick.url, '--slick-project-name', 'Benchmark',
+                     '--slick-release', '1.0', '--slick-build', 'dev', '--slick-testplan', 'Benchmark'])
+        if mode == 'schedule':
+            argv.append('--slick-schedule-results')
+    with open(os.devnull, 'w') as devnull:
+        config = nose.config.Config(stream=devnull, plugins=nose.plugins.manager.PluginManager(plugins=plugins))
+        suite = synthetic_suite(kind, size)
+        started = time.time()
+        try:
+            program = nose.core.TestProgram(argv=argv, config=config, suite=suite, exit=False)
+            assert program.success, "the {} suite failed".format(kind)
+        except SystemExit:
+            # snot exits once the results are scheduled
+            pass
+        elapsed = time.time() - started
+    if slick is not None:
+        slick.stop()
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def call_in_child(results, function, args):
+    """The target of in_child_process's child, it has to be importable for platforms that spawn the child."""
+    try:
+        results.put((True, function(*args)))
+    except BaseException as err:
+        results.put((False, "{}: {}".format(type(err).__name__, err)))
+
+
+def in_child_process(function, *args):
+    """
+    Call function in a child process so that each run starts clean and it's peak memory is it's own.  If the child
+    fails the error is raised in the parent.
+    """
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=call_in_child, args=(results, function, args))
+    child.start()
+    succeeded, answer = results.get()
+    child.join()
+    if not succeeded:
+        raise RuntimeError(answer)
+    return answer
+
+
+def bench_suites(sizes=(1000, 10000, 100000), kinds=('plain', 'generator', 'data_driven'), modes=('normal', 'schedule'),
+                 latency=0.0):
+    """
+    Run whole suites through nose with snot reporting to a fake slick, in each mode, against the same suite without
+    snot.  Overhead is the extra time per test snot adds (in schedule mode the tests aren't run, so it's the time to
+    schedule them less the time to run them), memory is the peak for the whole process.  Each run is in a new process.
+    """
+    print("{:>12} {:>9} {:>9} {:>14} {:>18} {:>12}".format("kind", "mode", "tests", "tests per sec",
+                                                            "usec overhead", "peak MB"))
+    for kind in kinds:
+        for size in sizes:
+            baseline, _ = in_child_process(run_suite, kind, size, None, latency)
+            for mode in modes:
+                elapsed, peak = in_child_process(run_suite, kind, size, mode, latency)
+                print("{:>12} {:>9} {:>9} {:>14.0f} {:>18.2f} {:>12.1f}".format(
+                    kind, mode, size, size / elapsed, (elapsed - baseline) / size * 1000000, peak / 1024.0))
+
+
+IMPORT_TIMER = """
+import time
+import nose.core
+started = time.time()
+import snot
+imported = time.time()
+snot.load_slick()
+print("{} {}".format(imported - started, time.time() - imported))
+"""
+
+
+def bench_import(repeat=5):
+    """
+    Time importing snot, the way nose's plugin loading does in every run, and then loading slickqa and friends, which
+    only happens once the plugin is enabled.  Each import is in a new interpreter with nose already imported, the
+    best of repeat runs is shown (after a first run that compiles the modules).
+    """
+    print("{:>24} {:>10}".format("stage", "msec"))
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    runs = []
+    for run in range(repeat + 1):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_TIMER], env=env,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        runs.append([float(seconds) for seconds in output.split()])
+    for stage, seconds in zip(["import snot", "load_slick"], zip(*runs[1:])):
+        print("{:>24} {:>10.1f}".format(stage, min(seconds) * 1000))
+
+
+BENCHMARKS = [bench_result_lookup, bench_graph_writes, bench_suites, bench_import]
+
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options] [benchmark name ...]")
+    parser.add_option("--sizes", action="store", default=None, metavar="SIZES", dest="sizes",
+                      help="a comma separated list of suite sizes for bench_suites, by default 1000,10000,100000")
+    parser.add_option("--latency", action="store", type="float", default=0.0, metavar="SECONDS", dest="latency",
+                      help="how long the fake slick used by bench_suites waits before answering each request")
+    options, names = parser.parse_args(argv)
+    for benchmark in BENCHMARKS:
+        if not names or benchmark.__name__ in names or benchmark.__name__[len('bench_'):] in names:
+            print(benchmark.__name__)
+            if benchmark is bench_suites:
+                kwargs = {'latency': options.latency}
+                if options.sizes:
+                    kwargs['sizes'] = [int(size) for size in options.sizes.split(',')]
+                benchmark(**kwargs)
+            else:
+                benchmark()
+            print()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+"""
+A small in-process stand-in for the slick web app.  It implements just enough of slick's rest api for snot to
+create testruns, file and update results, and upload files, keeping everything in memory.  Used by the unit tests
+and the benchmarks so that neither needs a real slick server.
+"""
+import sys
+if sys.version_info[0] < 3:
+    from future import standard_library
+    standard_library.install_aliases()
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl, unquote
+
+from snotspool import SlickRouter
+
+__author__ = 'agent'
+
+RESULT_STATUSES = ['PASS', 'FAIL', 'BROKEN_TEST', 'NOT_TESTED', 'SKIPPED', 'NO_RESULT', 'CANCELLED',
+                   'PASSED_ON_RETRY']
+
+
+class FakeSlickRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        if len(parts) > 0 and parts[0] == 'api':
+            parts = parts[1:]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+        status, response = self.server.slick.dispatch(method, parts, dict(parse_qsl(url.query)), body)
+        content_type = 'application/octet-stream'
+        data = response
+        if not isinstance(response, bytes):
+            content_type = 'application/json'
+            data = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeSlickServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeSlick(SlickRouter):
+    """
+    An in memory slick server listening on localhost.  Use it as a context manager, or call start() and stop().
+
+    :param latency: how many seconds to sleep before answering each request, to simulate a remote slick.
+    :param id_format: the format of the ids given to new objects, filled in with a counter.
+    """
+
+    product_name = 'Fake Slick'
+
+    def __init__(self, latency=0.0, id_format="{:024x}"):
+        SlickRouter.__init__(self, ['projects', 'testplans', 'configurations', 'testruns', 'testcases', 'results',
+                                    'testrungroups', 'files'])
+        self.latency = latency
+        self.id_format = id_format
+        self.url = None
+        self.server = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.requests = []
+        self.bytes_received = 0
+        self.chunks = {}
+
+    def start(self):
+        self.server = FakeSlickServer(('127.0.0.1', 0), FakeSlickRequestHandler)
+        self.server.slick = self
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-slick')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def count(self, method=None, collection=None):
+        """How many requests were made, optionally only those with the given http method and/or collection."""
+        return len([request for request in self.requests
+                    if (method is None or request[0] == method) and (collection is None or request[1] == collection)])
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests = []
+            self.bytes_received = 0
+
+    def new_id(self):
+        return self.id_format.format(next(self.ids))
+
+    def dispatch(self, method, parts, query, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests.append((method, parts[0] if parts else '', '/'.join(parts)))
+            self.bytes_received += len(body)
+            if len(parts) == 4 and parts[0] == 'files' and parts[2] == 'content' and method == 'GET':
+                return 200, b''.join(self.chunks.get(parts[1], []))
+            return self.respond(method, parts, query, body)
+
+    def accepts(self, collection, obj):
+        # like slick, a result has to be for a testcase it has
+        return collection != 'results' or obj.get('testcase', {}).get('testcaseId') in self.store['testcases']
+
+    def add_chunk(self, file_id, data):
+        self.chunks.setdefault(file_id, []).append(data)
+        return self.store['files'][file_id]
+
+    def add_log(self, result_id, entries):
+        self.store['results'][result_id].setdefault('log', []).extend(entries)
+        return len(entries)
+
+    def summarize(self, collection, item):
+        if collection != 'testruns':
+            return item
+        by_status = dict((status, 0) for status in RESULT_STATUSES)
+        for result in self.store['results'].values():
+            if result.get('testrun', {}).get('testrunId') == item['id']:
+                by_status[result.get('status', 'NO_RESULT')] += 1
+        summary = {'resultsByStatus': by_status, 'total': sum(by_status.values())}
+        return dict(item, summary=summary)
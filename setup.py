@@ -20,7 +20,7 @@ setup(
     version="1.0.2961",
     license="License :: OSI Approved :: Apache Software License",
     long_description=open('README.md').read(),
-    py_modules=['snot'],
+    py_modules=['snot', 'snotspool'],
     # packages=find_packages(exclude=['distribute_setup']),
     # package_data={'': ['*.txt', '*.rst', '*.html']},
     # include_package_data=True,
@@ -30,6 +30,9 @@ setup(
     entry_points={
         'nose.plugins.0.10': [
             'snot = snot:SlickAsSnotPlugin'
+        ],
+        'console_scripts': [
+            'snot-replay = snotspool:main'
         ]
     }
 )
@@ -1,37 +1,54 @@
-from future import standard_library
-standard_library.install_aliases()
+import sys
+if sys.version_info[0] < 3:
+    from future import standard_library
+    standard_library.install_aliases()
 from builtins import str
 from builtins import range
-from past.builtins import basestring
+import array
+import copy
 import datetime
+import hashlib
 import importlib
-import imp
 import inspect
+import io
 import itertools
+import json
 import logging
+import mimetypes
 import os
 import pickle
-import sys
+import queue
+import re
+import shutil
+import tempfile
+import threading
 import time
 import traceback
-import types
-from functools import partial
+import unittest
+import weakref
+import zlib
+from collections import OrderedDict
+from functools import partial, wraps
 from unittest import SkipTest
+from urllib.parse import quote
 
 import nose
 import nose.case
 import nose.config
+import nose.loader
 import nose.plugins
-
-from slickqa import SlickQA, Testcase, ResultStatus, RunStatus, Step, Result, make_result_updatable, \
-    make_testrun_updatable, DocStringMetaData, GraphValueReference
-from slickqa.connection import SlickConnection
+import nose.util
 
 try:
     from configparser import SafeConfigParser
 except:
     from ConfigParser import SafeConfigParser
 
+try:
+    basestring
+except NameError:
+    basestring = str
+
 __author__ = 'jcorbett'
 
 log = logging.getLogger('nose.plugins.snot')
@@ -46,10 +63,73 @@ on_file_result = None
 snot_options = None
 test_failed = False
 test_not_tested = False
+# functions call_function has already found, by name
+called_functions = dict()
+# parsed DocStringMetaData by test function
+docstring_metadata = weakref.WeakKeyDictionary()
+# graph values written during the current test that haven't been sent to slick yet
+graph_buffer = None
+# uploads the files added with add_file, set up by the plugin from it's options
+uploader = None
+# the time spent in the plugin's hooks, when --snot-timings is used
+timings = None
+# what slickqa sent it's requests with before snot replaced it, see replace_requests
+unreplaced_requests = None
 
 REQUIRES_ATTRIBUTE = 'slick_requires'
 SLICK_ATTRIBUTES = 'slick_test_attributes'
 SKIP_CALLBACK = 'skip_callback'
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_REPORTER_QUEUE_SIZE = 1000
+TESTCASE_CACHE_VERSION = 2
+ARGUMENT_STORE_TESTRUN = 'testrun'
+ARGUMENT_PACK_PREFIX = 'snot-arguments-'
+DEFAULT_LOG_BATCH_SIZE = 500
+DEFAULT_LOG_BATCH_INTERVAL = 5.0
+DEFAULT_LOG_CAPTURE_SPILL_SIZE = 1024 * 1024
+DEFAULT_GRAPH_BATCH_SIZE = 1000
+DEFAULT_GRAPH_BATCH_INTERVAL = 5.0
+DEFAULT_UPLOAD_CHUNK_SIZE = 262144
+
+
+# the names snot uses from slickqa, added to this module by load_slick
+SLICKQA_NAMES = ['SlickQA', 'Testcase', 'ResultStatus', 'RunStatus', 'Step', 'Result', 'make_result_updatable',
+                 'make_testrun_updatable', 'DocStringMetaData', 'GraphValueReference', 'LogEntry', 'StoredFile',
+                 'Testrun']
+PackedGraphValue = None
+
+
+def load_slick():
+    """
+    Import slickqa, requests and snotspool, adding the names snot uses from them to this module.  nose imports snot
+    in every run, with --with-snot or without, so they aren't imported until the plugin is enabled or something that
+    talks to slick is used.
+    """
+    global PackedGraphValue
+    namespace = globals()
+    if 'slickqa' in namespace:
+        return
+    import requests
+    import slickqa
+    import slickqa.connection
+    import snotspool
+    namespace.update((name, getattr(slickqa, name)) for name in SLICKQA_NAMES)
+    namespace.update(requests=requests, snotspool=snotspool, SlickConnection=slickqa.connection.SlickConnection,
+                     SlickCommunicationError=slickqa.connection.SlickCommunicationError)
+    PackedGraphValue = type('PackedGraphValue', (PackedGraphValueMixin, slickqa.GraphValueReference), {})
+    namespace['slickqa'] = slickqa
+
+
+def __getattr__(name):
+    """
+    Load slick the first time one of it's names is looked up on snot, so from snot import ResultStatus works before
+    the plugin is enabled (python 3.7 and later, on python 2 call load_slick first).
+    """
+    if name in SLICKQA_NAMES or name in ('slickqa', 'requests', 'snotspool', 'SlickConnection',
+                                         'SlickCommunicationError'):
+        load_slick()
+        return globals()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 class PassedOnRetry(Exception):
@@ -69,6 +149,22 @@ class ErrorValue(str):
     __suppress_context__ = None
 
 
+def timed(hook):
+    """Add the time spent in the decorated function to the timings of hook, when --snot-timings is used."""
+    def _wrap_with_timer(f):
+        @wraps(f)
+        def _timed(*args, **kwargs):
+            if timings is None:
+                return f(*args, **kwargs)
+            start = Timings.clock()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                timings.record(hook, Timings.clock() - start)
+        return _timed
+    return _wrap_with_timer
+
+
 def skip_if(func):
     def _wrap_with_skip_if(f):
         if hasattr(f, SKIP_CALLBACK):
@@ -104,10 +200,22 @@ def add_file(path, fileobj=None):
     Upload a file to slick, adding it to the current test result.  If no test is running, this will do nothing!
 
     :param path: The path to the specified file
+    :param fileobj: A file like object to upload instead of reading the path (text or binary)
+    :return: Nothing
+    """
+    add_files([(path, fileobj)])
+
+
+def add_files(files):
+    """
+    Upload several files to slick (at the same time with --snot-upload-workers), adding them all to the current test
+    result with one update.  If no test is running, this will do nothing!
+
+    :param files: paths, or (path, fileobj) tuples
     :return: Nothing
     """
     if current_result is not None:
-        current_result.add_file(path, fileobj)
+        (uploader or FileUploader()).attach(current_result, files)
 
 
 def add_link(name, url):
@@ -141,7 +249,7 @@ def add_file_to_testrun(path, fileobj=None):
     :return: Nothing
     """
     if testrun is not None:
-        testrun.add_file(path, fileobj)
+        (uploader or FileUploader()).attach(testrun, [(path, fileobj)])
 
 
 def add_graph(graph):
@@ -151,58 +259,1418 @@ def add_graph(graph):
     :return: Nothing
     """
     if current_result is not None:
+        if graph_buffer is not None and graph_buffer.result is current_result:
+            # values written before the graph was replaced would be replaced with it
+            graph_buffer.clear()
         current_result.graph = graph
         current_result.update()
 
 
 def write_to_graph(value):
     """
-    Append value to graph object
+    Append value to graph object.  During a test the values are buffered and sent to slick in batches, see
+    --snot-graph-batch-size.
     :param value: {'date': date_in_millis, 'measurements':[1, 2, 3, 4]}
     :return: Nothing
     """
     try:
         if current_result is not None:
-            if isinstance(value, (list, tuple)):
-                current_result.graph.values.extend([GraphValueReference.from_dict(v) for v in value])
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            if graph_buffer is not None and graph_buffer.result is current_result:
+                for v in value:
+                    graph_buffer.add(v['date'], v['measurements'])
+                graph_buffer.flush_if_due()
             else:
-                current_result.graph.values.append(GraphValueReference.from_dict(value))
-            current_result.update()
+                load_slick()
+                current_result.graph.values.extend([GraphValueReference.from_dict(v) for v in value])
+                current_result.update()
     except:
         log.warn("Error while trying to write to graph. Catching. Don't care.")
 
 
+def write_values_to_graph(dates, measurements):
+    """
+    Append many values to graph object at once, cheaper than calling write_to_graph for each.  numpy arrays can be
+    passed for both.
+    :param dates: the date of each value, in millis (or datetime objects)
+    :param measurements: the measurements of each value, a sequence of rows or a 2 dimensional array
+    :return: Nothing
+    """
+    try:
+        if current_result is not None:
+            if graph_buffer is not None and graph_buffer.result is current_result:
+                graph_buffer.add_values(dates, measurements)
+                graph_buffer.flush_if_due()
+            else:
+                buffered = GraphBuffer(current_result)
+                buffered.add_values(dates, measurements)
+                buffered.flush()
+    except:
+        log.warn("Error while trying to write to graph. Catching. Don't care.", exc_info=sys.exc_info())
+
+
 def parse_config(files):
     parser = SafeConfigParser()
     parser.read(files)
     return parser
 
 
+def number_option(value, default, convert=int):
+    """Convert the value of a numeric option, returning default if it wasn't given or isn't a number."""
+    if value:
+        try:
+            return convert(value)
+        except:
+            log.warn("Ignoring '%s', it should be a number.", value)
+    return default
+
+
+def comma_list(value):
+    """The items of a comma separated option, an empty list if it wasn't given."""
+    if not value:
+        return []
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def log_level(value, default=logging.NOTSET):
+    """The logging level for the value of an option, either a level name like INFO or a number."""
+    if value:
+        if str(value).isdigit():
+            return int(value)
+        level = logging.getLevelName(str(value).upper())
+        if isinstance(level, int):
+            return level
+        log.warn("Ignoring '%s', it should be the name of a logging level or a number.", value)
+    return default
+
+
+def replace_file(source, destination):
+    """Rename source to destination, replacing destination if it exists (which os.rename won't do on windows)."""
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+        return
+    if sys.platform == 'win32' and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
+
+def prefix_pattern(prefixes):
+    """A compiled regular expression that matches a name starting with any of the prefixes (nothing if empty)."""
+    if not prefixes:
+        return re.compile(r'(?!)')
+    return re.compile('|'.join(re.escape(prefix) for prefix in prefixes))
+
+
+def pickled(value):
+    """Pickle a value into text that can go in a result's attributes, protocol 0 so python 2 and 3 can both load it."""
+    return pickle.dumps(value, 0).decode('latin-1')
+
+
+def unpickled(text):
+    return pickle.loads(text.encode('latin-1'))
+
+
 def call_function(function_name):
-    module = None
-    if '.' not in sys.path:
-        sys.path.append('.')
-    if '.' in function_name:
-        last_dot_index = function_name.rindex('.')
-        module = function_name[:last_dot_index]
-        function_name = function_name[last_dot_index + 1:]
-    if module is None:
-        module = globals()
+    func = called_functions.get(function_name)
+    if func is None:
+        full_name = function_name
+        module = None
+        if '.' not in sys.path:
+            sys.path.append('.')
+        if '.' in function_name:
+            last_dot_index = function_name.rindex('.')
+            module = function_name[:last_dot_index]
+            function_name = function_name[last_dot_index + 1:]
+        if module is None:
+            module = globals()
+        else:
+            module = importlib.import_module(module)
+        if hasattr(module, function_name):
+            func = getattr(module, function_name)
+            called_functions[full_name] = func
+        else:
+            raise Exception("could not find " + function_name + " to run.")
+    return func()
+
+
+def get_docstring_metadata(func):
+    """
+    Get the DocStringMetaData for a test function, parsing each function's docstring only once (generators yield
+    the same function for every case).  Returns a copy, so it can be changed for each test.
+    """
+    key = getattr(func, '__func__', func)
+    try:
+        metadata = docstring_metadata.get(key)
+    except TypeError:
+        # can't be weakly referenced, don't cache it
+        return DocStringMetaData(func)
+    if metadata is None:
+        metadata = DocStringMetaData(func)
+        docstring_metadata[key] = metadata
+    return copy.copy(metadata)
+
+
+def replace_requests(replacement):
+    """
+    Make slickqa send it's requests with replacement instead of the requests module (or whatever it was using),
+    remembering what that was for restore_requests.
+    """
+    global unreplaced_requests
+    if unreplaced_requests is None:
+        unreplaced_requests = slickqa.connection.requests
+    slickqa.connection.requests = replacement
+
+
+def restore_requests():
+    """Put back what slickqa sent it's requests with before snot replaced it, closing the pooled session if any."""
+    global unreplaced_requests
+    if unreplaced_requests is None:
+        return
+    replacement = slickqa.connection.requests
+    if isinstance(replacement, CountingRequests):
+        replacement = replacement.wrapped
+    if isinstance(replacement, requests.Session):
+        replacement.close()
+    slickqa.connection.requests = unreplaced_requests
+    unreplaced_requests = None
+
+
+def use_pooled_connections(pool_size):
+    """
+    Send all of slickqa's requests through one requests Session, so that connections to slick are kept alive and
+    shared (up to pool_size at a time) instead of a new connection being opened for every request.  The plugin puts
+    the requests module back with restore_requests when it's done.
+    """
+    load_slick()
+    counting = isinstance(slickqa.connection.requests, CountingRequests)
+    current = slickqa.connection.requests.wrapped if counting else slickqa.connection.requests
+    if current is not requests:
+        # already pooled, or spooling
+        return
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if counting:
+        slickqa.connection.requests.wrapped = session
     else:
-        module = importlib.import_module(module)
-    if hasattr(module, function_name):
-        func = getattr(module, function_name)
-        return func()
+        replace_requests(session)
+
+def chunks(items, size):
+    items = iter(items)
+    chunk = list(itertools.islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(items, size))
+
+
+class ComponentCache(object):
+    """
+    References to the components of each project by name, loaded once from the project slick returned.  A component
+    that doesn't exist yet is created the first time it's asked for, and only once even if several threads ask.
+    """
+
+    def __init__(self):
+        self.projects = dict()
+        self.lock = threading.Lock()
+
+    def reference(self, slick, name):
+        """
+        Get a reference to the component with the given name in the slick object's project.  Like
+        SlickQA.get_component, this also makes it the component of the slick object.
+        """
+        components = self.projects.get(slick.project.id)
+        if components is None or name not in components:
+            with self.lock:
+                components = self.projects.get(slick.project.id)
+                if components is None:
+                    components = dict()
+                    for component in slick.project.components:
+                        components.setdefault(component.name, (component, component.create_reference()))
+                    self.projects[slick.project.id] = components
+                if name not in components:
+                    component = slick.create_component(name)
+                    components[name] = (component, component.create_reference())
+        slick.component, slick.componentref = components[name]
+        return slick.componentref
+
+
+class ScheduledResult(object):
+    """A result that has been built from a test, but not yet filed in slick."""
+
+    def __init__(self, test_id, slick, testcase, runstatus, attributes, requirements, skip_callbacks):
+        self.test_id = test_id
+        self.slick = slick
+        self.testcase = testcase
+        self.runstatus = runstatus
+        self.attributes = attributes
+        self.requirements = requirements
+        self.skip_callbacks = skip_callbacks
+        # results get the component the slick object last looked up, capture it now instead of when filed
+        self.componentref = None
+        if slick.component is not None:
+            self.componentref = slick.componentref
+
+    def duplicate(self):
+        """A copy to file as another result for the same test (with --slick-duplicate), sharing it's testcase."""
+        duplicate = copy.copy(self)
+        duplicate.attributes = dict(self.attributes)
+        if self.requirements is not None:
+            duplicate.requirements = list(self.requirements)
+        return duplicate
+
+
+class TestcaseCache(object):
+    """
+    Remembers, in a file that's kept between runs, the id of each testcase snot has sent to slick and a digest of
+    what was sent.  A testcase whose digest hasn't changed doesn't need to be found and sent to slick again, the
+    results can just refer to it by id.  Testcases are remembered by slick url, project and automation id.  A
+    remembered testcase isn't checked until a result is filed for it, if slick refuses the result the testcase is
+    forgotten (see forget).
+    """
+
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+        self.lock = threading.Lock()
+        self.testcases = dict()
+        # the ids lookup has handed out, which forget can drop if slick doesn't have them any more
+        self.looked_up = set()
+        self.changed = False
+        if os.path.exists(path):
+            try:
+                with open(path) as cache_file:
+                    saved = json.load(cache_file)
+                if saved.get('version') == TESTCASE_CACHE_VERSION:
+                    self.testcases = saved['testcases']
+            except (ValueError, KeyError, IOError):
+                log.warn("Ignoring the testcase cache %s, it couldn't be read.", path)
+
+    @staticmethod
+    def digest(testdata):
+        return hashlib.sha1(json.dumps(testdata.to_dict(serial=True), sort_keys=True).encode('utf-8')).hexdigest()
+
+    def key(self, project_id, automation_id):
+        return ' '.join([self.url, project_id, automation_id])
+
+    def lookup(self, project_id, automation_id, digest):
+        """The id of the testcase if it was last sent with the same digest, otherwise None."""
+        with self.lock:
+            entry = self.testcases.get(self.key(project_id, automation_id))
+            if entry is not None and entry[1] == digest:
+                self.looked_up.add(entry[0])
+                return entry[0]
+        return None
+
+    def remember(self, project_id, automation_id, digest, testcase_id):
+        with self.lock:
+            self.testcases[self.key(project_id, automation_id)] = [testcase_id, digest]
+            self.changed = True
+
+    def forget(self, project_id, automation_id, testcase_id):
+        """
+        Drop a testcase slick refused a result for, if it's id came from the cache.  Returns True if it did, and
+        the testcase should be found or created in slick again.
+        """
+        with self.lock:
+            if testcase_id not in self.looked_up:
+                return False
+            key = self.key(project_id, automation_id)
+            if key in self.testcases and self.testcases[key][0] == testcase_id:
+                del self.testcases[key]
+                self.changed = True
+            return True
+
+    def save(self):
+        """Write the cache back to it's file, if anything changed."""
+        with self.lock:
+            if not self.changed:
+                return
+            temporary = self.path + '.tmp'
+            try:
+                with open(temporary, 'w') as cache_file:
+                    json.dump({'version': TESTCASE_CACHE_VERSION, 'testcases': self.testcases}, cache_file)
+                replace_file(temporary, self.path)
+                self.changed = False
+            except (IOError, OSError):
+                log.error("Couldn't save the testcase cache %s:", self.path, exc_info=sys.exc_info())
+
+
+class ArgumentStore(object):
+    """
+    The arguments (and instances) of scheduled data driven tests, stored once each under the sha1 of their pickle so
+    results refer to them by hash instead of each carrying a copy.  location is a directory (shared with the agents)
+    to keep them in, one compressed file per hash, or 'testrun' to attach them to the testrun, packed into one
+    compressed file per chunk of results filed.  On an agent, blobs are only read or fetched once, and those fetched
+    from the testrun are kept in directory as well when one is given.
+    """
+
+    def __init__(self, location, directory=None):
+        self.location = location
+        self.directory = directory
+        if directory is None and location != ARGUMENT_STORE_TESTRUN:
+            self.directory = location
+        self.lock = threading.Lock()
+        self.blobs = dict()
+        self.attached = dict()
+        self.fetched_packs = set()
+
+    @staticmethod
+    def digest(text):
+        return hashlib.sha1(text.encode('latin-1')).hexdigest()
+
+    def put(self, value):
+        """Store a value, returning the hash to refer to it by."""
+        text = pickled(value)
+        key = self.digest(text)
+        with self.lock:
+            if key in self.blobs:
+                return key
+            self.blobs[key] = text
+        if self.directory is not None:
+            self.write(key, text)
+        return key
+
+    def get(self, key, result=None):
+        """The value stored under key, fetched from the testrun of result if it isn't here yet."""
+        with self.lock:
+            text = self.blobs.get(key)
+            if text is None and self.directory is not None:
+                text = self.read(key)
+            if text is None and result is not None and self.location == ARGUMENT_STORE_TESTRUN:
+                text = self.fetch(key, result)
+            if text is None:
+                raise Exception("Data driven arguments {} aren't in {}".format(key, self.location))
+            self.blobs[key] = text
+        return unpickled(text)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.z')
+
+    def write(self, key, text):
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, 'wb') as blob:
+            blob.write(zlib.compress(text.encode('latin-1')))
+        replace_file(temporary, path)
+
+    def read(self, key):
+        try:
+            with open(self.path(key), 'rb') as blob:
+                text = zlib.decompress(blob.read()).decode('latin-1')
+        except (IOError, OSError, zlib.error):
+            return None
+        if self.digest(text) != key:
+            log.warn("Ignoring %s, it's contents don't match it's name.", self.path(key))
+            return None
+        return text
+
+    def attach(self, testrun, keys):
+        """Attach the blobs with keys that aren't on the testrun yet to it, packed into one file."""
+        if self.location != ARGUMENT_STORE_TESTRUN:
+            return
+        attached = self.attached.setdefault(testrun.id, [])
+        missing = sorted(set(keys).difference(*attached))
+        if not missing:
+            return
+        pack = zlib.compress(json.dumps(dict((key, self.blobs[key]) for key in missing)).encode('utf-8'))
+        filename = "{}{}.pack".format(ARGUMENT_PACK_PREFIX, len(attached) + 1)
+        (uploader or FileUploader()).attach(testrun, [(filename, io.BytesIO(pack))])
+        attached.append(set(missing))
+
+    def fetch(self, key, result):
+        """Read the packs attached to the result's testrun until one has key, returning it's blob."""
+        connection = result.connection
+        testrun = connection.testruns(result.testrun.testrunId).get()
+        for storedfile in getattr(testrun, 'files', None) or []:
+            if not storedfile.filename.startswith(ARGUMENT_PACK_PREFIX) or storedfile.id in self.fetched_packs:
+                continue
+            url = "{}/files/{}/content/{}".format(connection.getUrl(), storedfile.id, quote(storedfile.filename))
+            response = slickqa.connection.requests.get(url)
+            if response.status_code != 200:
+                log.error("Slick returned %s fetching %s: %s", response.status_code, url, response.text)
+                continue
+            self.fetched_packs.add(storedfile.id)
+            for packed_key, text in json.loads(zlib.decompress(response.content).decode('utf-8')).items():
+                self.blobs.setdefault(packed_key, text)
+                if self.directory is not None:
+                    self.write(packed_key, text)
+            if key in self.blobs:
+                return self.blobs[key]
+        return None
+
+
+def upsert_testcase(slick, testdata, connection=None, cache=None):
+    """
+    Find the testcase in slick by it's automation id (or automation key, if it has no id) and update it with testdata,
+    or create it if it doesn't exist.
+
+    :param slick: the SlickQA object for the testrun
+    :param testdata: the Testcase built from the test
+    :param connection: the SlickConnection to use, if not the slick object's own
+    :param cache: a TestcaseCache, to skip sending testcases that haven't changed since they were last sent
+    :return: the Testcase as slick returned it (or testdata with the testcase's id, if it was in the cache)
+    """
+    if connection is None:
+        connection = slick.slickcon
+    automation_id = getattr(testdata, 'automationId', None)
+    digest = None
+    if cache is not None and automation_id:
+        digest = cache.digest(testdata)
+        testcase_id = cache.lookup(slick.project.id, automation_id, digest)
+        if testcase_id is not None:
+            testdata.project = slick.project.create_reference()
+            testdata.id = testcase_id
+            return testdata
+    test = None
+    if automation_id:
+        test = connection.testcases.findOne(projectid=slick.project.id, automationId=automation_id)
+    elif getattr(testdata, 'automationKey', None):
+        # like SlickQA.file_result, fall back to the automation key.  Not when there is an automation id, every data
+        # driven test has the same key.
+        test = connection.testcases.findOne(projectid=slick.project.id, automationKey=testdata.automationKey)
+    testdata.project = slick.project.create_reference()
+    if test is None:
+        testdata.created = int(round(time.time() * 1000))
+        testcase = connection.testcases(testdata).create()
     else:
-        raise Exception("could not find " + function_name + " to run.")
+        testdata.id = test.id
+        testcase = connection.testcases(testdata).update()
+    if digest is not None and testcase is not None:
+        cache.remember(slick.project.id, automation_id, digest, testcase.id)
+    return testcase
 
 
-class LogCapturingHandler(logging.Handler):
+def create_scheduled_result(scheduled, testcase, connection=None):
+    """
+    Create an empty (not yet run) result in slick for a scheduled result.
+
+    :param scheduled: the ScheduledResult to file
+    :param testcase: the Testcase in slick the result is for
+    :param connection: the SlickConnection to create it with, if not the slick object's own
+    :return: the updatable Result slick created
+    """
+    slick = scheduled.slick
+    if connection is None:
+        connection = slick.slickcon
+    result = Result()
+    result.testrun = slick.testrun.create_reference()
+    result.testcase = testcase.create_reference()
+    result.project = slick.project.create_reference()
+    result.release = slick.releaseref
+    result.build = slick.buildref
+    if scheduled.componentref is not None:
+        result.component = scheduled.componentref
+    result.reason = "not yet run"
+    result.runlength = 0
+    # like SlickQA.file_result
+    result.end = int(round(time.time() * 1000))
+    result.started = result.end - result.runlength
+    result.status = ResultStatus.NO_RESULT
+    result.runstatus = scheduled.runstatus
+    result.attributes = scheduled.attributes
+    if scheduled.requirements is not None:
+        result.requirements = scheduled.requirements
+    result = connection.results(result).create()
+    make_result_updatable(result, slick.slickcon)
+    return result
+
+
+class SerializedModel(object):
+    """Stands in for a slick model that has already been serialized, so that it can be sent from another thread."""
+
+    def __init__(self, id, json):
+        self.id = id
+        self.json = json
+
+    def __str__(self):
+        return self.id
+
+    def to_json(self):
+        return self.json
+
+
+class BackgroundReporter(object):
+    """
+    Sends result and testrun updates to slick from a background thread, so the tests don't wait on slick.  An
+    update is serialized when it's submitted, and updates to an object that is already waiting to be sent replace
+    the waiting one.  Once queue_size objects are waiting, submitting an update blocks until there is room.
+    """
+
+    def __init__(self, url, queue_size=DEFAULT_REPORTER_QUEUE_SIZE):
+        load_slick()
+        # the worker gets it's own connection, slick api parts aren't safe to share between threads
+        self.connection = SlickConnection(url)
+        self.queue = queue.Queue(queue_size)
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.thread = threading.Thread(target=self.run, name='snot-reporter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def restart(self):
+        """Start a new worker thread, in a process forked from the one the reporter was made in (threads aren't)."""
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.pending = dict()
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.thread = threading.Thread(target=self.run, name='snot-reporter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def make_result_updatable(self, result):
+        result.update = partial(self.submit, 'results', result)
+
+    def make_testrun_updatable(self, testrun):
+        testrun.update = partial(self.submit, 'testruns', testrun)
+
+    def submit(self, kind, obj):
+        if kind == 'testruns' and hasattr(obj, 'summary'):
+            del obj.summary
+        key = (kind, obj.id)
+        snapshot = obj.to_json()
+        with self.lock:
+            waiting = key in self.pending
+            self.pending[key] = snapshot
+        if not waiting:
+            self.queue.put(key)
+
+    def run(self):
+        while True:
+            key = self.queue.get()
+            try:
+                if key is None:
+                    return
+                with self.lock:
+                    snapshot = self.pending.pop(key)
+                getattr(self.connection, key[0])(SerializedModel(key[1], snapshot)).update()
+            except:
+                self.failures += 1
+                log.error("Problem sending update of %s %s to slick:", key[0], key[1], exc_info=sys.exc_info())
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Wait for every update submitted so far to be sent."""
+        self.queue.join()
+
+    def stop(self):
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        if self.failures > 0:
+            log.error("%d updates could not be sent to slick.", self.failures)
+
+
+class LogEntryBuffer(object):
+    """
+    Log entries for one result, kept as plain tuples until they are shipped to slick as LogEntry objects.  Once
+    max_entries have been accepted, further entries are dropped.  If overflow is 'summary' a warning saying how many
+    were dropped is added when the buffer is closed.
+    """
+
+    def __init__(self, result, max_entries=None, overflow='drop'):
+        load_slick()
+        self.result = result
+        self.max_entries = max_entries
+        self.overflow = overflow
+        self.entries = []
+        self.accepted = 0
+        self.dropped = 0
+        self.last_shipped = time.time()
+
+    def full(self):
+        return self.max_entries is not None and self.accepted >= self.max_entries
+
+    def add(self, entry):
+        if self.full():
+            self.dropped += 1
+        else:
+            self.entries.append(entry)
+            self.accepted += 1
+
+    def ship(self, closing=False):
+        """
+        Send the buffered entries to slick, adding them to the end of the result's log.  Only the new entries are sent,
+        not the result with the log it already has.  This is called while the tests are logging, so a problem sending
+        them is logged (to snot's own logger, which isn't captured) instead of raised.
+        """
+        if closing and self.dropped > 0 and self.overflow == 'summary':
+            self.entries.append((int(round(time.time() * 1000)), "WARN", log.name,
+                                 "{} log entries were dropped after the first {}.".format(self.dropped, self.accepted),
+                                 '', '', []))
+            self.dropped = 0
+        self.last_shipped = time.time()
+        if len(self.entries) == 0:
+            return
+        entries = []
+        for entry_time, level, logger_name, message, exception_class, exception_message, stacktrace in self.entries:
+            entry = LogEntry()
+            entry.entryTime = entry_time
+            entry.level = level
+            entry.loggerName = logger_name
+            entry.message = message
+            entry.exceptionClassName = exception_class
+            entry.exceptionMessage = exception_message
+            entry.exceptionStackTrace = stacktrace
+            entries.append(entry.to_dict(serial=True))
+        self.entries = []
+        url = "{}/results/{}/log".format(self.result.connection.getUrl(), self.result.id)
+        try:
+            response = slickqa.connection.requests.post(url, data=json.dumps(entries),
+                                                        headers={'Content-Type': 'application/json'})
+        except Exception:
+            log.error("Problem adding %d log entries to %s:", len(entries), url, exc_info=sys.exc_info())
+            return
+        if response.status_code != 200:
+            log.error("Slick returned %s adding %d log entries to %s: %s", response.status_code, len(entries), url,
+                      response.text)
+
+def graph_date(date):
+    """The date of a graph value in millis, the way slick stores it."""
+    if isinstance(date, datetime.datetime):
+        return (date - datetime.datetime.utcfromtimestamp(0)).total_seconds() * 1000
+    return date
+
+
+class PackedGraphValueMixin(object):
+    """
+    A graph value made straight from a GraphBuffer, without converting each field the way from_dict does.  The date
+    is kept in millis, which is how it's sent to slick, and the measurements are kept as given instead of in the
+    model's measurements field.  load_slick mixes it into GraphValueReference as PackedGraphValue.
+    """
+
+    def __init__(self, millis, measurements):
+        super(PackedGraphValueMixin, self).__init__()
+        self.millis = millis
+        self.packed_measurements = measurements
+
+    @property
+    def date(self):
+        return datetime.datetime.utcfromtimestamp(self.millis / 1000.0)
+
+    @property
+    def measurements(self):
+        return self.packed_measurements
+
+    @measurements.setter
+    def measurements(self, measurements):
+        self.packed_measurements = list(measurements)
+
+    def to_dict(self, serial=False):
+        if serial:
+            return {'date': self.millis, 'measurements': self.measurements}
+        return {'date': self.date, 'measurements': self.measurements}
+
+
+class GraphBuffer(object):
+    """
+    Values written to a result's graph that haven't been sent to slick yet.  The dates and measurements are kept in
+    flat arrays instead of a GraphValueReference per value, and added to the result's graph as PackedGraphValues
+    (with one update of the result) every batch_size values or batch_interval seconds, and when flushed at the end
+    of the test.
+
+    Slick has no way to append to a result's graph, so each batch still updates the whole result, graph values
+    already sent included.  Batching cuts down how many updates a test makes, not how much each one sends: a graph
+    of n values costs about n / batch_size updates, the last of them carrying all n values.
+    """
+
+    def __init__(self, result, batch_size=DEFAULT_GRAPH_BATCH_SIZE, batch_interval=DEFAULT_GRAPH_BATCH_INTERVAL):
+        load_slick()
+        self.result = result
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.lock = threading.Lock()
+        self.last_flushed = time.time()
+        self.clear()
+
+    def clear(self):
+        self.dates = array.array('d')
+        self.widths = array.array('i')
+        self.measurements = array.array('d')
+
+    def __len__(self):
+        return len(self.dates)
+
+    def add(self, date, measurements):
+        with self.lock:
+            self.dates.append(graph_date(date))
+            self.widths.append(len(measurements))
+            self.measurements.extend(measurements)
+
+    def add_values(self, dates, measurements):
+        """Add many values at once, measurements is a sequence of rows or a 2 dimensional numpy array."""
+        if hasattr(dates, 'tolist'):
+            dates = dates.tolist()
+        dates = [graph_date(date) for date in dates]
+        if hasattr(measurements, 'shape') and len(measurements.shape) == 2:
+            widths = [measurements.shape[1]] * measurements.shape[0]
+            flat = measurements.ravel().tolist()
+        else:
+            measurements = [list(row) for row in measurements]
+            widths = [len(row) for row in measurements]
+            flat = list(itertools.chain.from_iterable(measurements))
+        if len(dates) != len(widths):
+            raise ValueError("There are {} dates for {} rows of measurements.".format(len(dates), len(widths)))
+        with self.lock:
+            self.dates.extend(dates)
+            self.widths.extend(widths)
+            self.measurements.extend(flat)
+
+    def flush_if_due(self):
+        if len(self) >= self.batch_size or time.time() - self.last_flushed >= self.batch_interval:
+            self.flush()
+
+    def flush(self):
+        """Add the buffered values to the result's graph and update the whole result (every value so far) in slick."""
+        with self.lock:
+            dates, widths, measurements = self.dates, self.widths, self.measurements
+            self.clear()
+            self.last_flushed = time.time()
+        if len(dates) == 0:
+            return
+        values = []
+        start = 0
+        for date, width in zip(dates, widths):
+            values.append(PackedGraphValue(int(date), list(map(int, measurements[start:start + width]))))
+            start += width
+        self.result.graph.values.extend(values)
+        self.result.update()
+
+
+def exact_chunks(pieces, size):
+    """Join or split byte strings into chunks of exactly size bytes (except the last one)."""
+    pending = bytearray()
+    for piece in pieces:
+        pending.extend(piece)
+        while len(pending) >= size:
+            yield bytes(pending[:size])
+            del pending[:size]
+    if pending:
+        yield bytes(pending)
+
+
+def read_pieces(fileobj, size):
+    """Read a binary or text file object size bytes (or characters) at a time, as utf-8 bytes."""
+    piece = fileobj.read(size)
+    while piece:
+        if not isinstance(piece, bytes):
+            piece = piece.encode('utf-8')
+        yield piece
+        piece = fileobj.read(size)
+
+
+def gzipped(pieces):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for piece in pieces:
+        compressed = compressor.compress(piece)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class Timings(object):
+    """
+    How long each of the plugin's hooks took every time it was called, and how many requests were sent to slick
+    (with how many bytes), for a summary at the end of the run.
+    """
+
+    clock = staticmethod(getattr(time, 'perf_counter', time.time))
+
+    def __init__(self):
+        self.samples = OrderedDict()
+        self.requests = OrderedDict()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def record(self, hook, seconds):
+        # hooks are timed from the reporter, uploader and schedule worker threads too
+        with self.lock:
+            samples = self.samples.get(hook)
+            if samples is None:
+                samples = self.samples[hook] = array.array('d')
+            samples.append(seconds)
+
+    def count_request(self, method, data):
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+            if data:
+                self.bytes_sent += len(data)
+
+    def snapshot(self):
+        """What's been recorded so far, for merge to add to the Timings of another process."""
+        with self.lock:
+            return ([(hook, list(samples)) for hook, samples in self.samples.items()], list(self.requests.items()),
+                    self.bytes_sent)
+
+    def merge(self, snapshot):
+        """Add what another process's Timings recorded (from it's snapshot) to these."""
+        samples_by_hook, requests_by_method, bytes_sent = snapshot
+        with self.lock:
+            for hook, samples in samples_by_hook:
+                self.samples.setdefault(hook, array.array('d')).extend(samples)
+            for method, count in requests_by_method:
+                self.requests[method] = self.requests.get(method, 0) + count
+            self.bytes_sent += bytes_sent
+
+    def summary(self):
+        lines = ["{:<24} {:>8} {:>12} {:>10} {:>10}".format("snot hook", "calls", "total ms", "p50 ms", "p99 ms")]
+        with self.lock:
+            samples_by_hook = [(hook, sorted(samples)) for hook, samples in self.samples.items()]
+            requests_by_method = list(self.requests.items())
+            bytes_sent = self.bytes_sent
+        for hook, ordered in samples_by_hook:
+            lines.append("{:<24} {:>8} {:>12.1f} {:>10.2f} {:>10.2f}".format(
+                hook, len(ordered), sum(ordered) * 1000, percentile(ordered, 50) * 1000,
+                percentile(ordered, 99) * 1000))
+        counts = ", ".join("{} {}".format(method, count) for method, count in requests_by_method)
+        lines.append("slick requests: {} ({}), {} bytes sent".format(sum(count for method, count in requests_by_method),
+                                                                     counts or "none", bytes_sent))
+        return "\n".join(lines) + "\n"
+
+
+def percentile(ordered, percent):
+    """The nearest rank percentile of a sorted list of samples."""
+    if not ordered:
+        return 0.0
+    return ordered[max(0, int(round(percent / 100.0 * len(ordered))) - 1)]
+
+
+class CountingRequests(object):
+    """Takes the place of the requests module in slickqa.connection to count the requests sent to slick."""
+
+    def __init__(self, wrapped, timings):
+        self.wrapped = wrapped
+        self.timings = timings
+
+    def get(self, url, **kwargs):
+        self.timings.count_request('GET', None)
+        return self.wrapped.get(url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        self.timings.count_request('POST', data)
+        return self.wrapped.post(url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        self.timings.count_request('PUT', data)
+        return self.wrapped.put(url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        self.timings.count_request('DELETE', None)
+        return self.wrapped.delete(url, **kwargs)
+
+
+class ForwardingRequests(object):
+    """
+    Takes the place of the requests module in slickqa.connection in a --snot-processes worker.  Each request is
+    passed to the parent process, which sends it to slick, so only the parent talks to slick.  Updates, log entries
+    and file chunks (see filed_later) are filed by the parent in the background, the worker is answered right away
+    with what it sent.  For anything else the worker waits for the parent to pass back slick's response.
+    """
+
+    def __init__(self, worker, events, replies):
+        self.worker = worker
+        self.events = events
+        self.replies = replies
+        # the reporter and uploader threads of a worker share it's one reply pipe
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        return self.request('get', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('post', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('put', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('delete', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Pass a request to the parent process, keyword arguments (params, headers, timeout...) included."""
+        if filed_later(method, url):
+            self.events.put(('file', self.worker, (method, url, kwargs)))
+            return snotspool.SpoolResponse(200, filed_response(url, kwargs.get('data')))
+        status, content = self.ask('request', (method, url, kwargs))
+        if status is None:
+            raise requests.ConnectionError(content)
+        return snotspool.SpoolResponse(status, content)
+
+    def ask(self, event, args):
+        """Send the parent process an event, and wait for it's reply."""
+        with self.lock:
+            self.events.put((event, self.worker, args))
+            return self.replies.recv()
+
+
+def filed_later(method, url):
+    """
+    Whether a worker's request is filed by the parent in the background instead of waited for: result and testrun
+    updates, log entries and file chunks, whose responses snot doesn't use.
+    """
+    return method == 'put' or (method == 'post' and url_action(url) in ('log', 'addchunk'))
+
+
+def url_action(url):
+    """The last part of a url's path, like log in .../results/ID/log."""
+    return url.split('?')[0].rstrip('/').rsplit('/', 1)[-1]
+
+
+def filed_response(url, data):
+    """What a worker is answered with for a request filed later, like slick's answer: what was sent or how many."""
+    action = url_action(url)
+    if not data or action == 'addchunk':
+        return {}
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    sent = json.loads(data)
+    if action == 'log':
+        return len(sent)
+    return sent
 
-    ignore = ['nose', 'slick', 'requests']
+
+class ForwardedRequestFiler(object):
+    """
+    Sends the requests --snot-processes workers don't wait for to slick from a background thread, in the order they
+    were passed on, so the parent can keep handing out tests and answering the requests workers do wait for.
+    """
 
     def __init__(self):
-        super(LogCapturingHandler, self).__init__()
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='snot-worker-filer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def file(self, method, url, kwargs):
+        self.queue.put((method, url, kwargs))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                method, url, kwargs = item
+                status, content = forward_request(method, url, kwargs)
+                if status != 200:
+                    log.error("Problem sending %s %s for a snot worker: %s", method.upper(), url,
+                              content if status is None else status)
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        """Wait for everything passed on so far to be sent."""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def forward_request(method, url, kwargs):
+    """Send a request passed on by a worker's ForwardingRequests to slick, returning the (status, content) to reply."""
+    try:
+        response = getattr(slickqa.connection.requests, method)(url, **kwargs)
+        return response.status_code, response.content
+    except requests.RequestException as err:
+        return None, str(err)
+
+
+class WorkerError(Exception):
+    """The error or failure of a test run in a --snot-processes worker, with the traceback formatted there."""
+
+    def __str__(self):
+        return "raised in snot worker {}:\n{}".format(*self.args)
+
+
+class WorkerTest(object):
+    """Stands in for a test run in a --snot-processes worker when it's outcome is added to nose's result."""
+
+    failureException = AssertionError
+
+    def __init__(self, test_id, description, short_description):
+        self.test_id = test_id
+        self.description = description
+        self.short_description = short_description
+
+    def id(self):
+        return self.test_id
+
+    def shortDescription(self):
+        return self.short_description
+
+    def __str__(self):
+        return self.description
+
+
+class WorkerResult(unittest.TestResult):
+    """The result tests are run with in a --snot-processes worker, it passes each event on to the parent process."""
+
+    def __init__(self, worker, events):
+        super(WorkerResult, self).__init__()
+        # nose's error class plugins add to this, instead of patching the result
+        self.errorClasses = dict()
+        self.worker = worker
+        self.events = events
+
+    def send(self, event, test, err=None):
+        if err is not None:
+            exception_class = err[0]
+            err = ((exception_class.__module__, exception_class.__name__), self._exc_info_to_string(err, test),
+                   str(err[1]))
+        short_description = test.shortDescription() if hasattr(test, 'shortDescription') else None
+        test_id = test.id() if hasattr(test, 'id') else str(test)
+        self.events.put((event, self.worker, (test_id, str(test), short_description, err)))
+
+    def startTest(self, test):
+        super(WorkerResult, self).startTest(test)
+        self.send('startTest', test)
+
+    def stopTest(self, test):
+        super(WorkerResult, self).stopTest(test)
+        self.send('stopTest', test)
+
+    def addSuccess(self, test):
+        self.send('addSuccess', test)
+
+    def addError(self, test, err):
+        self.send('addError', test, err)
+
+    def addFailure(self, test, err):
+        self.send('addFailure', test, err)
+
+    def addSkip(self, test, reason):
+        self.send('addSkip', test, (SkipTest, SkipTest(reason), None))
+
+
+def add_worker_event(result, event, worker, args):
+    """Add an event a worker sent about one of it's tests to nose's result."""
+    test_id, description, short_description, err = args
+    test = WorkerTest(test_id, description, short_description)
+    if err is None:
+        getattr(result, event)(test)
+        return
+    (module_name, class_name), formatted, message = err
+    exception_class = getattr(sys.modules.get(module_name), class_name, None)
+    if not (inspect.isclass(exception_class) and issubclass(exception_class, BaseException)):
+        exception_class = WorkerError
+    if issubclass(exception_class, SkipTest):
+        # a skip is an error to nose, until it's skip plugin sees the SkipTest
+        error = exception_class(message)
+    else:
+        error = WorkerError(worker, formatted)
+    getattr(result, 'addFailure' if event == 'addFailure' else 'addError')(test, (exception_class, error, None))
+
+
+def has_fixtures(suite):
+    """True if a nose suite is for a module or class with setup or teardown functions."""
+    context = getattr(suite, 'context', None)
+    if context is None:
+        return False
+    if inspect.ismodule(context):
+        names = suite.moduleSetup + suite.moduleTeardown
+    else:
+        names = suite.classSetup + suite.classTeardown
+    return any(hasattr(context, name) for name in names)
+
+
+def process_units(testsuite):
+    """
+    Split a suite into the pieces --snot-processes workers run.  A module or class with setup or teardown functions
+    is kept in one piece so they're only run once, other suites are split into their tests.
+    """
+    units = []
+    for test in testsuite:
+        if isinstance(test, unittest.TestSuite) and not has_fixtures(test):
+            units.extend(process_units(test))
+        else:
+            units.append(test)
+    return units
+
+
+def fork_context():
+    """
+    The multiprocessing context that starts processes by forking, or None if they can't be forked here.
+    --snot-processes workers are forked so they have the tests (and snot's state) without them being pickled.
+    """
+    import multiprocessing
+    if not hasattr(multiprocessing, 'get_context'):
+        # python 2 forks everywhere but windows
+        return None if sys.platform == 'win32' else multiprocessing
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def worker_error(message):
+    """The err of a WorkerResult event, for a test that was lost with it's worker."""
+    return (WorkerError.__module__, WorkerError.__name__), message, message
+
+
+class Throttle(object):
+    """Spaces out sends from any number of threads, so that together they send no more than rate bytes a second."""
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.lock = threading.Lock()
+        self.next_send = time.time()
+
+    def wait(self, size):
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_send)
+            self.next_send = start + size / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class FileUploader(object):
+    """
+    Uploads files to slick a chunk at a time, so only a chunk or two of a file is ever in memory, whether it's read
+    from disk or from a (binary or text) file object.  Text files can be gzipped on the way (they're uploaded as
+    filename.gz), and with more than 1 worker the files added together are uploaded at the same time.  Each upload
+    goes straight through slickqa's requests, so it's safe from any thread and is spooled with --snot-spool.
+
+    When deferred, attach only copies the files (so they can change or go away right after) and the copies are
+    uploaded by background workers.  wait() blocks until they're all uploaded.  bandwidth limits all the uploads
+    together to that many bytes a second.
+    """
+
+    def __init__(self, workers=1, gzip_text=False, deferred=False, bandwidth=None):
+        load_slick()
+        self.workers = workers
+        self.gzip_text = gzip_text
+        self.deferred = deferred
+        self.throttle = None
+        if bandwidth:
+            self.throttle = Throttle(bandwidth)
+        self.pool = None
+        self.queue = queue.Queue()
+        self.threads = []
+        self.snapshots = None
+        self.snapshot_count = itertools.count()
+        self.lock = threading.Lock()
+        self.attached = OrderedDict()
+        self.failures = []
+
+    def attach(self, target, files):
+        """Upload files and add them to a result or testrun (anything made updatable by slickqa), with one update."""
+        files = [(path, None) if isinstance(path, basestring) else path for path in files]
+        if self.deferred:
+            for path, fileobj in files:
+                self.defer(target, path, fileobj)
+            return
+
+        def upload(path_and_fileobj):
+            return self.upload(target.connection, *path_and_fileobj)
+
+        if self.workers > 1 and len(files) > 1:
+            if self.pool is None:
+                from multiprocessing.pool import ThreadPool
+                self.pool = ThreadPool(self.workers)
+            storedfiles = self.pool.map(upload, files)
+        else:
+            storedfiles = [upload(path_and_fileobj) for path_and_fileobj in files]
+        storedfiles = [storedfile for storedfile in storedfiles if storedfile is not None]
+        if len(storedfiles) == 0:
+            return
+        if not hasattr(target, 'files') or target.files is None:
+            target.files = []
+        target.files.extend(storedfiles)
+        target.update()
+
+    def upload(self, connection, path, fileobj=None):
+        """Upload one file to slick, returning the StoredFile, or None if there's no file at path to upload."""
+        if fileobj is None and not os.path.exists(path):
+            return None
+        storedfile = StoredFile()
+        storedfile.filename = os.path.basename(path)
+        storedfile.mimetype = mimetypes.guess_type(path)[0]
+        compress = self.gzip_text and storedfile.mimetype is not None and storedfile.mimetype.startswith('text/')
+        if compress:
+            storedfile.filename += '.gz'
+            storedfile.mimetype = 'application/gzip'
+        elif fileobj is None:
+            storedfile.length = os.stat(path).st_size
+        url = connection.getUrl() + "/files"
+        storedfile = StoredFile.from_dict(self.send('post', url, storedfile.to_json()))
+        opened = None
+        if fileobj is None:
+            fileobj = opened = open(path, 'rb')
+        elif hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        try:
+            chunk_size = getattr(storedfile, 'chunkSize', None) or DEFAULT_UPLOAD_CHUNK_SIZE
+            pieces = read_pieces(fileobj, chunk_size)
+            if compress:
+                pieces = gzipped(pieces)
+            md5 = hashlib.md5()
+            length = 0
+            for chunk in exact_chunks(pieces, chunk_size):
+                md5.update(chunk)
+                length += len(chunk)
+                if self.throttle is not None:
+                    self.throttle.wait(len(chunk))
+                self.send('post', url + "/" + storedfile.id + "/addchunk", chunk, 'application/octet-stream')
+        finally:
+            if opened is not None:
+                opened.close()
+        storedfile.md5 = md5.hexdigest()
+        storedfile.length = length
+        return StoredFile.from_dict(self.send('put', url + "/" + storedfile.id, storedfile.to_json()))
+
+    def send(self, method, url, data, content_type='application/json'):
+        response = getattr(slickqa.connection.requests, method)(url, data=data, headers={'Content-Type': content_type})
+        if response.status_code != 200:
+            log.error("Slick returned %s uploading a file to %s: %s", response.status_code, url, response.text)
+            raise SlickCommunicationError("Slick returned {} uploading a file to {}".format(response.status_code, url))
+        return response.json()
+
+    def defer(self, target, path, fileobj=None):
+        """Copy a file now, and queue the copy to be uploaded and added to target by a background worker."""
+        if fileobj is None and not os.path.exists(path):
+            return
+        with self.lock:
+            if self.snapshots is None:
+                self.snapshots = tempfile.mkdtemp(prefix='snot-uploads-')
+            snapshot = os.path.join(self.snapshots, "{}-{}".format(next(self.snapshot_count), os.path.basename(path)))
+            if len(self.threads) < max(1, self.workers):
+                thread = threading.Thread(target=self.run, name='snot-uploader')
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+        if fileobj is None:
+            shutil.copyfile(path, snapshot)
+        else:
+            if hasattr(fileobj, 'seek'):
+                fileobj.seek(0)
+            with open(snapshot, 'wb') as snapshot_file:
+                for piece in read_pieces(fileobj, DEFAULT_UPLOAD_CHUNK_SIZE):
+                    snapshot_file.write(piece)
+        self.queue.put((target, path, snapshot))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                target, path, snapshot = item
+                try:
+                    with open(snapshot, 'rb') as fileobj:
+                        storedfile = self.upload(target.connection, path, fileobj)
+                    with self.lock:
+                        if not hasattr(target, 'files') or target.files is None:
+                            target.files = []
+                        target.files.append(storedfile)
+                        self.attached[id(target)] = target
+                        files = [attached.to_dict(serial=True) for attached in target.files]
+                    # the test may still be using target's own connection, so update it without that, and only it's
+                    # files: slick only changes the fields it's sent, and the test may have changed the others since
+                    kind = 'testruns' if isinstance(target, Testrun) else 'results'
+                    self.send('put', "{}/{}/{}".format(target.connection.getUrl(), kind, target.id),
+                              json.dumps({'files': files}))
+                except:
+                    log.error("Problem uploading %s to slick:", path, exc_info=sys.exc_info())
+                    with self.lock:
+                        self.failures.append((path, str(sys.exc_info()[1])))
+                finally:
+                    os.remove(snapshot)
+            finally:
+                self.queue.task_done()
+
+    def wait(self):
+        """
+        Wait for every deferred upload to finish, then update everything files were added to once more (the tests
+        might have updated them without the files in the meantime).  Returns the (path, error) of every file that
+        couldn't be uploaded since the last wait.
+        """
+        self.queue.join()
+        with self.lock:
+            attached = list(self.attached.values())
+            self.attached.clear()
+            failures = self.failures
+            self.failures = []
+        for target in attached:
+            target.update()
+        if failures:
+            log.error("%d files could not be uploaded to slick: %s", len(failures),
+                      ", ".join(path for path, error in failures))
+        return failures
+
+    def close(self):
+        if self.threads:
+            self.wait()
+            for thread in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+        if self.snapshots is not None:
+            shutil.rmtree(self.snapshots, ignore_errors=True)
+            self.snapshots = None
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+
+class LogCapturingHandler(logging.Handler):
+    """
+    Adds log records to the current result's log.  By default each record is added to the result as it's logged
+    (and sent with the next update of the result).  When buffered, records are kept in a LogEntryBuffer and shipped
+    to slick every batch_size records or batch_interval seconds, and when flushed at the end of the test.  Each
+    shipment only sends it's own entries.
+    """
+
+    ignore = ['nose', 'slick', 'requests']
+    include = ['slickwd']
+
+    def __init__(self, buffered=False, batch_size=DEFAULT_LOG_BATCH_SIZE, batch_interval=DEFAULT_LOG_BATCH_INTERVAL,
+                 max_entries=None, overflow='drop', include=None, exclude=None, level=logging.NOTSET):
+        super(LogCapturingHandler, self).__init__(level)
+        self.buffered = buffered
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_entries = max_entries
+        self.overflow = overflow
+        self.buffer = None
+        self.set_loggers(include, exclude)
+
+    def set_loggers(self, include=None, exclude=None):
+        """
+        Choose which loggers' records are captured: any logger whose name doesn't start with one of the ignored
+        prefixes (the class's ignore list plus exclude), or does start with one of the included ones (the class's
+        include list plus include).  The prefixes are compiled, and the decision for each logger name is cached,
+        until this is called again or the class's ignore or include list is changed.
+        """
+        self.excluded = list(exclude or [])
+        self.included = list(include or [])
+        self.compile_loggers()
+
+    def compile_loggers(self):
+        self.compiled_ignore = list(self.ignore)
+        self.compiled_include = list(self.include)
+        self.ignore_pattern = prefix_pattern(self.compiled_ignore + self.excluded)
+        self.include_pattern = prefix_pattern(self.compiled_include + self.included)
+        self.captured_loggers = dict()
+
+    def captures(self, name):
+        if self.ignore != self.compiled_ignore or self.include != self.compiled_include:
+            self.compile_loggers()
+        captured = self.captured_loggers.get(name)
+        if captured is None:
+            captured = self.include_pattern.match(name) is not None or self.ignore_pattern.match(name) is None
+            self.captured_loggers[name] = captured
+        return captured
 
     def pylevel_to_slicklevel(self, loglevel):
         if loglevel == logging.DEBUG:
@@ -216,32 +1684,104 @@ class LogCapturingHandler(logging.Handler):
         else:
             return "DEBUG"
 
+    @timed('LogCapturingHandler.emit')
     def emit(self, record):
-        for ignore_name in LogCapturingHandler.ignore:
-            if record.name.startswith(ignore_name) and not record.name.startswith('slickwd'):
-                return
+        if current_result is None or not self.captures(record.name):
+            return
+        if self.buffered:
+            try:
+                self.buffer_record(record)
+            except Exception:
+                self.handleError(record)
+            return
         msg = self.format(record)
-        if current_result is not None:
-            if record.exc_info is None:
-                current_result.add_log_entry(msg,
-                                             level=self.pylevel_to_slicklevel(record.levelno),
-                                             loggername=record.name)
-            else:
-                excmessage = ''
-                if hasattr(record.exc_info[1], 'message'):
-                    excmessage = record.exc_info[1].message
-                current_result.add_log_entry(msg,
-                                             level=self.pylevel_to_slicklevel(record.levelno),
-                                             loggername=record.name,
-                                             exceptionclassname=record.exc_info[0].__name__,
-                                             exceptionmessage=excmessage,
-                                             stacktrace=traceback.format_tb(record.exc_info[2]))
+        if record.exc_info is None:
+            current_result.add_log_entry(msg,
+                                         level=self.pylevel_to_slicklevel(record.levelno),
+                                         loggername=record.name)
+        else:
+            excmessage = ''
+            if hasattr(record.exc_info[1], 'message'):
+                excmessage = record.exc_info[1].message
+            current_result.add_log_entry(msg,
+                                         level=self.pylevel_to_slicklevel(record.levelno),
+                                         loggername=record.name,
+                                         exceptionclassname=record.exc_info[0].__name__,
+                                         exceptionmessage=excmessage,
+                                         stacktrace=traceback.format_tb(record.exc_info[2]))
+
+    def buffer_record(self, record):
+        if self.buffer is None or self.buffer.result is not current_result:
+            if self.buffer is not None:
+                self.buffer.ship(closing=True)
+            self.buffer = LogEntryBuffer(current_result, self.max_entries, self.overflow)
+        if self.buffer.full():
+            # it would be dropped, don't bother formatting it
+            self.buffer.dropped += 1
+            return
+        msg = self.format(record)
+        exception_class, exception_message, stacktrace = '', '', ''
+        if record.exc_info is not None:
+            exception_class = record.exc_info[0].__name__
+            if hasattr(record.exc_info[1], 'message'):
+                exception_message = record.exc_info[1].message
+            stacktrace = traceback.format_tb(record.exc_info[2])
+        self.buffer.add((int(round(record.created * 1000)), self.pylevel_to_slicklevel(record.levelno), record.name,
+                         msg, exception_class, exception_message, stacktrace))
+        if len(self.buffer.entries) >= self.batch_size or time.time() - self.buffer.last_shipped >= self.batch_interval:
+            self.buffer.ship()
+
+    def flush(self):
+        """Ship everything buffered for the current result, called at the end of each test."""
+        self.acquire()
+        try:
+            if self.buffer is not None:
+                self.buffer.ship(closing=True)
+                self.buffer = None
+        finally:
+            self.release()
+
+
+class MemoryCaptureHandler(logging.Handler):
+    """
+    Captures the formatted log records of a test in memory, so they can be uploaded as the test's log without
+    going through a file.  Once the log is bigger than spill_size bytes it's moved to a temporary file (0 keeps it
+    in memory), and once it reaches max_size bytes (None for no limit) capturing stops with a truncation marker.
+    """
+
+    def __init__(self, spill_size=DEFAULT_LOG_CAPTURE_SPILL_SIZE, max_size=None):
+        super(MemoryCaptureHandler, self).__init__()
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=spill_size, mode='w+b')
+        self.max_size = max_size
+        self.size = 0
+        self.truncated = False
+
+    def emit(self, record):
+        if self.truncated:
+            return
+        try:
+            data = self.format(record) + '\n'
+            if not isinstance(data, bytes):
+                data = data.encode('utf-8')
+        except:
+            self.handleError(record)
+            return
+        if self.max_size is not None and self.size + len(data) > self.max_size:
+            data = "[ log truncated, it reached the limit of {} bytes ]\n".format(self.max_size).encode('utf-8')
+            self.truncated = True
+        self.buffer.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self.buffer.close()
+        super(MemoryCaptureHandler, self).close()
 
 
 class SlickAsSnotPlugin(nose.plugins.Plugin):
     name = "snot"
     score = 1800
     testruns = dict()
+    loader = None
 
     def options(self, parser, env=os.environ):
         super(SlickAsSnotPlugin, self).options(parser, env=env)
@@ -260,6 +1800,9 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         parser.add_option("--slick-build-from-function", action="store", default=env.get('SLICK_BUILD_FROM_FUNCTION'),
                           metavar="SLICK_BUILD_FROM_FUNCTION", dest="slick_build_from_function",
                           help="get the slick build from a function.  The parameter should be the module and function name to call [SLICK_BUILD_FROM_FUNCTION].")
+        parser.add_option("--slick-build-per-testplan", action="store_true", default=bool(env.get('SLICK_BUILD_PER_TESTPLAN')),
+                          metavar="SLICK_BUILD_PER_TESTPLAN", dest="slick_build_per_testplan",
+                          help="Call the --slick-build-from-function function again for each testplan, instead of once [SLICK_BUILD_PER_TESTPLAN]")
         parser.add_option("--slick-testplan", action="store", default=env.get('SLICK_TESTPLAN'),
                           metavar="SLICK_TESTPLAN", dest="slick_testplan",
                           help="the testplan to link the testrun to in slick [SLICK_TESTPLAN]")
@@ -301,6 +1844,12 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         parser.add_option("--snot-no-log-capture", dest="snot_no_log_capture", default=env.get('SNOT_NO_LOG_CAPTURE'),
                           metavar="SNOT_NO_LOG_CAPTURE", action="store_const", const=True,
                           help="Don't capture the logs from the logging framework")
+        parser.add_option("--snot-log-capture-spill-size", action="store", default=env.get('SNOT_LOG_CAPTURE_SPILL_SIZE'),
+                          metavar="SNOT_LOG_CAPTURE_SPILL_SIZE", dest="snot_log_capture_spill_size",
+                          help="Keep each test's captured log in memory until it's bigger than this many bytes, then move it to a temporary file, 0 to always keep it in memory (default {}) [SNOT_LOG_CAPTURE_SPILL_SIZE]".format(DEFAULT_LOG_CAPTURE_SPILL_SIZE))
+        parser.add_option("--snot-log-capture-max-size", action="store", default=env.get('SNOT_LOG_CAPTURE_MAX_SIZE'),
+                          metavar="SNOT_LOG_CAPTURE_MAX_SIZE", dest="snot_log_capture_max_size",
+                          help="Stop capturing a test's log after this many bytes [SNOT_LOG_CAPTURE_MAX_SIZE]")
         parser.add_option("--slick-organize-by-tag", action="append", default=None,
                           help='A space delimited list of tag keys to base test run names after. Will be " - " delimited.')
         parser.add_option("--slick-duplicate", action="store", default=None, dest="slick_duplicate",
@@ -308,6 +1857,81 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         parser.add_option("--slick-schedule-path-prepend", action="store", default=env.get('SLICK_SCHEDULE_PATH_PREPEND'),
                           metavar="SLICK_SCHEDULE_PATH_PREPEND", dest="slick_schedule_path_prepend",
                           help="If a test is scheduled with relative path and this is specified, prepend it to the test path.")
+        parser.add_option("--slick-chunk-size", action="store", default=env.get('SLICK_CHUNK_SIZE'),
+                          metavar="SLICK_CHUNK_SIZE", dest="slick_chunk_size",
+                          help="How many results to file in slick at a time before running the tests (default {}) [SLICK_CHUNK_SIZE]".format(DEFAULT_CHUNK_SIZE))
+        parser.add_option("--slick-schedule-workers", action="store", default=env.get('SLICK_SCHEDULE_WORKERS'),
+                          metavar="SLICK_SCHEDULE_WORKERS", dest="slick_schedule_workers",
+                          help="How many threads to file results in slick with before running the tests (default 1) [SLICK_SCHEDULE_WORKERS]")
+        parser.add_option("--snot-timings", dest="snot_timings", default=env.get('SNOT_TIMINGS'),
+                          metavar="SNOT_TIMINGS", action="store_const", const=True,
+                          help="Time the plugin's hooks and count the requests sent to slick, and print a summary at the end of the run [SNOT_TIMINGS]")
+        parser.add_option("--snot-timings-attach", dest="snot_timings_attach", default=env.get('SNOT_TIMINGS_ATTACH'),
+                          metavar="SNOT_TIMINGS_ATTACH", action="store_const", const=True,
+                          help="Also add the --snot-timings summary to the testrun as snot-timings.txt [SNOT_TIMINGS_ATTACH]")
+        parser.add_option("--snot-spool", action="store", default=env.get('SNOT_SPOOL'),
+                          metavar="SNOT_SPOOL", dest="snot_spool",
+                          help="Don't talk to slick, write everything to this journal to send to slick later with snot-replay [SNOT_SPOOL]")
+        parser.add_option("--snot-streaming-collection", dest="snot_streaming_collection", default=env.get('SNOT_STREAMING_COLLECTION'),
+                          metavar="SNOT_STREAMING_COLLECTION", action="store_const", const=True,
+                          help="Don't keep the tests from test generators in memory while scheduling, call the generators again to run them [SNOT_STREAMING_COLLECTION]")
+        parser.add_option("--snot-async-reporter", dest="snot_async_reporter", default=env.get('SNOT_ASYNC_REPORTER'),
+                          metavar="SNOT_ASYNC_REPORTER", action="store_const", const=True,
+                          help="Send result and testrun updates to slick from a background thread [SNOT_ASYNC_REPORTER]")
+        parser.add_option("--snot-reporter-queue-size", action="store", default=env.get('SNOT_REPORTER_QUEUE_SIZE'),
+                          metavar="SNOT_REPORTER_QUEUE_SIZE", dest="snot_reporter_queue_size",
+                          help="How many updates can wait to be sent by the background reporter before tests block (default {}) [SNOT_REPORTER_QUEUE_SIZE]".format(DEFAULT_REPORTER_QUEUE_SIZE))
+        parser.add_option("--snot-log-entries", dest="snot_log_entries", default=env.get('SNOT_LOG_ENTRIES'),
+                          metavar="SNOT_LOG_ENTRIES", action="store_const", const=True,
+                          help="Add logging records to the log of the result in slick, sent in batches [SNOT_LOG_ENTRIES]")
+        parser.add_option("--snot-log-batch-size", action="store", default=env.get('SNOT_LOG_BATCH_SIZE'),
+                          metavar="SNOT_LOG_BATCH_SIZE", dest="snot_log_batch_size",
+                          help="How many log entries to send to slick at a time (default {}) [SNOT_LOG_BATCH_SIZE]".format(DEFAULT_LOG_BATCH_SIZE))
+        parser.add_option("--snot-log-batch-interval", action="store", default=env.get('SNOT_LOG_BATCH_INTERVAL'),
+                          metavar="SNOT_LOG_BATCH_INTERVAL", dest="snot_log_batch_interval",
+                          help="Send buffered log entries to slick at least this often, in seconds (default {}) [SNOT_LOG_BATCH_INTERVAL]".format(DEFAULT_LOG_BATCH_INTERVAL))
+        parser.add_option("--snot-log-max-entries", action="store", default=env.get('SNOT_LOG_MAX_ENTRIES'),
+                          metavar="SNOT_LOG_MAX_ENTRIES", dest="snot_log_max_entries",
+                          help="The most log entries to keep for one result, the rest are dropped [SNOT_LOG_MAX_ENTRIES]")
+        parser.add_option("--snot-log-overflow", action="store", type="choice", choices=['drop', 'summary'],
+                          default=env.get('SNOT_LOG_OVERFLOW', 'drop'), metavar="SNOT_LOG_OVERFLOW", dest="snot_log_overflow",
+                          help="What to do with log entries past --snot-log-max-entries: drop them silently, or drop them and add a summary entry (default drop) [SNOT_LOG_OVERFLOW]")
+        parser.add_option("--snot-log-level", action="store", default=env.get('SNOT_LOG_LEVEL'),
+                          metavar="SNOT_LOG_LEVEL", dest="snot_log_level",
+                          help="Only add log records at this level or above to the result's log, like INFO or WARNING [SNOT_LOG_LEVEL]")
+        parser.add_option("--snot-log-exclude", action="store", default=env.get('SNOT_LOG_EXCLUDE'),
+                          metavar="SNOT_LOG_EXCLUDE", dest="snot_log_exclude",
+                          help="A comma separated list of logger name prefixes not to add to the result's log, on top of nose, slick and requests [SNOT_LOG_EXCLUDE]")
+        parser.add_option("--snot-log-include", action="store", default=env.get('SNOT_LOG_INCLUDE'),
+                          metavar="SNOT_LOG_INCLUDE", dest="snot_log_include",
+                          help="A comma separated list of logger name prefixes to add to the result's log even if they are excluded, on top of slickwd [SNOT_LOG_INCLUDE]")
+        parser.add_option("--snot-testcase-cache", action="store", default=env.get('SNOT_TESTCASE_CACHE'),
+                          metavar="SNOT_TESTCASE_CACHE", dest="snot_testcase_cache",
+                          help="A file to remember the testcases sent to slick in, so that ones that haven't changed since aren't sent again [SNOT_TESTCASE_CACHE]")
+        parser.add_option("--snot-argument-store", action="store", default=env.get('SNOT_ARGUMENT_STORE'),
+                          metavar="SNOT_ARGUMENT_STORE", dest="snot_argument_store",
+                          help="Store the arguments of scheduled data driven tests once each, in this directory or attached to the testrun with 'testrun', instead of in every result.  On an agent, a directory to keep the arguments it fetches in [SNOT_ARGUMENT_STORE]")
+        parser.add_option("--snot-processes", action="store", default=env.get('SNOT_PROCESSES'),
+                          metavar="SNOT_PROCESSES", dest="snot_processes",
+                          help="Run the tests in this many worker processes, with only this process talking to slick (default 1, run them here) [SNOT_PROCESSES]")
+        parser.add_option("--snot-upload-workers", action="store", default=env.get('SNOT_UPLOAD_WORKERS'),
+                          metavar="SNOT_UPLOAD_WORKERS", dest="snot_upload_workers",
+                          help="How many files added together (like a test's captured output and log) to upload at the same time (default 1) [SNOT_UPLOAD_WORKERS]")
+        parser.add_option("--snot-deferred-uploads", dest="snot_deferred_uploads", default=env.get('SNOT_DEFERRED_UPLOADS'),
+                          metavar="SNOT_DEFERRED_UPLOADS", action="store_const", const=True,
+                          help="Copy files added to results and upload the copies in the background, instead of making the test wait [SNOT_DEFERRED_UPLOADS]")
+        parser.add_option("--snot-upload-bandwidth", action="store", default=env.get('SNOT_UPLOAD_BANDWIDTH'),
+                          metavar="SNOT_UPLOAD_BANDWIDTH", dest="snot_upload_bandwidth",
+                          help="The most bytes a second to upload files to slick with, for the whole run [SNOT_UPLOAD_BANDWIDTH]")
+        parser.add_option("--snot-gzip-text-files", dest="snot_gzip_text_files", default=env.get('SNOT_GZIP_TEXT_FILES'),
+                          metavar="SNOT_GZIP_TEXT_FILES", action="store_const", const=True,
+                          help="Gzip text files (like the test's log) while uploading them, they're added as filename.gz [SNOT_GZIP_TEXT_FILES]")
+        parser.add_option("--snot-graph-batch-size", action="store", default=env.get('SNOT_GRAPH_BATCH_SIZE'),
+                          metavar="SNOT_GRAPH_BATCH_SIZE", dest="snot_graph_batch_size",
+                          help="How many values written to a result's graph to send to slick at a time (default {}) [SNOT_GRAPH_BATCH_SIZE]".format(DEFAULT_GRAPH_BATCH_SIZE))
+        parser.add_option("--snot-graph-batch-interval", action="store", default=env.get('SNOT_GRAPH_BATCH_INTERVAL'),
+                          metavar="SNOT_GRAPH_BATCH_INTERVAL", dest="snot_graph_batch_interval",
+                          help="Send values written to a result's graph to slick at least this often, in seconds (default {}) [SNOT_GRAPH_BATCH_INTERVAL]".format(DEFAULT_GRAPH_BATCH_INTERVAL))
 
         # Make sure the log capture doesn't show slick related logging statements
         if 'NOSE_LOGFILTER' in env:
@@ -320,12 +1944,17 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         assert isinstance(conf, nose.config.Config)
         global config
         global snot_options
+        global timings
         snot_options = options
         if options.files is not None and len(options.files) > 0:
             config = parse_config(options.files)
         if not self.enabled:
             return
+        load_slick()
         self.options = options
+        timings = None
+        if options.snot_timings or options.snot_timings_attach:
+            timings = Timings()
 
         if not (hasattr(options, 'slick_testrun_id') and hasattr(options, 'slick_result_id') and options.slick_testrun_id is not None and options.slick_result_id is not None):
             for required in ['slick_url', 'slick_project_name']:
@@ -334,18 +1963,26 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
                     self.enabled = False
                     return
 
+    @timed('addSlickTestrun')
     def addSlickTestrun(self, testplan_name=None, requirements=None):
         global config, testrun
+        load_slick()
         options = self.options
         if testplan_name:
             self.testplan = testplan_name
         if self.testplan and self.testplan in self.testruns:
             self.testrun_id = self.testruns[self.testplan]
         if self.build_function:
-            try:
-                self.build = call_function(self.build_function)
-            except:
-                log.warn("Problem occured calling build information from '%s': ", self.build_function, exc_info=sys.exc_info())
+            # the build function can be slow, only call it once (or once per testplan if asked to)
+            build_key = self.testplan if self.build_per_testplan else None
+            if build_key not in self.builds:
+                # if the function fails, fall back to the build given on the command line, not another testplan's
+                self.builds[build_key] = self.options.slick_build
+                try:
+                    self.builds[build_key] = call_function(self.build_function)
+                except:
+                    log.warn("Problem occured calling build information from '%s': ", self.build_function, exc_info=sys.exc_info())
+            self.build = self.builds[build_key]
         testrun = None
         if self.testplan and self.testplan in self.testruns:
             self.slick = self.testruns[self.testplan]
@@ -360,6 +1997,8 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         elif not self.use_existing_testrun:
             self.slick = SlickQA(self.url, self.project_name, self.release, self.build, self.testplan, self.testrun_name, self.environment_name, self.testrun_group)
             testrun = self.slick.testrun
+            if self.reporter is not None:
+                self.reporter.make_testrun_updatable(testrun)
             if hasattr(testrun, 'id') and self.slick.testrun.name not in self.testruns:
                 self.testruns[self.testplan] = self.slick
             if self.mode == 'schedule':
@@ -374,16 +2013,36 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
                         testrun.requirements = list(set(testrun.requirements))
                 testrun.update()
 
+    def prepareTestLoader(self, loader):
+        self.loader = loader
+
     def get_tests(self, testsuite, data_driven=False):
-        tests = []
+        return list(self.iter_tests(testsuite, data_driven))
+
+    def iter_tests(self, testsuite, data_driven=False):
+        """
+        The tests in a suite, one at a time.  Tests from a test generator are normally kept (with their arguments)
+        until they are run, with --snot-streaming-collection the generator is called again to run them instead.
+        """
         for test in testsuite:
             if hasattr(test, '__iter__'):
                 if hasattr(test, 'test_generator') and test.test_generator is not None:
-                    test.test_generator, gen = itertools.tee(test.test_generator)
-                    tests.extend(self.get_tests(test, data_driven=True))
-                    test.test_generator = gen
+                    regenerated = None
+                    if self.options.snot_streaming_collection:
+                        regenerated = self.regenerateTests(test)
+                    if regenerated is None:
+                        test.test_generator, gen = itertools.tee(test.test_generator)
+                        for generated in self.iter_tests(test, data_driven=True):
+                            yield generated
+                        test.test_generator = gen
+                    else:
+                        for generated in self.iter_tests(test, data_driven=True):
+                            yield generated
+                        # the tests nose already pulled out of the generator are still in the suite
+                        test.test_generator = itertools.islice(regenerated, len(test._precache), None)
                 else:
-                    tests.extend(self.get_tests(test))
+                    for child in self.iter_tests(test):
+                        yield child
             else:
                 if data_driven:
                     test.data_driven = True
@@ -400,15 +2059,35 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
                         for tag in self.options.slick_organize_by_tag:
                             if hasattr(method, tag):
                                 test.tag[tag] = getattr(method, tag)
-                tests.append(test)
-        return tests
+                yield test
+
+    def regenerateTests(self, suite):
+        """
+        A new, not yet started, generator of the tests in a test generator's suite, or None if the suite doesn't
+        come from a generator function or method.
+        """
+        context = getattr(suite, 'context', None)
+        if context is None or not nose.util.isgenerator(context):
+            return None
+        loader = self.loader
+        if loader is None:
+            loader = nose.loader.TestLoader()
+        if inspect.ismethod(context):
+            regenerated = loader.loadTestsFromGeneratorMethod(context, context.__self__.__class__)
+        else:
+            regenerated = loader.loadTestsFromGenerator(context, sys.modules[context.__module__])
+        return regenerated.test_generator
 
+    @timed('prepareTest')
     def prepareTest(self, testsuite):
         global slick_test
         slick_test = None
         if not self.enabled:
             return
+        load_slick()
         self.results = dict()
+        self.results_by_suffix = dict()
+        self.components = ComponentCache()
         options = self.options
         self.testplan = options.slick_testplan
         self.mode = options.slick_mode
@@ -420,6 +2099,8 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         self.release = options.slick_release
         self.build = options.slick_build
         self.build_function = options.slick_build_from_function
+        self.build_per_testplan = options.slick_build_per_testplan
+        self.builds = dict()
         self.testrun_name = options.slick_testrun_name
         self.environment_name = options.slick_environment_name
         self.testrun_group = options.slick_testrun_group
@@ -432,200 +2113,538 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
                 self.slick_duplicate = int(options.slick_duplicate)
             except:
                 pass
-        for test in self.get_tests(testsuite):
-            for i in range(self.slick_duplicate):
-                assert isinstance(test, nose.case.Test)
-                self.use_existing_testrun = False
-                if hasattr(options, 'slick_testrun_id') and hasattr(options, 'slick_result_id') and options.slick_testrun_id is not None and options.slick_result_id is not None:
-                    self.use_existing_testrun = True
-                    self.testrun_id = options.slick_testrun_id
-                    self.result_id = options.slick_result_id
-                if self.use_existing_testrun:
+        self.chunk_size = max(1, number_option(options.slick_chunk_size, DEFAULT_CHUNK_SIZE))
+        self.schedule_workers = number_option(options.slick_schedule_workers, 1)
+        self.processes = number_option(options.snot_processes, 1)
+        if self.processes > 1 and fork_context() is None:
+            log.error("--snot-processes needs to fork the workers, which can't be done here.  Running the tests in this process.")
+            self.processes = 1
+        self.upserted_testcases = dict()
+        self.worker_connections = threading.local()
+        self.spool = None
+        if options.snot_spool:
+            self.spool = snotspool.SpoolingRequests(options.snot_spool, self.url)
+            replace_requests(self.spool)
+        if timings is not None:
+            replace_requests(CountingRequests(slickqa.connection.requests, timings))
+        self.testcase_cache = None
+        if options.snot_testcase_cache and self.spool is None:
+            # a spooled run only has placeholder ids to remember
+            self.testcase_cache = TestcaseCache(options.snot_testcase_cache, self.url)
+        self.argument_store = None
+        if options.snot_argument_store and self.mode == 'schedule':
+            location = options.snot_argument_store
+            if location != ARGUMENT_STORE_TESTRUN:
+                location = os.path.abspath(location)
+            self.argument_store = ArgumentStore(location)
+        self.reporter = None
+        if options.snot_async_reporter:
+            self.reporter = BackgroundReporter(self.url, number_option(options.snot_reporter_queue_size, DEFAULT_REPORTER_QUEUE_SIZE))
+        global uploader
+        uploader = self.newUploader()
+        self.log_capture_spill_size = number_option(options.snot_log_capture_spill_size, DEFAULT_LOG_CAPTURE_SPILL_SIZE)
+        self.log_capture_max_size = number_option(options.snot_log_capture_max_size, None)
+        self.graph_batch_size = number_option(options.snot_graph_batch_size, DEFAULT_GRAPH_BATCH_SIZE)
+        self.graph_batch_interval = number_option(options.snot_graph_batch_interval, DEFAULT_GRAPH_BATCH_INTERVAL, float)
+        self.log_entry_handler = None
+        if options.snot_log_entries and self.mode != 'schedule':
+            self.log_entry_handler = LogCapturingHandler(buffered=True,
+                                                         batch_size=number_option(options.snot_log_batch_size, DEFAULT_LOG_BATCH_SIZE),
+                                                         batch_interval=number_option(options.snot_log_batch_interval, DEFAULT_LOG_BATCH_INTERVAL, float),
+                                                         max_entries=number_option(options.snot_log_max_entries, None),
+                                                         overflow=options.snot_log_overflow,
+                                                         include=comma_list(options.snot_log_include),
+                                                         exclude=comma_list(options.snot_log_exclude),
+                                                         level=log_level(options.snot_log_level))
+            rootLogger = logging.getLogger()
+            rootLogger.setLevel(logging.DEBUG)
+            rootLogger.addHandler(self.log_entry_handler)
+        self.fileSlickResults(self.scheduleSlickResults(testsuite))
+
+        if self.enabled and self.mode == 'schedule':
+            # nose doesn't call finalize after this, so the timings are reported here
+            if self.options.snot_timings_attach and timings is not None:
+                add_file_to_testrun("snot-timings.txt", io.StringIO(str(timings.summary())))
+            if uploader is not None:
+                uploader.close()
+            if self.reporter is not None:
+                self.reporter.stop()
+            if self.spool is not None:
+                self.spool.close()
+            restore_requests()
+            if timings is not None:
+                sys.stderr.write(timings.summary())
+            sys.exit(0)
+        if self.processes > 1:
+            return partial(self.runInProcesses, testsuite)
+
+    def newUploader(self):
+        options = self.options
+        return FileUploader(number_option(options.snot_upload_workers, 1), bool(options.snot_gzip_text_files),
+                            bool(options.snot_deferred_uploads), number_option(options.snot_upload_bandwidth, None))
+
+    def runInProcesses(self, testsuite, result):
+        """
+        Run the tests in worker processes instead of here.  Each worker runs it's tests with snot as usual, except
+        that it passes the requests it would send to slick back to this process, which sends them over one
+        connection (and files the ones workers don't wait for from a background thread over another).  The outcome
+        of each test is passed back too, and added to nose's result here, and with --snot-timings each worker's
+        timings are added to this process's at the end.  The units of tests are handed out from here, so if a worker
+        dies the test it was running and the unit it took fail with an error, as does any unit no worker was left to
+        run.
+        """
+        multiprocessing = fork_context()
+        units = process_units(testsuite)
+        # nose's plugins prepare the result the first time a test is run with it, and that's in the workers
+        prepared = self.conf.plugins.prepareTestResult(result)
+        if prepared is not None:
+            result = prepared
+        # one connection answers the workers, the other files what they don't wait for
+        use_pooled_connections(2)
+        events = multiprocessing.Queue()
+        workers = []
+        replies = []
+        for worker in range(min(self.processes, max(1, len(units)))):
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=self.runWorker, args=(worker, units, events, receiver),
+                                              name='snot-worker-{}'.format(worker))
+            process.daemon = True
+            process.start()
+            workers.append(process)
+            replies.append(sender)
+        # started after the workers are forked, they don't need it
+        filer = ForwardedRequestFiler()
+        running = set(range(len(workers)))
+        # the events of a test are added to nose's result together when it stops, so tests don't interleave
+        started = dict()
+        # the units no worker has taken yet, and the unit each worker is running
+        pending = iter(range(len(units)))
+        taken = dict()
+
+        def handle(event, worker, args):
+            if event == 'file':
+                filer.file(*args)
+            elif event == 'request':
+                if args[0] == 'get':
+                    # what a worker reads back from slick has the updates it sent before
+                    filer.wait()
+                replies[worker].send(forward_request(*args))
+            elif event == 'unit':
+                # the worker finished it's last unit, and wants another
+                taken[worker] = next(pending, None)
+                replies[worker].send(taken[worker])
+            elif event == 'timings':
+                if timings is not None:
+                    timings.merge(args)
+            elif event == 'done':
+                if args is not None:
+                    self.addLostTests(result, worker, args, units, started, taken)
+                running.discard(worker)
+            elif event == 'startTest':
+                started[(worker, args[0])] = [(event, worker, args)]
+            elif (worker, args[0]) in started:
+                started[(worker, args[0])].append((event, worker, args))
+                if event == 'stopTest':
+                    for event, worker, args in started.pop((worker, args[0])):
+                        add_worker_event(result, event, worker, args)
+            else:
+                # like an error in a module's setup, which isn't in a test
+                add_worker_event(result, event, worker, args)
+
+        while running:
+            try:
+                handle(*events.get(timeout=0.1))
+            except queue.Empty:
+                pass
+            exited = [worker for worker in running if not workers[worker].is_alive()]
+            if exited:
+                # handle everything an exited worker managed to send before deciding what it didn't finish
+                while True:
+                    try:
+                        handle(*events.get_nowait())
+                    except queue.Empty:
+                        break
+                for worker in exited:
+                    if worker in running:
+                        message = "snot worker {} exited with {} before it finished.".format(worker,
+                                                                                             workers[worker].exitcode)
+                        log.error(message)
+                        self.addLostTests(result, worker, message, units, started, taken)
+                        running.discard(worker)
+        filer.close()
+        for process in workers:
+            process.join()
+        for index in pending:
+            error = RuntimeError("No snot worker was left to run it.")
+            result.addError(WorkerTest(units[index].id(), str(units[index]), None), (RuntimeError, error, None))
+        return result
+
+    def addLostTests(self, result, worker, message, units, started, taken):
+        """Fail what a worker that died (or crashed) didn't finish: each test it started, and the unit it took."""
+        for key in [key for key in started if key[0] == worker]:
+            events = started.pop(key)
+            test_id, description, short_description, err = events[0][2]
+            for event, event_worker, args in events:
+                add_worker_event(result, event, event_worker, args)
+            lost = (test_id, description, short_description, worker_error(message))
+            add_worker_event(result, 'addError', worker, lost)
+            add_worker_event(result, 'stopTest', worker, (test_id, description, short_description, None))
+        index = taken.pop(worker, None)
+        if index is not None:
+            unit = units[index]
+            add_worker_event(result, 'addError', worker, (unit.id(), str(unit), None, worker_error(message)))
+
+    def runWorker(self, worker, units, events, replies):
+        """Run tests handed out by runInProcesses, in a worker process forked from the one it was called in."""
+        global uploader, timings
+        crash = None
+        if timings is not None:
+            # the parent's timings so far were forked with it, only what this worker records is sent back
+            timings = Timings()
+        try:
+            forwarding = ForwardingRequests(worker, events, replies)
+            slickqa.connection.requests = forwarding
+            uploader = self.newUploader()
+            if self.reporter is not None:
+                self.reporter.restart()
+            result = WorkerResult(worker, events)
+            for index in iter(partial(forwarding.ask, 'unit', None), None):
+                units[index](result)
+            uploader.close()
+            if self.reporter is not None:
+                self.reporter.stop()
+        except:
+            log.error("Problem running tests in snot worker %d:", worker, exc_info=sys.exc_info())
+            crash = "snot worker {} crashed:\n{}".format(worker, traceback.format_exc())
+        finally:
+            if timings is not None:
+                events.put(('timings', worker, timings.snapshot()))
+            events.put(('done', worker, crash))
+
+    def scheduleSlickResults(self, testsuite):
+        """
+        Build the results to file for each test in the suite, one at a time, so that they can be filed while the
+        rest of the tests are collected.
+        """
+        options = self.options
+        existing_result = None
+        self.use_existing_testrun = False
+        if hasattr(options, 'slick_testrun_id') and hasattr(options, 'slick_result_id') and options.slick_testrun_id is not None and options.slick_result_id is not None:
+            self.use_existing_testrun = True
+            self.testrun_id = options.slick_testrun_id
+            self.result_id = options.slick_result_id
+        for test in self.iter_tests(testsuite):
+            assert isinstance(test, nose.case.Test)
+            if self.use_existing_testrun:
+                # every test reports to the same existing result, so fetch it once.  The testrun is only needed
+                # to finish it, which finalize does with a fresh copy.
+                if existing_result is None:
+                    use_pooled_connections(1)
                     self.slick = SlickConnection(self.url)
-                    testrun = self.slick.testruns(options.slick_testrun_id).get()
-                    make_testrun_updatable(testrun, self.slick)
-                    result = self.slick.results(self.result_id).get()
-                    make_result_updatable(result, self.slick)
-                    self.results[test.id()] = result
+                    existing_result = self.slick.results(self.result_id).get()
+                    make_result_updatable(existing_result, self.slick)
+                    if self.reporter is not None:
+                        self.reporter.make_result_updatable(existing_result)
+                self.indexSlickResult(test.id(), existing_result)
+            else:
+                scheduled_result = self.buildSlickResult(test)
+                if scheduled_result is not None:
+                    # duplicates only differ in the result slick gives them, so the rest is built once and copied
+                    duplicates = [scheduled_result.duplicate() for i in range(self.slick_duplicate - 1)]
+                    yield scheduled_result
+                    for duplicate in duplicates:
+                        yield duplicate
+
+    def buildSlickResult(self, test):
+        """
+        Gather everything needed to file a result for a test (testcase data, attributes, requirements, and the
+        testrun it belongs to) without filing it.  Returns None if the test should not be filed.
+        """
+        options = self.options
+        testmethod = test.test._testMethodName
+        if testmethod == 'runTest' and hasattr(test.test, "test"):
+            testmethod = 'test'
+
+        testdata = get_docstring_metadata(getattr(test.test, testmethod))
+        if not hasattr(testdata, 'automationId'):
+            testdata.automationId = test.id()
+        if not hasattr(testdata, 'automationTool'):
+            testdata.automationTool = 'python-nose'
+        if not hasattr(testdata, 'automationKey'):
+            # build key
+            address = list(test.address())
+            try:
+                if hasattr(options, 'slick_schedule_path_prepend') and options.slick_schedule_path_prepend:
+                    testfile = '/'.join([options.slick_schedule_path_prepend, os.path.relpath(address[0])])
+                elif not address[0].startswith("/"):
+                    testfile = os.path.relpath(address[0])
                 else:
-                    testmethod = test.test._testMethodName
-                    if testmethod == 'runTest' and hasattr(test.test, "test"):
-                        testmethod = 'test'
-
-                    testdata = DocStringMetaData(getattr(test.test, testmethod))
-                    if not hasattr(testdata, 'automationId'):
-                        testdata.automationId = test.id()
-                    if not hasattr(testdata, 'automationTool'):
-                        testdata.automationTool = 'python-nose'
-                    if not hasattr(testdata, 'automationKey'):
-                        # build key
-                        address = list(test.address())
-                        try:
-                            if hasattr(options, 'slick_schedule_path_prepend') and options.slick_schedule_path_prepend:
-                                testfile = '/'.join([options.slick_schedule_path_prepend, os.path.relpath(address[0])])
-                            elif not address[0].startswith("/"):
-                                testfile = os.path.relpath(address[0])
-                            else:
-                                testfile = address[0]
-                            module_name = os.path.basename(address[0])[:-3]
-                            if module_name == address[1]:
-                                address.pop(1)
-                            testdata.automationKey = "{0}:{1}".format(testfile, address[1])
-                            if len(address) > 2:
-                                try:
-                                    testdata.automationKey = ".".join([testdata.automationKey, ] + address[2:])
-                                except:
-                                    pass
-                        except:
-                            pass
-                    slicktest = Testcase()
-                    slicktest.name = testdata.name
-                    if '{' in testdata.name and '}' in testdata.name and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
-                        slicktest.name = testdata.name.format(*test.test.arg)
-                    slicktest.automationId = testdata.automationId
-                    slicktest.automationTool = testdata.automationTool
-                    result_attributes = {}
-                    requirements = None
-                    if self.mode == "schedule" and self.requirement_add is not None and len(self.requirement_add) > 0:
-                        for requirement_add in self.requirement_add:
-                            result_attributes[requirement_add] = "required"
-                            if self.new_requires:
-                                if requirements is None:
-                                    requirements = [requirement_add]
-                                else:
-                                    requirements.append(requirement_add)
-                    if self.mode == "schedule" and self.attribute_add is not None and len(self.attribute_add) > 0:
-                        for attribute_add in self.attribute_add:
-                            key_and_value = attribute_add.split(',')
-                            if len(key_and_value) == 2:
-                                result_attributes[key_and_value[0]] = key_and_value[1]
-                            else:
-                                result_attributes[attribute_add] = 'true'
+                    testfile = address[0]
+                module_name = os.path.basename(address[0])[:-3]
+                if module_name == address[1]:
+                    address.pop(1)
+                testdata.automationKey = "{0}:{1}".format(testfile, address[1])
+                if len(address) > 2:
                     try:
-                        actual_test_method = getattr(test.test, testmethod)
-                        if hasattr(actual_test_method, SLICK_ATTRIBUTES):
-                            temp_attributes = getattr(actual_test_method, SLICK_ATTRIBUTES)
-                            result_attributes.update(temp_attributes)
-                        if hasattr(actual_test_method, REQUIRES_ATTRIBUTE):
-                            requires_value = getattr(actual_test_method, REQUIRES_ATTRIBUTE)
-                            if self.new_requires:
-                                if requirements is None:
-                                    requirements = []
-                                for i in requires_value:
-                                    if not isinstance(i, basestring):
-                                        requirements.extend(i)
-                                    else:
-                                        requirements.append(i)
-                            for requirement in set(requirements):
-                                result_attributes[requirement] = "required"
-                        if hasattr(actual_test_method, SKIP_CALLBACK):
-                            self.skip_callbacks = getattr(actual_test_method, SKIP_CALLBACK)
-                        else:
-                            self.skip_callbacks = None
+                        testdata.automationKey = ".".join([testdata.automationKey, ] + address[2:])
                     except:
-                        log.error("Error occurred while trying to build attributes.", exc_info=sys.exc_info)
-                    if self.options.slick_organize_by_tag:
-                        if hasattr(test, 'tag'):
-                            self.addSlickTestrun(' - '.join(list(test.tag.values())), requirements=requirements)
+                        pass
+            except:
+                pass
+        slicktest = Testcase()
+        slicktest.name = testdata.name
+        if '{' in testdata.name and '}' in testdata.name and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
+            slicktest.name = testdata.name.format(*test.test.arg)
+        slicktest.automationId = testdata.automationId
+        slicktest.automationTool = testdata.automationTool
+        result_attributes = {}
+        requirements = None
+        if self.mode == "schedule" and self.requirement_add is not None and len(self.requirement_add) > 0:
+            for requirement_add in self.requirement_add:
+                result_attributes[requirement_add] = "required"
+                if self.new_requires:
+                    if requirements is None:
+                        requirements = [requirement_add]
+                    else:
+                        requirements.append(requirement_add)
+        if self.mode == "schedule" and self.attribute_add is not None and len(self.attribute_add) > 0:
+            for attribute_add in self.attribute_add:
+                key_and_value = attribute_add.split(',')
+                if len(key_and_value) == 2:
+                    result_attributes[key_and_value[0]] = key_and_value[1]
+                else:
+                    result_attributes[attribute_add] = 'true'
+        try:
+            actual_test_method = getattr(test.test, testmethod)
+            if hasattr(actual_test_method, SLICK_ATTRIBUTES):
+                temp_attributes = getattr(actual_test_method, SLICK_ATTRIBUTES)
+                result_attributes.update(temp_attributes)
+            if hasattr(actual_test_method, REQUIRES_ATTRIBUTE):
+                requires_value = getattr(actual_test_method, REQUIRES_ATTRIBUTE)
+                if self.new_requires:
+                    if requirements is None:
+                        requirements = []
+                    for i in requires_value:
+                        if not isinstance(i, basestring):
+                            requirements.extend(i)
                         else:
-                            continue
+                            requirements.append(i)
+                for requirement in set(requirements):
+                    result_attributes[requirement] = "required"
+            if hasattr(actual_test_method, SKIP_CALLBACK):
+                self.skip_callbacks = getattr(actual_test_method, SKIP_CALLBACK)
+            else:
+                self.skip_callbacks = None
+        except:
+            log.error("Error occurred while trying to build attributes.", exc_info=sys.exc_info)
+        if self.options.slick_organize_by_tag:
+            if hasattr(test, 'tag'):
+                self.addSlickTestrun(' - '.join(list(test.tag.values())), requirements=requirements)
+            else:
+                return None
+        else:
+            self.addSlickTestrun(requirements=requirements)
+        if self.mode == 'schedule':
+            result_attributes['scheduled'] = "true"
+        try:
+            #for attribute in ['automationConfiguration', 'automationKey', 'author', 'purpose', 'requirements', 'tags']:
+            #    if attribute is not None and hasattr(testdata, attribute) and getattr(testdata, attribute) is not None:
+            #        data = getattr(testdata, attribute)
+            #        if '{' in data and '}' in data and test.test.arg is not None and len(test.test.arg) > 0:
+            #            data = data.format(*test.test.arg)
+            #        setattr(slicktest, attribute, data)
+            for attribute_name, attribute_value in list(testdata.__dict__.items()):
+                if attribute_name == 'name':
+                    pass
+                elif attribute_name == 'automationId' and attribute_value == 'nose.failure.Failure.runTest':
+                    setattr(slicktest, 'name', "{}: {} ({})".format(type(test.test).__name__, type(test.test.exc_val).__name__, test.test.exc_val.message))
+                    raise test.test.exc_val
+                elif attribute_name in list(slicktest._fields.keys()):
+                    setattr(slicktest, attribute_name, attribute_value)
+                elif attribute_name not in ('expectedResults', 'component', 'steps'):
+                    result_attributes[attribute_name] = str(attribute_value)
+            if hasattr(test, 'data_driven') and test.data_driven:
+                method_file = sys.modules[getattr(test.test, testmethod).__module__].__file__
+                # Don't remove cwd because we need that
+                # if method_file.startswith(os.getcwd()):
+                #     method_file = method_file[len(os.getcwd()) + 1:]
+                if method_file.endswith('pyc'):
+                    method_file = method_file[:-1]
+                if self.mode == "schedule":
+                    result_attributes['snotDataDrivenModuleName'] = getattr(test.test, testmethod).__module__
+                    if hasattr(options, 'slick_schedule_path_prepend') and options.slick_schedule_path_prepend:
+                        result_attributes['snotDataDrivenFile'] = '/'.join([options.slick_schedule_path_prepend, os.path.relpath(method_file)])
                     else:
-                        self.addSlickTestrun(requirements=requirements)
-                    if self.mode == 'schedule':
-                        result_attributes['scheduled'] = "true"
+                        result_attributes['snotDataDrivenFile'] = method_file
+                    result_attributes['snotDataDrivenFunctionName'] = getattr(test.test, testmethod).__name__
+                    self.addDataDrivenValue(result_attributes, 'snotDataDrivenArguments', test.test.arg)
+                if hasattr(test.test, 'arg') and len(test.test.arg) > 0 and isinstance(test.test.arg[-1], Requirements):
+                    if requirements is None:
+                        requirements = []
+                    requirements.extend(test.test.arg[-1])
+                if hasattr(getattr(test.test, testmethod), 'im_self'):
+                    self.addDataDrivenValue(result_attributes, 'snotDataDrivenInstance', getattr(getattr(test.test, testmethod), 'im_self'))
+                slicktest.automationKey = "snot:data_driven_proxy"
+            slicktest.project = self.slick.project.create_reference()
+            if hasattr(testdata, 'component'):
+                comp_name = testdata.component
+                if comp_name is not None and '{' in comp_name and '}' in comp_name and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
+                    comp_name = comp_name.format(*test.test.arg)
+                slicktest.component = self.components.reference(self.slick, comp_name)
+            if hasattr(testdata, 'steps'):
+                slicktest.steps = []
+                for step in testdata.steps:
+                    slickstep = Step()
+                    slickstep.name = step
+                    if step is not None and '{' in step and '}' in step and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
+                        slickstep.name = step.format(*test.test.arg)
+                    if hasattr(testdata, 'expectedResults') and len(testdata.expectedResults) > len(slicktest.steps):
+                        expectedResult = testdata.expectedResults[len(slicktest.steps)]
+                        slickstep.expectedResult = expectedResult
+                        if expectedResult is not None and '{' in expectedResult and '}' in expectedResult and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
+                            slickstep.expectedResult = expectedResult.format(*test.test.arg)
+                    slicktest.steps.append(slickstep)
+            if not hasattr(testdata, 'tags') and requirements:
+                slicktest.tags = list(set(requirements))
+        except:
+            log.error("Error occured when parsing for test {}:".format(test.id()), exc_info=sys.exc_info())
+        runstatus = RunStatus.TO_BE_RUN
+        if self.mode == 'schedule' and not self.sequential_testrun and not self.skip_callbacks:
+            runstatus = RunStatus.SCHEDULED
+        if requirements is not None:
+            requirements.sort()
+        return ScheduledResult(test.id(), self.slick, slicktest, runstatus, result_attributes, requirements, self.skip_callbacks)
+
+    def addDataDrivenValue(self, result_attributes, name, value):
+        """Add a data driven test's arguments or instance to a result, pickled or by hash with --snot-argument-store."""
+        if self.argument_store is None:
+            result_attributes[name] = pickled(value)
+        else:
+            result_attributes[name + 'Blob'] = self.argument_store.put(value)
+            result_attributes['snotDataDrivenArgumentStore'] = self.argument_store.location
+
+    def attachArguments(self, chunk):
+        """Attach the data driven arguments a chunk of results refer to to their testruns, before they're filed."""
+        keys_by_testrun = OrderedDict()
+        for scheduled in chunk:
+            testrun = scheduled.slick.testrun
+            keys = keys_by_testrun.setdefault(testrun.id, (testrun, []))[1]
+            for name in ['snotDataDrivenArgumentsBlob', 'snotDataDrivenInstanceBlob']:
+                if name in scheduled.attributes:
+                    keys.append(scheduled.attributes[name])
+        for testrun, keys in keys_by_testrun.values():
+            self.argument_store.attach(testrun, keys)
+
+    def fileSlickResults(self, scheduled_results):
+        """
+        File the results built by buildSlickResult with slick, chunk_size results at a time.  Identical testcases
+        within a chunk (like those from --slick-duplicate) are only found and updated in slick once.
+        """
+        pool = None
+        if self.schedule_workers > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(self.schedule_workers)
+            use_pooled_connections(self.schedule_workers)
+        elif self.slick_duplicate > 1:
+            # most of the time filing duplicates goes to sending their results, keep one connection open for them
+            use_pooled_connections(1)
+        try:
+            for chunk in chunks(scheduled_results, self.chunk_size):
+                if self.argument_store is not None:
+                    self.attachArguments(chunk)
+                for scheduled, slick_result in zip(chunk, self.fileChunk(chunk, pool)):
+                    self.scheduledResultFiled(scheduled, slick_result)
+        finally:
+            if self.testcase_cache is not None:
+                self.testcase_cache.save()
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    def fileChunk(self, chunk, pool=None):
+        """
+        File a chunk of scheduled results, returning the results from slick in the same order.  A testcase shared by
+        duplicates that was updated in slick with the last chunk isn't updated again.  Slick can't look up or create
+        more than one testcase or result a request, so a chunk only saves round trips for duplicated tests (and
+        testcases the testcase cache has), every other test still costs a testcase lookup and update and a result.
+        """
+        serialized = dict()
+        keys = []
+        for scheduled in chunk:
+            if id(scheduled.testcase) not in serialized:
+                serialized[id(scheduled.testcase)] = scheduled.testcase.to_json()
+            keys.append((id(scheduled.slick), serialized[id(scheduled.testcase)]))
+        testcases = dict()
+        for key, scheduled in zip(keys, chunk):
+            upserted = self.upserted_testcases.get(id(scheduled.testcase))
+            if upserted is not None and upserted[0] is scheduled.testcase:
+                testcases[key] = upserted[1]
+        # update the testcases in the order of their last use, so the last test to use a testcase wins.  Testcases
+        # with the same automation id are updated one after another, so they can't race each other.
+        last_use = dict((key, index) for index, key in enumerate(keys) if key not in testcases)
+        groups = OrderedDict()
+        for index in sorted(last_use.values()):
+            automation_id = chunk[index].testcase.automationId or keys[index]
+            groups.setdefault((keys[index][0], automation_id), []).append(index)
+
+        def upsert_group(indexes):
+            connection = self.workerConnection(pool)
+            return [(keys[index], upsert_testcase(chunk[index].slick, chunk[index].testcase, connection, self.testcase_cache))
+                    for index in indexes]
+
+        def create_result(key_and_scheduled):
+            key, scheduled = key_and_scheduled
+            connection = self.workerConnection(pool)
+            try:
+                return create_scheduled_result(scheduled, testcases[key], connection)
+            except SlickCommunicationError:
+                # slick 404s a result for a testcase it doesn't have, the cache may remember one that was deleted.
+                # slickqa doesn't say why the result wasn't created, if it's something else the upsert fails too.
+                cache = self.testcase_cache
+                if cache is None or not cache.forget(scheduled.slick.project.id, scheduled.testcase.automationId,
+                                                     testcases[key].id):
+                    raise
+                testcase = upsert_testcase(scheduled.slick, scheduled.testcase, connection, cache)
+                return create_scheduled_result(scheduled, testcase, connection)
+
+        map_function = map if pool is None else pool.map
+        for upserted in map_function(upsert_group, list(groups.values())):
+            testcases.update(upserted)
+        # only the last chunk's are kept, duplicates of a test are filed one after another
+        self.upserted_testcases = dict((id(scheduled.testcase), (scheduled.testcase, testcases[key]))
+                                       for key, scheduled in zip(keys, chunk))
+        return list(map_function(create_result, list(zip(keys, chunk))))
+
+    def workerConnection(self, pool):
+        """The slick connection for the current thread to file results with, None to use the slick object's."""
+        if pool is None:
+            return None
+        if not hasattr(self.worker_connections, 'connection'):
+            self.worker_connections.connection = SlickConnection(self.url)
+        return self.worker_connections.connection
+
+    def scheduledResultFiled(self, scheduled, slick_result):
+        """Finish off a result once it's filed, running any skip callbacks."""
+        if self.reporter is not None:
+            self.reporter.make_result_updatable(slick_result)
+        if self.mode == 'schedule' and scheduled.skip_callbacks:
+            for callback in scheduled.skip_callbacks:
+                response = partial(callback, slick_result=slick_result)()
+                if response:
                     try:
-                        #for attribute in ['automationConfiguration', 'automationKey', 'author', 'purpose', 'requirements', 'tags']:
-                        #    if attribute is not None and hasattr(testdata, attribute) and getattr(testdata, attribute) is not None:
-                        #        data = getattr(testdata, attribute)
-                        #        if '{' in data and '}' in data and test.test.arg is not None and len(test.test.arg) > 0:
-                        #            data = data.format(*test.test.arg)
-                        #        setattr(slicktest, attribute, data)
-                        for attribute_name, attribute_value in list(testdata.__dict__.items()):
-                            if attribute_name == 'name':
-                                pass
-                            elif attribute_name == 'automationId' and attribute_value == 'nose.failure.Failure.runTest':
-                                setattr(slicktest, 'name', "{}: {} ({})".format(type(test.test).__name__, type(test.test.exc_val).__name__, test.test.exc_val.message))
-                                raise test.test.exc_val
-                            elif attribute_name in list(slicktest._fields.keys()):
-                                setattr(slicktest, attribute_name, attribute_value)
-                            elif attribute_name not in ('expectedResults', 'component', 'steps'):
-                                result_attributes[attribute_name] = str(attribute_value)
-                        if hasattr(test, 'data_driven') and test.data_driven:
-                            method_file = sys.modules[getattr(test.test, testmethod).__module__].__file__
-                            # Don't remove cwd because we need that
-                            # if method_file.startswith(os.getcwd()):
-                            #     method_file = method_file[len(os.getcwd()) + 1:]
-                            if method_file.endswith('pyc'):
-                                method_file = method_file[:-1]
-                            if self.mode == "schedule":
-                                result_attributes['snotDataDrivenModuleName'] = getattr(test.test, testmethod).__module__
-                                if hasattr(options, 'slick_schedule_path_prepend') and options.slick_schedule_path_prepend:
-                                    result_attributes['snotDataDrivenFile'] = '/'.join([options.slick_schedule_path_prepend, os.path.relpath(method_file)])
-                                else:
-                                    result_attributes['snotDataDrivenFile'] = method_file
-                                result_attributes['snotDataDrivenFunctionName'] = getattr(test.test, testmethod).__name__
-                                result_attributes['snotDataDrivenArguments'] = pickle.dumps(test.test.arg)
-                            if hasattr(test.test, 'arg') and len(test.test.arg) > 0 and isinstance(test.test.arg[-1], Requirements):
-                                if requirements is None:
-                                    requirements = []
-                                requirements.extend(test.test.arg[-1])
-                            if hasattr(getattr(test.test, testmethod), 'im_self'):
-                                result_attributes['snotDataDrivenInstance'] = pickle.dumps(getattr(getattr(test.test, testmethod), 'im_self'))
-                            slicktest.automationKey = "snot:data_driven_proxy"
-                        slicktest.project = self.slick.project.create_reference()
-                        if hasattr(testdata, 'component'):
-                            comp_name = testdata.component
-                            if comp_name is not None and '{' in comp_name and '}' in comp_name and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
-                                comp_name = comp_name.format(*test.test.arg)
-                            component = self.slick.get_component(comp_name)
-                            if component is None:
-                                component = self.slick.create_component(comp_name)
-                            slicktest.component = component.create_reference()
-                        if hasattr(testdata, 'steps'):
-                            slicktest.steps = []
-                            for step in testdata.steps:
-                                slickstep = Step()
-                                slickstep.name = step
-                                if step is not None and '{' in step and '}' in step and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
-                                    slickstep.name = step.format(*test.test.arg)
-                                if hasattr(testdata, 'expectedResults') and len(testdata.expectedResults) > len(slicktest.steps):
-                                    expectedResult = testdata.expectedResults[len(slicktest.steps)]
-                                    slickstep.expectedResult = expectedResult
-                                    if expectedResult is not None and '{' in expectedResult and '}' in expectedResult and hasattr(test.test, 'arg') and test.test.arg is not None and len(test.test.arg) > 0:
-                                        slickstep.expectedResult = expectedResult.format(*test.test.arg)
-                                slicktest.steps.append(slickstep)
-                        if not hasattr(testdata, 'tags') and requirements:
-                            slicktest.tags = list(set(requirements))
-                    except:
-                        log.error("Error occured when parsing for test {}:".format(test.id()), exc_info=sys.exc_info())
-                    runstatus = RunStatus.TO_BE_RUN
-                    if self.mode == 'schedule' and not self.sequential_testrun and not self.skip_callbacks:
-                        runstatus = RunStatus.SCHEDULED
-                    if requirements is not None:
-                        requirements.sort()
-                    slick_result = self.slick.file_result(slicktest.name, ResultStatus.NO_RESULT, reason="not yet run", runlength=0, testdata=slicktest, runstatus=runstatus, attributes=result_attributes, requires=requirements)
-
-                    if self.mode == 'schedule' and self.skip_callbacks:
-                        for callback in self.skip_callbacks:
-                            response = partial(callback, slick_result=slick_result)()
-                            if response:
-                                try:
-                                    raise NotTested(response)
-                                except BaseException as e:
-                                    slick_result.status = ResultStatus.NOT_TESTED
-                                    slick_result.runstatus = RunStatus.FINISHED
-                                    slick_result.started = slick_result.recorded
-                                    slick_result.finished = slick_result.recorded
-                                    slick_result.reason = str(e)
-                                    slick_result.update()
-                        else:
-                            slick_result.runstatus = RunStatus.SCHEDULED
-                            slick_result.update()
-
-                    self.results[test.id()] = slick_result
+                        raise NotTested(response)
+                    except BaseException as e:
+                        slick_result.status = ResultStatus.NOT_TESTED
+                        slick_result.runstatus = RunStatus.FINISHED
+                        slick_result.started = slick_result.recorded
+                        slick_result.finished = slick_result.recorded
+                        slick_result.reason = str(e)
+                        slick_result.update()
+            else:
+                slick_result.runstatus = RunStatus.SCHEDULED
+                slick_result.update()
 
-        if self.enabled and self.mode == 'schedule':
-            sys.exit(0)
+        self.indexSlickResult(scheduled.test_id, slick_result)
 
     def beforeTest(self, test):
         if not self.enabled:
@@ -633,11 +2652,13 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         if self.mode == 'schedule':
             raise SkipTest()
 
+    @timed('startTest')
     def startTest(self, test):
         global test_failed
         test_failed = False
         if not self.enabled:
             return
+        load_slick()
         if test.id() in self.results:
             result = self.results[test.id()]
             assert isinstance(result, Result)
@@ -651,85 +2672,119 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
             if hasattr(result, 'component') and not hasattr(result.component, 'id'):
                 del result.component
             result.update()
-            global current_result
+            global current_result, graph_buffer
             current_result = result
+            graph_buffer = GraphBuffer(result, self.graph_batch_size, self.graph_batch_interval)
             if not self.options.snot_no_log_capture:
                 rootLogger = logging.getLogger()
                 if hasattr(self, 'loghandler') and self.loghandler is not None:
                     rootLogger.removeHandler(self.loghandler)
-                self.loghandler = logging.FileHandler("/tmp/{}-testcase.log".format(result.id))
+                    self.loghandler.close()
+                self.loghandler = MemoryCaptureHandler(self.log_capture_spill_size, self.log_capture_max_size)
                 rootLogger.setLevel(logging.DEBUG)
                 self.loghandler.setFormatter(logging.Formatter("[%(asctime)s | %(levelname) 8s | %(name)s ]: %(message)s"))
                 rootLogger.addHandler(self.loghandler)
 
+    @timed('afterTest')
     def afterTest(self, test):
         """Clear capture buffer.
         """
         if not self.enabled:
             return
+        captured = []
         if hasattr(sys.stdout, '__class__') and hasattr(sys.stdout.__class__, '__name__') and sys.stdout.__class__.__name__ == 'StringIO':
-            add_file("Nose Capture.txt", sys.stdout)
+            captured.append(("Nose Capture.txt", sys.stdout))
+        self.flushGraph()
+        if self.log_entry_handler is not None:
+            self.log_entry_handler.flush()
         if hasattr(self, 'loghandler') and self.loghandler is not None:
-            log_filename = self.loghandler.baseFilename
             rootLogger = logging.getLogger()
             rootLogger.removeHandler(self.loghandler)
-            self.loghandler.close()
-            self.loghandler = None
-            if os.stat(log_filename).st_size > 0:
-                with open(log_filename, "r") as log_file:
-                    add_file("testcase.log", log_file)
-            os.unlink(log_filename)
-
-    def addSlickResult(self, test, resultstatus=ResultStatus.PASS, err=None):
+            if self.loghandler.size > 0:
+                captured.append(("testcase.log", self.loghandler.buffer))
+        try:
+            add_files(captured)
+        finally:
+            if hasattr(self, 'loghandler') and self.loghandler is not None:
+                self.loghandler.close()
+                self.loghandler = None
+
+    def flushGraph(self):
+        """Send the values written to the current result's graph that are still buffered, at the end of a test."""
+        global graph_buffer
+        if graph_buffer is not None:
+            try:
+                graph_buffer.flush()
+            except:
+                log.warn("Error while trying to write to graph. Catching. Don't care.")
+            graph_buffer = None
+
+    def indexSlickResult(self, test_id, result):
+        self.results[test_id] = result
+        # when nose is asked to run a single test, the test is matched to a result by the last part of it's id
+        self.results_by_suffix.setdefault(test_id.split(".")[-1], test_id)
+
+    def findSlickResult(self, test):
+        """Find the result filed for a test by prepareTest, or None if there isn't one."""
+        result = self.results.get(test.id())
+        if result is None and len(test.config.testNames) == 1:
+            result_id = self.results_by_suffix.get(test.config.testNames[0].split(".")[-1])
+            if result_id is not None:
+                result = self.results[result_id]
+        return result
+
+    @timed('addSlickResult')
+    def addSlickResult(self, test, resultstatus=None, err=None):
         if not self.enabled:
             return
+        load_slick()
         if self.mode == 'schedule':
             sys.exit(0)
             return
-        for result_id in self.results:
-            if test.id() == result_id or (len(test.config.testNames) == 1 and result_id.split(".")[-1] == test.config.testNames[0].split(".")[-1]):
-                result = self.results[result_id]
-                assert isinstance(result, Result)
-                result.runstatus = RunStatus.FINISHED
-                if resultstatus == ResultStatus.PASS and 'retry_count' in result.attributes:
-                    resultstatus = ResultStatus.PASSED_ON_RETRY
-                result.status = resultstatus
-                result.finished = datetime.datetime.now()
-                try:
-                    result.runlength = int((result.finished - result.started).total_seconds() * 1000)
-                except:
-                    log.error("Problem trying to calculate the runlength:", exc_info=sys.exc_info())
-                if on_file_result is not None:
-                    try:
-                        on_file_result(result)
-                    except:
-                        log.error("Problem calling on_file_result:", exc_info=sys.exc_info())
-                if err is not None:
-                    # log capture and stderr/stdout capture are appended to the message.  We don't want those showing up
-                    # in the reason
-                    reason_lines = None
-                    if sys.version_info[0] == 2:
-                        reason_lines = traceback.format_exception(*err)
-                    else:
-                        if isinstance(err[1], str):
-                            err = (err[0], ErrorValue(err[1]), err[2])
-                        reason_lines = traceback.format_exception(*err, chain=not isinstance(err[1], str))
-                    message_parts = reason_lines[-1].split('\n')
-                    reason_lines[-1] = message_parts[0]
-                    capture = None
-                    if len(message_parts) > 2:
-                        capture = '\n'.join(message_parts[1:])
-                        reason_lines.reverse()
-                    result.reason = '\n'.join(reason_lines)
-
-                if hasattr(result, 'config') and not hasattr(result.config, 'configId'):
-                    del result.config
-                if hasattr(result, 'component') and not hasattr(result.component, 'id'):
-                    del result.component
-                result.update()
-                break
-        else:
+        result = self.findSlickResult(test)
+        if result is None:
             log.error("Unrecognized test %s", test.id())
+            return
+        assert isinstance(result, Result)
+        if resultstatus is None:
+            resultstatus = ResultStatus.PASS
+        result.runstatus = RunStatus.FINISHED
+        if resultstatus == ResultStatus.PASS and 'retry_count' in result.attributes:
+            resultstatus = ResultStatus.PASSED_ON_RETRY
+        result.status = resultstatus
+        result.finished = datetime.datetime.now()
+        try:
+            result.runlength = int((result.finished - result.started).total_seconds() * 1000)
+        except:
+            log.error("Problem trying to calculate the runlength:", exc_info=sys.exc_info())
+        if on_file_result is not None:
+            try:
+                on_file_result(result)
+            except:
+                log.error("Problem calling on_file_result:", exc_info=sys.exc_info())
+        if err is not None:
+            # log capture and stderr/stdout capture are appended to the message.  We don't want those showing up
+            # in the reason
+            reason_lines = None
+            if sys.version_info[0] == 2:
+                reason_lines = traceback.format_exception(*err)
+            else:
+                if isinstance(err[1], str):
+                    err = (err[0], ErrorValue(err[1]), err[2])
+                reason_lines = traceback.format_exception(*err, chain=not isinstance(err[1], str))
+            message_parts = reason_lines[-1].split('\n')
+            reason_lines[-1] = message_parts[0]
+            capture = None
+            if len(message_parts) > 2:
+                capture = '\n'.join(message_parts[1:])
+                reason_lines.reverse()
+            result.reason = '\n'.join(reason_lines)
+
+        if hasattr(result, 'config') and not hasattr(result.config, 'configId'):
+            del result.config
+        if hasattr(result, 'component') and not hasattr(result.component, 'id'):
+            del result.component
+        result.update()
 
     def addSuccess(self, test):
         if not self.enabled:
@@ -768,10 +2823,30 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
         self.addSlickResult(test, ResultStatus.FAIL, err)
 
     def finalize(self, result):
-        global testrun
         if not self.enabled or self.mode == 'schedule':
             return
-        elif self.use_existing_testrun:
+        self.finishSlickRun()
+        if timings is not None:
+            sys.stderr.write(timings.summary())
+
+    @timed('finalize')
+    def finishSlickRun(self):
+        global testrun
+        load_slick()
+        if self.options.snot_timings_attach and timings is not None:
+            if self.use_existing_testrun:
+                # the existing testrun isn't fetched until it's finished, get it now to attach the summary to
+                testrun = self.slick.testruns(self.testrun_id).get()
+                make_testrun_updatable(testrun, self.slick)
+            add_file_to_testrun("snot-timings.txt", io.StringIO(str(timings.summary())))
+        if self.log_entry_handler is not None:
+            logging.getLogger().removeHandler(self.log_entry_handler)
+            self.log_entry_handler.flush()
+        if uploader is not None:
+            uploader.close()
+        if self.reporter is not None:
+            self.reporter.stop()
+        if self.use_existing_testrun:
             testrun = self.slick.testruns(self.testrun_id).get()
             if testrun.summary.resultsByStatus.NO_RESULT == 0:
                 # finish testrun
@@ -780,91 +2855,134 @@ class SlickAsSnotPlugin(nose.plugins.Plugin):
                 self.slick.testruns(testrun).update()
         else:
             self.slick.finish_testrun()
-        return None
+        if self.spool is not None:
+            self.spool.close()
+        restore_requests()
 
 
+data_driven_result = None
 data_driven_parent = None
 data_driven_test = None
+data_driven_modules = dict()
+data_driven_fixture_names = dict()
+# the ArgumentStores data driven arguments have been read from, by location
+argument_stores = dict()
+
+
+def same_source(module, path):
+    """True if the module was loaded from the python file at path (or it's compiled form)."""
+    module_file = getattr(module, '__file__', None)
+    if module_file is None:
+        return False
+    if module_file.endswith('pyc') or module_file.endswith('pyo'):
+        module_file = module_file[:-1]
+    return os.path.realpath(module_file) == os.path.realpath(path)
+
+
+def import_data_driven_module(module_name, path):
+    """
+    The module a data driven test is in.  It's imported the normal way when it can be (so a module that's already
+    imported is reused, and it's bytecode is cached), and only loaded straight from path if the name doesn't import
+    the file at path.  Either way it's only loaded once.
+    """
+    key = (module_name, path)
+    module = data_driven_modules.get(key)
+    if module is None:
+        module = sys.modules.get(module_name)
+        if module is None or not same_source(module, path):
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError:
+                module = None
+        if module is None or not same_source(module, path):
+            import imp
+            module = imp.load_source(module_name, path)
+        data_driven_modules[key] = module
+    return module
+
+
+def data_driven_value(name):
+    """
+    A pickled attribute of the current result (it's data driven arguments or instance), read from the result itself
+    or from the ArgumentStore it was put in.  A directory given with --snot-argument-store here is read before the
+    store the result names, and keeps what is fetched from a testrun.
+    """
+    attributes = current_result.attributes
+    if name + 'Blob' not in attributes:
+        return unpickled(attributes[name])
+    location = attributes['snotDataDrivenArgumentStore']
+    store = argument_stores.get(location)
+    if store is None:
+        directory = getattr(snot_options, 'snot_argument_store', None)
+        if directory == ARGUMENT_STORE_TESTRUN:
+            directory = None
+        store = argument_stores[location] = ArgumentStore(location, directory)
+    return store.get(attributes[name + 'Blob'], current_result)
 
 
 def get_data_driven_proxy_test_objects():
-    global data_driven_parent, data_driven_test
+    """The instance (or module) and the test function the current result is a data driven proxy for."""
+    global data_driven_result, data_driven_parent, data_driven_test
     if current_result is None:
         raise Exception("Must be using snot to run data driven proxy")
-    if data_driven_parent is not None:
+    if data_driven_result is current_result:
         return data_driven_parent, data_driven_test
     module_name = current_result.attributes["snotDataDrivenFile"].replace("/", ".")
     if "snotDataDrivenModuleName" in current_result.attributes:
         module_name = current_result.attributes["snotDataDrivenModuleName"]
-    test_module = imp.load_source(module_name, current_result.attributes["snotDataDrivenFile"])
-    parent = test_module
-    if 'snotDataDrivenInstance' in current_result.attributes:
-        parent = pickle.loads(current_result.attributes['snotDataDrivenInstance'])
+    parent = import_data_driven_module(module_name, current_result.attributes["snotDataDrivenFile"])
+    if 'snotDataDrivenInstance' in current_result.attributes or 'snotDataDrivenInstanceBlob' in current_result.attributes:
+        parent = data_driven_value('snotDataDrivenInstance')
     data_driven_parent = parent
     data_driven_test = getattr(parent, current_result.attributes["snotDataDrivenFunctionName"])
+    data_driven_result = current_result
     return data_driven_parent, data_driven_test
 
 
-def data_driven_proxy_setup():
+def fixture(owner, *names):
+    """
+    The member of a module or instance with one of the names (ignoring case), or None.  The names of a module's or a
+    class's members are only looked through once.
+    """
+    key = owner if inspect.ismodule(owner) else owner.__class__
+    members = data_driven_fixture_names.get(key)
+    if members is None:
+        members = dict()
+        for member_name in dir(key):
+            members.setdefault(member_name.lower(), []).append(member_name)
+        data_driven_fixture_names[key] = members
+    found = [member_name for name in names for member_name in members.get(name, [])]
+    if not found:
+        return None
+    # when there's more than one, use the last one in name order, like looking through inspect.getmembers would
+    return getattr(owner, max(found))
+
+
+def data_driven_proxy_fixtures(stage):
+    """The module, class and test setup (or teardown) functions of the current data driven proxy, in that order."""
     parent, test = get_data_driven_proxy_test_objects()
-    setup_module = None
-    setup_class = None
-    setup_test = None
-    if 'snotDataDrivenInstance' in current_result.attributes:
-        # check for setupClass and setup
-        for member_name, item in inspect.getmembers(parent):
-            lower_case_name = member_name.lower()
-            if lower_case_name == 'setupclass' or lower_case_name == 'setup_class':
-                setup_class = item
-            if lower_case_name == 'setup':
-                setup_test = item
-        # also check the module for setup_module
-        for member_name, item in inspect.getmembers(inspect.getmodule(parent)):
-            lower_case_name = member_name.lower()
-            if lower_case_name == 'setup_module' or lower_case_name == 'setupmodule':
-                setup_module = item
+    module_fixture = None
+    class_fixture = None
+    test_fixture = None
+    if not inspect.ismodule(parent):
+        class_fixture = fixture(parent, stage + 'class', stage + '_class')
+        test_fixture = fixture(parent, stage)
+        module_fixture = fixture(inspect.getmodule(parent), stage + '_module', stage + 'module')
     if inspect.ismodule(parent):
-        # check for setup_module
-        for member_name, item in inspect.getmembers(parent):
-            lower_case_name = member_name.lower()
-            if lower_case_name == 'setup_module' or lower_case_name == 'setupmodule':
-                setup_module = item
-    if hasattr(test, 'setup'):
-        setup_test = getattr(test, 'setup')
-    setups = [setup_module, setup_class, setup_test]
-    for setup in setups:
+        module_fixture = fixture(parent, stage + '_module', stage + 'module')
+    if hasattr(test, stage):
+        test_fixture = getattr(test, stage)
+    return [module_fixture, class_fixture, test_fixture]
+
+
+def data_driven_proxy_setup():
+    for setup in data_driven_proxy_fixtures('setup'):
         if setup is not None and hasattr(setup, '__call__'):
             setup()
 
 
 def data_driven_proxy_teardown():
-    parent, test = get_data_driven_proxy_test_objects()
-    teardown_module = None
-    teardown_class = None
-    teardown_test = None
-    if 'snotDataDrivenInstance' in current_result.attributes:
-        # check for teardownClass and teardown
-        for member_name, item in inspect.getmembers(parent):
-            lower_case_name = member_name.lower()
-            if lower_case_name == 'teardownclass' or lower_case_name == 'teardown_class':
-                teardown_class = item
-            if lower_case_name == 'teardown':
-                teardown_test = item
-        # also check the module for teardown_module
-        for member_name, item in inspect.getmembers(inspect.getmodule(parent)):
-            lower_case_name = member_name.lower()
-            if lower_case_name == 'teardown_module' or lower_case_name == 'teardownmodule':
-                teardown_module = item
-    if inspect.ismodule(parent):
-        # check for teardown_module
-        for member_name, item in inspect.getmembers(parent):
-            lower_case_name = member_name.lower()
-            if lower_case_name == 'teardown_module' or lower_case_name == 'teardownmodule':
-                teardown_module = item
-    if hasattr(test, 'teardown'):
-        teardown_test = getattr(test, 'teardown')
-    teardowns = [teardown_module, teardown_class, teardown_test]
-    for teardown in teardowns:
+    for teardown in data_driven_proxy_fixtures('teardown'):
         if teardown is not None and hasattr(teardown, '__call__'):
             teardown()
 
@@ -873,4 +2991,4 @@ def data_driven_proxy_teardown():
 def data_driven_proxy():
     """Data Driven Proxy Test"""
     parent, test = get_data_driven_proxy_test_objects()
-    return test(*pickle.loads(current_result.attributes["snotDataDrivenArguments"]))
+    return test(*data_driven_value('snotDataDrivenArguments'))
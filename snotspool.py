@@ -0,0 +1,523 @@
+"""
+Spooling lets snot run without talking to slick.  With --snot-spool, every request snot would have sent to slick is
+answered by a stand-in that hands out placeholder ids (see SpoolResponder) and written to an append-only journal
+instead.  The journal is sent to the real slick later with:
+
+    snot-replay [--slick-url URL] JOURNAL
+
+Objects created while spooling get placeholder ids, which the replay swaps for the ids slick gives them.  Projects,
+releases, builds, components, testplans, environments, testrun groups and testcases that already exist in slick are
+found and used instead of being created again.  The replay records how far it got (and the ids it was given) next to
+the journal, so running it again resumes where it stopped.  An entry that was being sent when the replay stopped is
+only sent again if doing so can't duplicate it in slick (see SpoolReplayer.resendable).
+"""
+from __future__ import print_function
+import sys
+if sys.version_info[0] < 3:
+    from future import standard_library
+    standard_library.install_aliases()
+import base64
+import itertools
+import json
+import logging
+import optparse
+import os
+import re
+import threading
+from urllib.parse import urlparse, parse_qsl, quote, unquote
+
+import requests
+
+__author__ = 'agent'
+
+log = logging.getLogger('nose.plugins.snot.spool')
+
+PLACEHOLDER_FORMAT = "spool{:019d}"
+PLACEHOLDER = re.compile(r'spool\d{19}')
+JOURNAL_VERSION = 1
+# the collections snot looks things up in again during a run, the only ones a SpoolResponder remembers
+REMEMBERED = ['projects', 'testplans', 'configurations', 'testrungroups', 'testcases']
+# what slick answers a new file with when it isn't given a chunk size
+DEFAULT_CHUNK_SIZE = 262144
+
+
+class SpoolReplayError(Exception):
+    """
+    A replay couldn't go on.  unsent is True when the entry it was sending is known not to have reached slick, so it
+    can be sent again.
+    """
+
+    def __init__(self, message, unsent=False):
+        super(SpoolReplayError, self).__init__(message)
+        self.unsent = unsent
+
+
+class SlickRouter(object):
+    """
+    The part of slick's rest api snot uses, answered from collections of objects kept in memory (store).  Both the
+    SpoolResponder and the tests' FakeSlick are built on it; subclasses give it new_id and can override the hooks
+    below to keep more (or less) of what they're sent.
+
+    :param collections: the collections to keep the objects created in, others are answered and forgotten.
+    """
+    product_name = 'Slick'
+    version = '1.0'
+
+    def __init__(self, collections):
+        self.store = dict((collection, dict()) for collection in collections)
+
+    def new_id(self):
+        raise NotImplementedError()
+
+    def respond(self, method, parts, query, body):
+        """Answer one request, returning the status and the response."""
+        try:
+            return self.route(method, parts, query, body)
+        except (KeyError, IndexError, ValueError):
+            return 404, {}
+
+    def create(self, collection, obj):
+        obj['id'] = self.new_id()
+        if collection in self.store:
+            self.store[collection][obj['id']] = obj
+        return obj
+
+    def accepts(self, collection, obj):
+        """Whether a new object can be created in collection, slick would answer 404 if it can't."""
+        return True
+
+    def add_chunk(self, file_id, data):
+        return {'id': file_id}
+
+    def add_log(self, result_id, entries):
+        return len(entries)
+
+    def summarize(self, collection, item):
+        return item
+
+    def route(self, method, parts, query, body):
+        collection = parts[0]
+        if collection == 'version':
+            return 200, {'productName': self.product_name, 'versionString': self.version}
+        if collection == 'projects':
+            return self.route_projects(method, parts, body)
+        if collection == 'files' and len(parts) == 3 and parts[2] == 'addchunk':
+            return 200, self.add_chunk(parts[1], body)
+        if collection == 'results' and len(parts) == 3 and parts[2] == 'log' and method == 'POST':
+            return 200, self.add_log(parts[1], json.loads(body.decode('utf-8')))
+        if collection == 'testrungroups' and len(parts) == 4 and parts[2] == 'addtestrun':
+            group = self.store['testrungroups'][parts[1]]
+            if parts[3] in self.store.get('testruns', {}):
+                group.setdefault('testruns', []).append(self.store['testruns'][parts[3]])
+            return 200, group
+        items = self.store.get(collection)
+        if len(parts) == 1:
+            if method == 'GET':
+                return 200, [item for item in (items or {}).values() if matches(item, query)]
+            if method == 'POST':
+                obj = json.loads(body.decode('utf-8'))
+                if not self.accepts(collection, obj):
+                    return 404, {}
+                if collection == 'files':
+                    obj.setdefault('chunkSize', DEFAULT_CHUNK_SIZE)
+                return 200, self.create(collection, obj)
+        elif method == 'PUT':
+            obj = json.loads(body.decode('utf-8'))
+            obj['id'] = parts[1]
+            if items is not None:
+                items[parts[1]].update(obj)
+                return 200, items[parts[1]]
+            return 200, obj
+        elif method == 'GET' and items is not None:
+            return 200, self.summarize(collection, items[parts[1]])
+        elif method == 'DELETE':
+            if items is not None:
+                del items[parts[1]]
+            return 200, {}
+        return 404, {}
+
+    def route_projects(self, method, parts, body):
+        projects = self.store['projects']
+        if len(parts) == 1 and method == 'POST':
+            project = json.loads(body.decode('utf-8'))
+            project.setdefault('releases', [])
+            project.setdefault('components', [])
+            return 200, self.create('projects', project)
+        if parts[1] == 'byname':
+            return 200, [project for project in projects.values() if project['name'] == parts[2]][0]
+        project = projects[parts[1]]
+        if len(parts) == 2:
+            return 200, project
+        if parts[2] == 'components' and method == 'POST':
+            return 200, self.add(project['components'], json.loads(body.decode('utf-8')))
+        if parts[2] == 'releases':
+            if len(parts) == 3 and method == 'POST':
+                release = json.loads(body.decode('utf-8'))
+                release.setdefault('builds', [])
+                return 200, self.add(project['releases'], release)
+            release = [release for release in project['releases'] if release['id'] == parts[3]][0]
+            if len(parts) == 5 and parts[4] == 'builds' and method == 'POST':
+                return 200, self.add(release['builds'], json.loads(body.decode('utf-8')))
+        return 404, {}
+
+    def add(self, items, obj):
+        obj['id'] = self.new_id()
+        items.append(obj)
+        return obj
+
+
+def matches(item, query):
+    for key, value in query.items():
+        if key == 'projectid':
+            if item.get('project', {}).get('id') != value:
+                return False
+        elif key == 'testrunid':
+            if item.get('testrun', {}).get('testrunId') != value:
+                return False
+        elif key == 'config-type':
+            continue
+        elif str(item.get(key)) != value:
+            return False
+    return True
+
+
+class SpoolResponder(SlickRouter):
+    """
+    Answers slickqa's requests while spooling, giving what it creates placeholder ids.  Only what snot looks up again
+    during a run is remembered: projects (with their releases, builds and components), testplans, configurations,
+    testrun groups and testcases.  Testruns, results and files are answered with what was sent and then forgotten,
+    the journal has them.
+    """
+    product_name = 'Snot Spool'
+    version = str(JOURNAL_VERSION)
+
+    def __init__(self):
+        SlickRouter.__init__(self, REMEMBERED)
+        self.ids = itertools.count(1)
+        self.created = None
+
+    def new_id(self):
+        self.created = PLACEHOLDER_FORMAT.format(next(self.ids))
+        return self.created
+
+    def respond(self, method, parts, query, body):
+        """Answer one request, returning the status, the response and the placeholder id it created (or None)."""
+        self.created = None
+        status, response = SlickRouter.respond(self, method, parts, query, body)
+        return status, response, self.created
+
+
+class SpoolResponse(object):
+    """Just enough of a requests Response for slickqa."""
+
+    def __init__(self, status_code, response):
+        self.status_code = status_code
+        if isinstance(response, bytes):
+            self.content = response
+        else:
+            self.content = json.dumps(response).encode('utf-8')
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class SpoolingRequests(object):
+    """
+    Takes the place of the requests module in slickqa.connection while spooling.  Each request is answered by a
+    SpoolResponder, and every request that changes something is appended to the journal before it's answered.
+    """
+
+    def __init__(self, path, url):
+        self.path = path
+        self.responder = SpoolResponder()
+        self.lock = threading.Lock()
+        self.journal = open(path, 'ab')
+        if self.journal.tell() == 0:
+            self.write({'snotSpool': JOURNAL_VERSION, 'url': url})
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        return self.request('POST', url, data, headers)
+
+    def put(self, url, data=None, headers=None, **kwargs):
+        return self.request('PUT', url, data, headers)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url)
+
+    def request(self, method, url, data=None, headers=None):
+        url = urlparse(url)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        if 'api' in parts:
+            parts = parts[parts.index('api') + 1:]
+        query = dict(parse_qsl(url.query))
+        if data is None:
+            body = b''
+        elif isinstance(data, bytes):
+            body = data
+        else:
+            body = data.encode('utf-8')
+        with self.lock:
+            status, response, created = self.responder.respond(method, parts, query, body)
+            if method != 'GET':
+                entry = {'method': method, 'path': parts, 'query': query}
+                if headers is not None and headers.get('Content-Type') == 'application/octet-stream':
+                    entry['data'] = base64.b64encode(body).decode('ascii')
+                elif body:
+                    entry['body'] = body.decode('utf-8')
+                if created is not None:
+                    entry['created'] = created
+                self.write(entry)
+        return SpoolResponse(status, response)
+
+    def write(self, entry):
+        self.journal.write(json.dumps(entry).encode('utf-8') + b'\n')
+        self.journal.flush()
+
+    def close(self):
+        with self.lock:
+            self.journal.close()
+
+
+def named(items, name):
+    for item in items or []:
+        if item.get('name') == name:
+            return item
+    return None
+
+
+class SpoolReplayer(object):
+    """
+    Sends a journal written while spooling to slick.  How far it got is appended to a progress file next to the
+    journal (the journal's path + '.progress'), so a replay that stops part way can be run again to finish it.
+
+    Each entry is marked as being sent before it's request goes out.  If the replay stopped without knowing whether
+    slick got that entry, it's sent again when that's safe (see resendable), otherwise the replay stops until it's
+    told what happened to it with in_flight.
+
+    :param path: the journal to replay
+    :param url: the slick to send it to, by default the url it was spooled for
+    :param in_flight: what happened to an entry that may or may not have been sent, 'sent' to skip it or 'unsent' to
+                      send it again
+    """
+
+    def __init__(self, path, url=None, in_flight=None):
+        self.path = path
+        self.progress_path = path + '.progress'
+        self.url = url
+        self.in_flight = in_flight
+        self.session = requests.Session()
+        self.ids = dict()
+        self.done = -1
+        self.sending = None
+
+    def load_progress(self):
+        if not os.path.exists(self.progress_path):
+            return
+        with open(self.progress_path, 'rb') as progress:
+            for line in progress:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # the last record is cut short if the replay was killed while writing it
+                    break
+                if 'sending' in record:
+                    self.sending = record['sending']
+                elif 'unsent' in record:
+                    self.sending = None
+                else:
+                    self.done = record['entry']
+                    self.ids.update(record['ids'])
+                    self.sending = None
+
+    def replay(self):
+        """Send everything in the journal that hasn't been sent yet, returning how many entries were sent."""
+        self.load_progress()
+        sent = 0
+        with open(self.path, 'rb') as journal, open(self.progress_path, 'ab') as progress:
+            header = json.loads(journal.readline().decode('utf-8'))
+            if header.get('snotSpool') != JOURNAL_VERSION:
+                raise SpoolReplayError("{} isn't a snot spool journal.".format(self.path))
+            if self.url is None:
+                self.url = header['url']
+            self.base = self.url.rstrip('/') + '/api/'
+            for index, line in enumerate(journal):
+                if index <= self.done:
+                    continue
+                entry = json.loads(line.decode('utf-8'))
+                resending = index == self.sending
+                if resending and not self.resendable(entry) and self.in_flight != 'unsent':
+                    if self.in_flight != 'sent':
+                        raise SpoolReplayError("Entry {} of {} may or may not have reached slick, replay it with "
+                                               "--in-flight sent or unsent.".format(index, self.path))
+                    if 'created' in entry:
+                        raise SpoolReplayError("Entry {} of {} created an object that can't be found in slick, it "
+                                               "can't be skipped.".format(index, self.path))
+                    self.write_progress(progress, {'entry': index, 'ids': {}})
+                    self.done = index
+                    continue
+                self.write_progress(progress, {'sending': index})
+                try:
+                    new_ids = self.send_entry(entry, resending)
+                except SpoolReplayError as err:
+                    if err.unsent:
+                        self.write_progress(progress, {'unsent': index})
+                    raise
+                self.write_progress(progress, {'entry': index, 'ids': new_ids})
+                self.ids.update(new_ids)
+                self.done = index
+                sent += 1
+        return sent
+
+    def write_progress(self, progress, record):
+        progress.write(json.dumps(record).encode('utf-8') + b'\n')
+        progress.flush()
+
+    def resendable(self, entry):
+        """
+        Whether an entry can be sent again without knowing if slick got it: updates and deletes, and creates that
+        find_existing can find if they were.
+        """
+        if entry['method'] in ('PUT', 'DELETE'):
+            return True
+        if 'created' not in entry or 'body' not in entry:
+            return False
+        parts = entry['path']
+        collection = parts[0]
+        if collection == 'projects':
+            return len(parts) == 1 or (len(parts) == 3 and parts[2] in ('releases', 'components')) or \
+                (len(parts) == 5 and parts[4] == 'builds')
+        if collection == 'testcases':
+            return bool(json.loads(entry['body']).get('automationId'))
+        if collection == 'results':
+            return bool(json.loads(entry['body']).get('testrun', {}).get('testrunId'))
+        return collection in ('testplans', 'configurations', 'testrungroups')
+
+    def real_id(self, match):
+        placeholder = match.group(0)
+        if placeholder not in self.ids:
+            raise SpoolReplayError("Entry {} of {} uses {} before it was created.".format(self.done + 1, self.path,
+                                                                                         placeholder), unsent=True)
+        return self.ids[placeholder]
+
+    def substitute(self, text):
+        return PLACEHOLDER.sub(self.real_id, text)
+
+    def send_entry(self, entry, resending=False):
+        """
+        Send one journal entry, returning the placeholder ids it gave real ids to.  When resending an entry slick may
+        already have, a create uses what it already made and a delete doesn't mind it being gone.
+        """
+        parts = [self.substitute(part) for part in entry['path']]
+        query = dict((key, self.substitute(value)) for key, value in entry['query'].items())
+        if 'data' in entry:
+            self.send(entry['method'], parts, query, data=base64.b64decode(entry['data']),
+                      content_type='application/octet-stream')
+            return {}
+        body = None
+        if 'body' in entry:
+            body = json.loads(self.substitute(entry['body']))
+        if 'created' not in entry:
+            self.send(entry['method'], parts, query, body, missing_ok=resending and entry['method'] == 'DELETE')
+            return {}
+        existing = self.find_existing(parts, body, resending)
+        if existing is None:
+            existing = self.send(entry['method'], parts, query, body)
+        elif parts[0] == 'testcases':
+            body['id'] = existing['id']
+            self.send('PUT', ['testcases', existing['id']], {}, body)
+        return {entry['created']: existing['id']}
+
+    def find_existing(self, parts, body, resending=False):
+        """
+        Find the object a create in the journal would have found if slick was there, None if there isn't one.  When
+        resending, a result slick already has for the same testcase in the testrun that no earlier entry was given is
+        the one the entry created.
+        """
+        collection = parts[0]
+        if collection == 'projects':
+            if len(parts) == 1:
+                return self.get(['projects', 'byname', body['name']])
+            project = self.get(['projects', parts[1]])
+            if len(parts) == 3 and parts[2] in ('releases', 'components'):
+                return named(project.get(parts[2]), body['name'])
+            if len(parts) == 5 and parts[4] == 'builds':
+                release = [release for release in project.get('releases', []) if release['id'] == parts[3]]
+                return named(release[0].get('builds') if release else [], body['name'])
+        elif collection == 'testplans':
+            return self.first('testplans', projectid=body['project']['id'], name=body['name'])
+        elif collection == 'configurations':
+            return self.first('configurations', name=body['name'], configurationType=body.get('configurationType'))
+        elif collection == 'testrungroups':
+            return self.first('testrungroups', name=body['name'])
+        elif collection == 'testcases' and body.get('automationId'):
+            return self.first('testcases', projectid=body['project']['id'], automationId=body['automationId'])
+        elif collection == 'results' and resending:
+            testcase_id = body.get('testcase', {}).get('testcaseId')
+            known = set(self.ids.values())
+            results = self.send('GET', ['results'], {'testrunid': body['testrun']['testrunId']}, missing_ok=True)
+            for result in results or []:
+                if result.get('testcase', {}).get('testcaseId') == testcase_id and result['id'] not in known:
+                    return result
+        return None
+
+    def first(self, collection, **query):
+        found = self.send('GET', [collection], query, missing_ok=True)
+        if found:
+            return found[0]
+        return None
+
+    def get(self, parts):
+        return self.send('GET', parts, {}, missing_ok=True)
+
+    def send(self, method, parts, query, body=None, data=None, content_type='application/json', missing_ok=False):
+        url = self.base + '/'.join(quote(part, safe='') for part in parts)
+        if body is not None:
+            data = json.dumps(body)
+        try:
+            response = self.session.request(method, url, params=query, data=data,
+                                            headers={'Content-Type': content_type})
+        except requests.RequestException as err:
+            raise SpoolReplayError("Couldn't send {} {}: {}".format(method, url, err))
+        if response.status_code == 404 and missing_ok:
+            return None
+        if response.status_code != 200:
+            raise SpoolReplayError("Slick returned {} for {} {}: {}".format(response.status_code, method, url,
+                                                                            response.text), unsent=True)
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            return response.json()
+        return response.content
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(usage="%prog [options] JOURNAL",
+                                   description="Send a journal written by snot with --snot-spool to slick.  Running it "
+                                               "again after it stopped part way resumes where it stopped.")
+    parser.add_option("--slick-url", action="store", default=os.environ.get('SLICK_URL'), metavar="SLICK_URL",
+                      dest="slick_url", help="the base url of the slick web app, by default the one the journal "
+                                             "was spooled for [SLICK_URL]")
+    parser.add_option("--in-flight", action="store", default=None, choices=['sent', 'unsent'], dest="in_flight",
+                      help="when the last replay stopped while sending an entry that can't be sent twice, whether "
+                           "slick got it ('sent' skips it, 'unsent' sends it again)")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("Give the path of one journal to replay.")
+    replayer = SpoolReplayer(args[0], options.slick_url, options.in_flight)
+    try:
+        sent = replayer.replay()
+    except SpoolReplayError as err:
+        print(err, file=sys.stderr)
+        print("Stopped after {} entries, run it again to resume.".format(replayer.done + 1), file=sys.stderr)
+        return 1
+    print("Sent {} entries from {} to {}.".format(sent, args[0], replayer.url))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,11 +2,34 @@ __author__ = 'jcorbett'
 
 import snot
 from asserts import *
-from slickqa import DocStringMetaData
+from fakeslick import FakeSlick
+import snotspool
+from slickqa import DocStringMetaData, GraphValueReference, Result, SlickQA, Testcase, make_result_updatable
+import slickqa.connection
+from slickqa.connection import SlickConnection
 from nose.tools import istest
 from nose.plugins import Plugin
+import nose.case
+import nose.config
+import nose.loader
+import nose.plugins.manager
+import nose.proxy
+import requests
 
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import multiprocessing
+import optparse
+import queue
+import os
+import subprocess
 import sys
+import tempfile
+import time
+import unittest
 try:
     import ConfigParser
 except:
@@ -210,3 +233,1430 @@ def config_test():
     else:
         log = logging.getLogger('snottests.config_test')
         log.warning("No config from which to test")
+
+
+def sample_login():
+    """Sample Login
+
+    :component: Sample Component
+    :steps:
+        1. Log in
+    :expectedResults:
+        1. Logged in
+    """
+    pass
+
+
+def sample_logout():
+    """Sample Logout
+
+    :component: Sample Component
+    """
+    pass
+
+
+def snot_plugin(slick_url, *args):
+    """Create a SlickAsSnotPlugin configured the way nose would, with the given extra command line arguments."""
+    plugin = snot.SlickAsSnotPlugin()
+    parser = optparse.OptionParser()
+    plugin.addOptions(parser, env={})
+    options, _ = parser.parse_args(['--with-snot', '--slick-url', slick_url, '--slick-project-name', 'Snot',
+                                    '--slick-release', '1.0', '--slick-build', 'dev', '--slick-testplan', 'Unit Tests'] + list(args))
+    options.files = None
+    plugin.configure(options, nose.config.Config())
+    return plugin
+
+
+def nose_tests(*functions):
+    return [nose.case.Test(nose.case.FunctionTestCase(function)) for function in functions]
+
+
+@contextlib.contextmanager
+def preserved_snot_globals():
+    """Keep a plugin under test from clobbering the snot globals of the plugin reporting these tests."""
+    saved = (snot.current_result, snot.testrun, snot.snot_options, dict(snot.SlickAsSnotPlugin.testruns),
+             slickqa.connection.requests, snot.graph_buffer, snot.uploader, snot.timings, snot.unreplaced_requests)
+    try:
+        yield
+    finally:
+        snot.current_result, snot.testrun, snot.snot_options = saved[:3]
+        snot.SlickAsSnotPlugin.testruns.clear()
+        snot.SlickAsSnotPlugin.testruns.update(saved[3])
+        slickqa.connection.requests = saved[4]
+        snot.graph_buffer, snot.uploader, snot.timings, snot.unreplaced_requests = saved[5:]
+
+
+@contextlib.contextmanager
+def plugin_reporting_to_fake_slick(*args, **slick_options):
+    """A FakeSlick and a plugin configured with args to report to it, with the snot globals preserved."""
+    with FakeSlick(**slick_options) as slick, preserved_snot_globals():
+        yield slick, snot_plugin(slick.url, *args)
+
+
+@istest
+def test_results_filed_in_chunks():
+    """Results for all tests are filed in slick in chunks before the tests run
+
+    prepareTest builds the results for every test first, then files them with slick in chunks, only looking
+    up each distinct testcase once per chunk, and not again in the next chunk for the duplicates of a test.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare 2 tests, duplicated 3 times, with a chunk size of 4 against a fake slick
+    :expectedResults:
+        1. 6 results and 2 testcases are created, the testcases are only looked up twice, and each test has a result
+    """
+    with plugin_reporting_to_fake_slick('--slick-duplicate', '3', '--slick-chunk-size', '4') as (slick, plugin):
+        tests = nose_tests(sample_login, sample_logout)
+        plugin.prepareTest(tests)
+        assert_equal(6, len(slick.store['results']))
+        assert_equal(2, len(slick.store['testcases']))
+        assert_equal(2, slick.count('GET', 'testcases'))
+        assert_equal(set(test.id() for test in tests), set(plugin.results.keys()))
+        for test in tests:
+            assert_equal("NO_RESULT", plugin.results[test.id()].status)
+            assert_equal("Sample Component", plugin.results[test.id()].component.name)
+
+
+@istest
+def test_duplicates_built_once():
+    """With --slick-duplicate, each test's result is built once and copied for it's duplicates
+
+    The testcase, attributes and testrun of a duplicated test are only worked out once, and it's testcase is only
+    found and updated in slick once, however many chunks it's duplicates are filed in.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare 2 tests, duplicated 5 times, with a chunk size of 2 against a fake slick
+    :expectedResults:
+        1. Each test's result is built once, 10 results are filed with their own attributes and 2 testcases, and
+           each testcase is looked up once
+    """
+    with plugin_reporting_to_fake_slick('--slick-duplicate', '5', '--slick-chunk-size', '2') as (slick, plugin):
+        built = []
+        build = plugin.buildSlickResult
+
+        def counted_build(test):
+            built.append(test.id())
+            return build(test)
+        plugin.buildSlickResult = counted_build
+        filed = []
+        file_chunk = plugin.fileChunk
+
+        def recorded_chunk(chunk, pool=None):
+            filed.extend(chunk)
+            return file_chunk(chunk, pool)
+        plugin.fileChunk = recorded_chunk
+        tests = nose_tests(sample_login, sample_logout)
+        plugin.prepareTest(tests)
+        assert_equal([test.id() for test in tests], built)
+        assert_equal(10, len(slick.store['results']))
+        assert_equal(2, slick.count('GET', 'testcases'))
+        assert_equal(10, len(set(id(scheduled.attributes) for scheduled in filed)))
+        assert_equal(2, len(set(id(scheduled.testcase) for scheduled in filed)))
+
+
+@istest
+def test_testcase_without_automation_id_found_by_key():
+    """A testcase without an automation id is found by it's automation key instead of being created again
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Upsert a testcase with an automation key and no automation id, when slick has one with that key
+    :expectedResults:
+        1. The existing testcase is updated, no new one is created
+    """
+    with FakeSlick() as slick:
+        slickqa_object = SlickQA(slick.url, 'Snot', '1.0', 'dev', 'Unit Tests')
+        existing = slick.create('testcases', {'name': 'Keyed', 'automationKey': 'snottests.py:keyed',
+                                              'project': {'id': slickqa_object.project.id}})
+        testdata = Testcase()
+        testdata.name = 'Keyed'
+        testdata.automationKey = 'snottests.py:keyed'
+        testcase = snot.upsert_testcase(slickqa_object, testdata)
+        assert_equal(existing['id'], testcase.id)
+        assert_equal(1, len(slick.store['testcases']))
+
+
+@istest
+def test_background_reporter_coalesces_updates():
+    """Result updates sent by the background reporter are coalesced and all sent by finalize
+
+    With --snot-async-reporter, result.update() only queues the update.  Updates to the same result that are
+    waiting to be sent are combined, and finalize waits for all of them to reach slick.
+
+    :component: Background Reporter
+    :author: agent
+    :steps:
+        1. Prepare a test with the async reporter against a slow fake slick
+        2. Update the result 5 times in a row
+        3. Call finalize
+    :expectedResults:
+        1. The test has a result
+        2. The updates are queued instead of sent immediately
+        3. No more than 2 updates are sent, slick has the last update, and the testrun is finished
+    """
+    with plugin_reporting_to_fake_slick('--snot-async-reporter', latency=0.02) as (slick, plugin):
+        tests = nose_tests(sample_login)
+        plugin.prepareTest(tests)
+        result = plugin.results[tests[0].id()]
+        slick.reset_counts()
+        for i in range(5):
+            result.reason = "update {}".format(i)
+            result.update()
+        plugin.finalize(None)
+        assert_less_equal(slick.count('PUT', 'results'), 2)
+        assert_equal("update 4", slick.store['results'][result.id]['reason'])
+        assert_equal("FINISHED", list(slick.store['testruns'].values())[0]['state'])
+
+
+@istest
+def test_single_test_result_found_by_name():
+    """When nose runs a single test it's result is found by the last part of the test name
+
+    addSlickResult finds results from an index built by prepareTest.  A test that doesn't match a result by id
+    still gets the result whose id ends with the same name as the single test name nose was given.
+
+    :component: Reporting
+    :author: agent
+    :steps:
+        1. Prepare 2 tests against a fake slick
+        2. Report a pass for a test with a different id, when nose was given the name of the second test
+    :expectedResults:
+        1. Each test has a result
+        2. The result of the second test is set to PASS
+    """
+    with plugin_reporting_to_fake_slick() as (slick, plugin):
+        tests = nose_tests(sample_login, sample_logout)
+        plugin.prepareTest(tests)
+        config = nose.config.Config()
+        config.testNames = ['some.other.module.sample_logout']
+        test = nose.case.Test(nose.case.FunctionTestCase(sample_logout), config=config)
+        test.id = lambda: 'some.other.module.sample_logout'
+        plugin.addSlickResult(test)
+        assert_equal("PASS", slick.store['results'][plugin.results[tests[1].id()].id]['status'])
+        assert_equal("NO_RESULT", slick.store['results'][plugin.results[tests[0].id()].id]['status'])
+
+
+def slick_result(slick):
+    """A result in a fake slick, updatable the way the plugin makes the results it files."""
+    result = Result.from_dict(slick.create('results', {'status': 'NO_RESULT'}))
+    make_result_updatable(result, SlickConnection(slick.url))
+    return result
+
+
+@istest
+def test_buffered_log_entries_shipped_in_batches():
+    """Buffered log capture ships log entries to the result in batches, and limits how many are kept
+
+    A buffered LogCapturingHandler keeps log records for the current result and only sends them to slick every
+    batch_size records, and when flushed.  Each batch only sends it's own entries, they're added to the end of the
+    result's log without updating the rest of the result.  Records past max_entries are dropped, with a summary
+    entry when the overflow policy is 'summary'.
+
+    :component: Log Capture
+    :author: agent
+    :steps:
+        1. Log 7 records through a buffered handler with a batch size of 3, max entries of 5, and overflow of summary
+        2. Flush the handler
+    :expectedResults:
+        1. One batch of 3 log entries was sent
+        2. A second batch was sent with the other 2 records kept and a summary of the 2 dropped, and the result
+           itself was never updated
+    """
+    handler = snot.LogCapturingHandler(buffered=True, batch_size=3, max_entries=5, overflow='summary')
+    logger = logging.getLogger('snottests.buffered')
+    logger.propagate = False
+    logger.addHandler(handler)
+    with FakeSlick() as slick, preserved_snot_globals():
+        snot.current_result = slick_result(slick)
+        stored = slick.store['results'][snot.current_result.id]
+        try:
+            for i in range(7):
+                logger.warning("message %d", i)
+            assert_equal(1, slick.count('POST', 'results'))
+            assert_equal(3, len(stored['log']))
+            handler.flush()
+        finally:
+            logger.removeHandler(handler)
+        assert_equal(2, slick.count('POST', 'results'))
+        assert_equal(0, slick.count('PUT', 'results'))
+    assert_equal(["message {}".format(i) for i in range(5)], [entry['message'] for entry in stored['log'][:5]])
+    assert_equal("WARN", stored['log'][0]['level'])
+    assert_in("2 log entries were dropped", stored['log'][5]['message'])
+
+
+class CountingFormatter(logging.Formatter):
+    """A formatter that counts how many records it formatted."""
+
+    def __init__(self):
+        super(CountingFormatter, self).__init__()
+        self.formatted = 0
+
+    def format(self, record):
+        self.formatted += 1
+        return super(CountingFormatter, self).format(record)
+
+
+@istest
+def test_log_capture_never_raises_into_the_test():
+    """Log capture doesn't raise into the code that's logging when slick can't be reached
+
+    Shipping a batch of log entries happens while a test logs, and when the handler is flushed after the test.  If
+    slick isn't there the problem is logged by snot instead.
+
+    :component: Log Capture
+    :author: agent
+    :steps:
+        1. Log with a batch size of 1 to a result on a slick that has stopped
+        2. Log again and flush the handler
+    :expectedResults:
+        1. Nothing is raised
+        2. Nothing is raised
+    """
+    handler = snot.LogCapturingHandler(buffered=True, batch_size=1)
+    logger = logging.getLogger('snottests.unreachable')
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+    with preserved_snot_globals():
+        with FakeSlick() as slick:
+            snot.current_result = slick_result(slick)
+        try:
+            logger.info("slick has stopped")
+            handler.batch_size = 100
+            logger.info("still logging")
+            handler.flush()
+        finally:
+            logger.removeHandler(handler)
+
+
+@istest
+def test_log_capture_filters_before_formatting():
+    """Log records from excluded loggers, below the level, or past the limit are dropped without being formatted
+
+    Which loggers a LogCapturingHandler captures is decided once per logger name from the compiled include and
+    exclude prefixes, and that decision is forgotten when the prefixes change, or the class's ignore list does.
+
+    :component: Log Capture
+    :author: agent
+    :steps:
+        1. Log from an excluded logger, an included logger under it, and another logger, some below the level
+        2. Log past max entries
+        3. Include the excluded logger
+        4. Add the other logger to LogCapturingHandler.ignore
+    :expectedResults:
+        1. Only the included and other loggers' records at or above the level are formatted and kept
+        2. The records past the limit aren't formatted
+        3. The excluded logger's records are captured from then on
+        4. The other logger's records aren't captured any more
+    """
+    formatter = CountingFormatter()
+    handler = snot.LogCapturingHandler(buffered=True, batch_size=100, max_entries=4, exclude=['snottests.noisy'],
+                                       include=['snottests.noisy.important'], level=logging.INFO)
+    handler.setFormatter(formatter)
+    names = ['snottests.noisy', 'snottests.noisy.important', 'snottests.quiet']
+    loggers = [logging.getLogger(name) for name in names]
+    for logger in loggers:
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(handler)
+    with FakeSlick() as slick, preserved_snot_globals():
+        snot.current_result = slick_result(slick)
+        log_entries = slick.store['results'][snot.current_result.id].setdefault('log', [])
+        try:
+            for logger in loggers:
+                logger.debug("debug from %s", logger.name)
+                logger.info("info from %s", logger.name)
+            assert_equal(2, formatter.formatted)
+            assert_equal({'snottests.noisy': False, 'snottests.noisy.important': True, 'snottests.quiet': True},
+                         handler.captured_loggers)
+            for i in range(5):
+                loggers[2].warning("warning %d", i)
+            assert_equal(4, formatter.formatted)
+            handler.flush()
+            assert_equal(["info from snottests.noisy.important", "info from snottests.quiet", "warning 0", "warning 1"],
+                         [entry['message'] for entry in log_entries])
+            handler.set_loggers(include=['snottests.noisy'])
+            assert_equal({}, handler.captured_loggers)
+            loggers[0].info("now included")
+            handler.flush()
+            assert_equal("now included", log_entries[-1]['message'])
+            assert_true(handler.captures('snottests.quiet'))
+            snot.LogCapturingHandler.ignore.append('snottests.quiet')
+            assert_false(handler.captures('snottests.quiet'))
+        finally:
+            if 'snottests.quiet' in snot.LogCapturingHandler.ignore:
+                snot.LogCapturingHandler.ignore.remove('snottests.quiet')
+            for logger in loggers:
+                logger.removeHandler(handler)
+
+
+@istest
+def test_log_capture_in_memory_with_limit():
+    """Test logs are captured in memory, spill to a temporary file when large, and stop at the size limit
+
+    The MemoryCaptureHandler used to capture each test's log keeps it in memory until it's larger than the spill
+    size, and once it reaches the maximum size the rest of the log is replaced by a truncation marker.
+
+    :component: Log Capture
+    :author: agent
+    :steps:
+        1. Log 3 small records through a handler with a spill size of 100 and max size of 250
+        2. Log 17 more records
+    :expectedResults:
+        1. The log is still in memory, and contains the 3 records
+        2. The log was moved to a file, and ends with the truncation marker without going past 250 bytes
+    """
+    handler = snot.MemoryCaptureHandler(spill_size=100, max_size=250)
+    handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+    logger = logging.getLogger('snottests.memorycapture')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(3):
+            logger.warning("message %d", i)
+        assert_false(handler.buffer._rolled)
+        handler.buffer.seek(0)
+        assert_equal(b"WARNING message 0\nWARNING message 1\nWARNING message 2\n", handler.buffer.read())
+        for i in range(3, 20):
+            logger.warning("message %d", i)
+        assert_true(handler.buffer._rolled)
+        handler.buffer.seek(0)
+        captured = handler.buffer.read()
+        assert_true(captured.endswith(b"[ log truncated, it reached the limit of 250 bytes ]\n"))
+        assert_less_equal(handler.size - len(b"[ log truncated, it reached the limit of 250 bytes ]\n"), 250)
+        assert_equal(handler.size, len(captured))
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+@istest
+def test_components_looked_up_once():
+    """Components are only created in slick once, and existing ones are found without asking slick
+
+    The component cache is loaded from the project's components, and creates each missing component once, no
+    matter how many tests use it.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare 2 tests with the same new component, each duplicated 3 times, against a fake slick
+        2. Prepare the same tests again with a new plugin
+    :expectedResults:
+        1. The component is created once, and all results reference it
+        2. No components are created
+    """
+    with plugin_reporting_to_fake_slick('--slick-duplicate', '3') as (slick, plugin):
+        tests = nose_tests(sample_login, sample_logout)
+        plugin.prepareTest(tests)
+        component_posts = [request for request in slick.requests if request[0] == 'POST' and request[2].endswith('components')]
+        assert_equal(1, len(component_posts))
+        component_ids = set(result['component']['id'] for result in slick.store['results'].values())
+        assert_equal(1, len(component_ids))
+        snot.SlickAsSnotPlugin.testruns.clear()
+        slick.reset_counts()
+        snot_plugin(slick.url).prepareTest(tests)
+        component_posts = [request for request in slick.requests if request[0] == 'POST' and request[2].endswith('components')]
+        assert_equal(0, len(component_posts))
+
+
+def counted_build():
+    counted_build.calls += 1
+    return "build {}".format(counted_build.calls)
+counted_build.calls = 0
+
+
+@istest
+def test_build_function_called_once():
+    """The build function is only called once for all the tests being scheduled
+
+    --slick-build-from-function can be slow, so it's called once per run and the function itself is only looked
+    up the first time.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare 2 tests duplicated twice, getting the build from snottests.counted_build
+    :expectedResults:
+        1. counted_build was called once, and the testrun is for it's build
+    """
+    counted_build.calls = 0
+    with plugin_reporting_to_fake_slick('--slick-duplicate', '2', '--slick-build-from-function',
+                                        'snottests.counted_build') as (slick, plugin):
+        plugin.prepareTest(nose_tests(sample_login, sample_logout))
+        assert_equal(1, counted_build.calls)
+        assert_in('snottests.counted_build', snot.called_functions)
+        for testrun in slick.store['testruns'].values():
+            assert_equal("build 1", testrun['build']['name'])
+
+
+def flaky_build():
+    flaky_build.calls += 1
+    if flaky_build.calls > 1:
+        raise Exception("the build server is down")
+    return "build 1"
+flaky_build.calls = 0
+
+
+@istest
+def test_failed_build_function_uses_build_option():
+    """When the build function fails, the build given with --slick-build is used
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare a test with a build per testplan, from a function that works the first time only
+        2. Add the testrun for a second testplan
+    :expectedResults:
+        1. The first testplan's testrun is for the function's build
+        2. The second testplan's testrun is for the --slick-build build, not the first testplan's
+    """
+    flaky_build.calls = 0
+    with plugin_reporting_to_fake_slick('--slick-build-from-function', 'snottests.flaky_build',
+                                        '--slick-build-per-testplan') as (slick, plugin):
+        plugin.prepareTest(nose_tests(sample_login))
+        assert_equal("build 1", plugin.build)
+        plugin.addSlickTestrun('Second Plan')
+        assert_equal("dev", plugin.build)
+
+
+def sample_data_driven(browser):
+    """Sample Search in {0}
+
+    :component: {0} Search
+    """
+    pass
+
+
+@istest
+def test_docstring_parsed_once_per_function():
+    """A test function's docstring is only parsed once, even for many data driven cases
+
+    prepareTest gets DocStringMetaData from a cache keyed by the test function.  Each case still gets the
+    docstring's templates filled in with it's own arguments.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare 3 cases of the same data driven test function against a fake slick
+    :expectedResults:
+        1. The parsed docstring is cached for the function, and each result is named for it's own argument
+    """
+    with plugin_reporting_to_fake_slick() as (slick, plugin):
+        tests = [nose.case.Test(nose.case.FunctionTestCase(sample_data_driven, arg=(browser,)))
+                 for browser in ['Chrome', 'Firefox', 'Safari']]
+        plugin.prepareTest(tests)
+        cached = snot.docstring_metadata[sample_data_driven]
+        assert_equal("Sample Search in {0}", cached.name)
+        assert_equal("{0} Search", cached.component)
+        assert_is_not(cached, snot.get_docstring_metadata(sample_data_driven))
+        assert_is(cached, snot.docstring_metadata[sample_data_driven])
+        names = sorted(testcase['name'] for testcase in slick.store['testcases'].values())
+        assert_equal(["Sample Search in Chrome", "Sample Search in Firefox", "Sample Search in Safari"], names)
+        components = sorted(result['component']['name'] for result in slick.store['results'].values())
+        assert_equal(["Chrome Search", "Firefox Search", "Safari Search"], components)
+
+
+@istest
+def test_schedule_workers_file_every_result():
+    """Results filed by several worker threads each belong to their own test
+
+    With --slick-schedule-workers, testcases and results are filed with slick from a pool of threads sharing
+    pooled connections, each result must still end up matched with the test it was scheduled for.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare 8 tests with 4 schedule workers and a chunk size of 5 against a slow fake slick
+    :expectedResults:
+        1. Every test has a result for it's own testcase
+    """
+    with plugin_reporting_to_fake_slick('--slick-schedule-workers', '4', '--slick-chunk-size', '5',
+                                        latency=0.01) as (slick, plugin):
+        tests = nose_tests(sample_login, sample_logout)
+        tests.extend(nose.case.Test(nose.case.FunctionTestCase(sample_data_driven, arg=(browser,)))
+                     for browser in ['Chrome', 'Firefox', 'Safari', 'Edge', 'Opera', 'Lynx'])
+        plugin.prepareTest(tests)
+        assert_equal(sorted(test.id() for test in tests), sorted(plugin.results.keys()))
+        assert_equal(8, len(slick.store['results']))
+        for test in tests:
+            assert_equal(test.id(), plugin.results[test.id()].testcase.automationId)
+
+
+browser_generator_calls = []
+
+
+def sample_browsers():
+    browser_generator_calls.append(1)
+    for browser in ['Chrome', 'Firefox', 'Safari']:
+        yield sample_data_driven, browser
+
+
+@istest
+def test_streaming_collection_regenerates_tests():
+    """With --snot-streaming-collection the tests from a generator are generated again to run them
+
+    Instead of keeping every generated test until the run, snot files results for the generated tests as they
+    are collected, and the generator is called again when nose runs the suite.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare a suite from a test generator with --snot-streaming-collection
+        2. Iterate over the suite like nose does to run it
+    :expectedResults:
+        1. Each generated test has a result, and the generator was called once
+        2. The same tests are generated again, and each has a result, without nose pulling tests out early
+    """
+    with plugin_reporting_to_fake_slick('--snot-streaming-collection') as (slick, plugin):
+        del browser_generator_calls[:]
+        suite = nose.loader.TestLoader().loadTestsFromGenerator(sample_browsers, sys.modules[__name__])
+        assert_true(bool(suite))
+        plugin.prepareTest([suite])
+        assert_equal(1, len(browser_generator_calls))
+        assert_equal(3, len(plugin.results))
+        run_ids = [test.id() for test in suite]
+        assert_equal(2, len(browser_generator_calls))
+        assert_equal(sorted(plugin.results.keys()), sorted(run_ids))
+
+
+@istest
+def test_scheduled_generator_arguments_stored_as_text():
+    """The arguments of a scheduled generated test are stored in the result as text
+
+    With --slick-schedule-results, the arguments each generated test was given are pickled into the result's
+    attributes so the data driven proxy can call the test with them later.  They have to be text for slick to
+    accept them on python 3.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Schedule the tests from a test generator
+    :expectedResults:
+        1. Each result's arguments are text, and unpickle to the arguments it's test was generated with
+    """
+    with plugin_reporting_to_fake_slick('--slick-schedule-results') as (slick, plugin):
+        suite = nose.loader.TestLoader().loadTestsFromGenerator(sample_browsers, sys.modules[__name__])
+        assert_raises(SystemExit, plugin.prepareTest, [suite])
+        arguments = [result['attributes']['snotDataDrivenArguments'] for result in slick.store['results'].values()]
+        assert_equal(3, len(arguments))
+        for argument in arguments:
+            assert_is_instance(argument, type(u''))
+        assert_equal([('Chrome',), ('Firefox',), ('Safari',)], sorted(snot.unpickled(argument) for argument in arguments))
+
+
+@istest
+def test_pickled_values_are_text_python_2_and_3_can_load():
+    """Values pickled into a result's attributes are protocol 0 text, which loads on python 2 and 3
+
+    pickled turns a value into text slick can store as a json string, and unpickled turns it back.  Arguments
+    pickled by older versions of snot on python 2 are protocol 0 strings too, so they still load.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Pickle a tuple with text, a number and a non ascii character
+        2. Unpickle what python 2 pickled for ('Chrome', 3)
+    :expectedResults:
+        1. The pickle is text that unpickles to the same tuple
+        2. It loads as ('Chrome', 3)
+    """
+    value = (u'Chrome', 3, u'caf\xe9')
+    text = snot.pickled(value)
+    assert_is_instance(text, type(u''))
+    json.dumps(text)
+    assert_equal(value, snot.unpickled(text))
+    assert_equal(('Chrome', 3), snot.unpickled(u"(S'Chrome'\np0\nI3\ntp1\n."))
+
+
+def sample_repeated_browsers():
+    for browser in ['Chrome', 'Chrome', 'Firefox']:
+        yield sample_data_driven, browser
+
+
+@istest
+def test_scheduled_arguments_stored_once_on_testrun():
+    """With --snot-argument-store testrun, each distinct data driven argument is attached to the testrun once
+
+    The results refer to their arguments by hash instead of carrying a pickled copy, and the arguments are packed
+    into one file on the testrun.  The proxy on an agent fetches the pack once, and keeps what it fetched in it's
+    own --snot-argument-store directory.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Schedule 3 generated tests, 2 of them with the same arguments, with --snot-argument-store testrun
+        2. Read each result's arguments the way the proxy does, with a directory to keep them in
+        3. Read the arguments again with a new store
+    :expectedResults:
+        1. The results have 2 different hashes and no pickled arguments, and the testrun has one pack file
+        2. The arguments are the ones each test was generated with, the pack was fetched once, and the directory
+           has a file for each hash
+        3. They're read from the directory, without asking slick
+    """
+    with plugin_reporting_to_fake_slick('--slick-schedule-results', '--snot-argument-store', 'testrun') as (slick, plugin):
+        suite = nose.loader.TestLoader().loadTestsFromGenerator(sample_repeated_browsers, sys.modules[__name__])
+        assert_raises(SystemExit, plugin.prepareTest, [suite])
+        filed = list(slick.store['results'].values())
+        assert_equal(3, len(filed))
+        for result in filed:
+            assert_not_in('snotDataDrivenArguments', result['attributes'])
+        keys = set(result['attributes']['snotDataDrivenArgumentsBlob'] for result in filed)
+        assert_equal(2, len(keys))
+        testrun = list(slick.store['testruns'].values())[0]
+        assert_equal(['snot-arguments-1.pack'], [stored['filename'] for stored in testrun['files']])
+
+        directory = tempfile.mkdtemp()
+        snot.snot_options = optparse.Values({'snot_argument_store': directory})
+        snot.argument_stores.clear()
+        connection = SlickConnection(slick.url)
+        slick.reset_counts()
+        arguments = []
+        for result in filed:
+            snot.current_result = Result.from_dict(result)
+            make_result_updatable(snot.current_result, connection)
+            arguments.append(snot.data_driven_value('snotDataDrivenArguments'))
+        assert_equal([('Chrome',), ('Chrome',), ('Firefox',)], sorted(arguments))
+        assert_equal(1, slick.count('GET', 'files'))
+        assert_equal(sorted(key + '.z' for key in keys), sorted(os.listdir(directory)))
+
+        snot.argument_stores.clear()
+        slick.reset_counts()
+        for result in filed:
+            snot.current_result = Result.from_dict(result)
+            make_result_updatable(snot.current_result, connection)
+            snot.data_driven_value('snotDataDrivenArguments')
+        assert_equal(0, slick.count())
+        snot.argument_stores.clear()
+
+
+def proxied_result(module, function_name, arguments, instance=None):
+    """A result scheduled to run through the data driven proxy."""
+    result = Result()
+    result.attributes = {'snotDataDrivenFile': module.__file__.replace('.pyc', '.py'),
+                         'snotDataDrivenModuleName': module.__name__,
+                         'snotDataDrivenFunctionName': function_name,
+                         'snotDataDrivenArguments': snot.pickled(arguments)}
+    if instance is not None:
+        result.attributes['snotDataDrivenInstance'] = snot.pickled(instance)
+    return result
+
+
+@istest
+def test_data_driven_proxy_resolves_each_result_once():
+    """The data driven proxy uses the imported test module and finds each result's test and fixtures once
+
+    Running scheduled data driven tests in one process, the test module comes from the normal imports instead of
+    being executed again, each result gets it's own test, and the setup and teardown members of a module or class
+    are only looked for the first time.
+
+    :component: Data Driven Proxy
+    :author: agent
+    :steps:
+        1. Run a module level data driven test through the proxy
+        2. Run a data driven test on a class through the proxy
+        3. Run the module level test again
+    :expectedResults:
+        1. The already imported module is used, and it's setup_module is called
+        2. The class's setup methods are called on the result's own instance, and the test is the class's
+        3. The module's fixtures aren't looked for again
+    """
+    import datadriventest
+    datadriventest.setup_module_called = False
+    with preserved_snot_globals():
+        snot.current_result = proxied_result(datadriventest, 'ddt', ('Test1', 'arg2', 'foo'))
+        snot.data_driven_proxy_setup()
+        snot.data_driven_proxy()
+        snot.data_driven_proxy_teardown()
+        parent, test = snot.get_data_driven_proxy_test_objects()
+        assert_is(sys.modules['datadriventest'], parent)
+        assert_true(datadriventest.setup_module_called)
+        assert_in(datadriventest, snot.data_driven_fixture_names)
+
+        snot.current_result = proxied_result(datadriventest, 'verify_not_equals', ('Test1', 'Test2'),
+                                             datadriventest.DataDrivenTestClass())
+        snot.data_driven_proxy_setup()
+        snot.data_driven_proxy()
+        parent, test = snot.get_data_driven_proxy_test_objects()
+        assert_is_instance(parent, datadriventest.DataDrivenTestClass)
+        assert_true(parent.setupCalled)
+        assert_equal('verify_not_equals', test.__name__)
+
+        snot.data_driven_fixture_names[datadriventest] = {}
+        snot.current_result = proxied_result(datadriventest, 'ddt', ('Test2', 'arg2', 'bar'))
+        assert_equal([None, None, None], snot.data_driven_proxy_fixtures('setup'))
+        del snot.data_driven_fixture_names[datadriventest]
+
+
+def sample_in_worker():
+    snot.current_result.attributes['pid'] = str(os.getpid())
+
+
+def sample_failing_in_worker():
+    snot.current_result.attributes['pid'] = str(os.getpid())
+    assert_equal(1, 2)
+
+
+@istest
+def test_processes_report_through_parent():
+    """With --snot-processes the tests run in worker processes, and their results reach slick through this one
+
+    The workers pass every request for slick back to the process that filed the results, and the outcome of each
+    test is added to nose's result there.
+
+    :component: Processes
+    :author: agent
+    :steps:
+        1. Prepare 4 tests, one of them failing, with --snot-processes 2
+        2. Run the replacement prepareTest returned
+    :expectedResults:
+        1. prepareTest returned a replacement to run the tests with
+        2. Every test ran in another process, it's result in slick is finished with it's status, and nose's result
+           has the 4 tests and the failure
+    """
+    with plugin_reporting_to_fake_slick('--snot-processes', '2') as (slick, plugin):
+        proxy = nose.proxy.ResultProxyFactory(nose.config.Config(plugins=nose.plugins.manager.PluginManager(plugins=[plugin])))
+        functions = [sample_login, sample_logout, sample_in_worker, sample_failing_in_worker]
+        tests = [nose.case.Test(nose.case.FunctionTestCase(function), resultProxy=proxy) for function in functions]
+        run = plugin.prepareTest(tests)
+        assert_true(callable(run))
+        result = unittest.TestResult()
+        run(result)
+        assert_equal(4, result.testsRun)
+        assert_equal(["snottests.sample_failing_in_worker"], [test.id() for test, err in result.failures])
+        assert_in("assert", result.failures[0][1].lower())
+        statuses = dict((plugin.results[test.id()].id, status) for test, status in
+                        zip(tests, ['PASS', 'PASS', 'PASS', 'FAIL']))
+        for result_id, status in statuses.items():
+            assert_equal(status, slick.store['results'][result_id]['status'])
+            assert_equal('FINISHED', slick.store['results'][result_id]['runstatus'])
+        pids = set(slick.store['results'][plugin.results[test.id()].id]['attributes']['pid'] for test in tests[2:])
+        assert_not_in(str(os.getpid()), pids)
+
+
+@istest
+def test_processes_file_updates_in_background_and_merge_timings():
+    """--snot-processes workers don't wait for their updates to be filed, and their timings are added to the parent's
+
+    :component: Processes
+    :author: agent
+    :steps:
+        1. Update a result through a worker's ForwardingRequests, with no parent to reply
+        2. Run 3 tests with --snot-processes 2 and --snot-timings
+    :expectedResults:
+        1. The worker is answered with the result it sent, and the update is passed on to be filed
+        2. Each result in slick is passed, and the parent's timings have every worker's startTest and addSlickResult
+    """
+    events = queue.Queue()
+    response = snot.ForwardingRequests(0, events, None).put("http://slick/api/results/1",
+                                                              data=json.dumps({'id': '1', 'status': 'PASS'}))
+    assert_equal({'id': '1', 'status': 'PASS'}, response.json())
+    assert_equal('file', events.get_nowait()[0])
+    with plugin_reporting_to_fake_slick('--snot-processes', '2', '--snot-timings') as (slick, plugin):
+        proxy = nose.proxy.ResultProxyFactory(nose.config.Config(plugins=nose.plugins.manager.PluginManager(plugins=[plugin])))
+        functions = [sample_login, sample_logout, sample_in_worker]
+        tests = [nose.case.Test(nose.case.FunctionTestCase(function), resultProxy=proxy) for function in functions]
+        result = unittest.TestResult()
+        plugin.prepareTest(tests)(result)
+        assert_equal(3, result.testsRun)
+        assert_equal(['PASS'] * 3, [result['status'] for result in slick.store['results'].values()])
+        for hook in ['startTest', 'addSlickResult']:
+            assert_equal(3, len(snot.timings.samples[hook]))
+
+
+def sample_dying_in_worker():
+    if multiprocessing.current_process().name.startswith('snot-worker'):
+        # long enough for the worker to have told the parent the test started
+        time.sleep(0.2)
+        os._exit(3)
+
+
+@istest
+def test_processes_report_tests_lost_with_a_worker():
+    """When a --snot-processes worker dies, the test it was running fails with an error instead of going missing
+
+    The other worker runs the rest of the tests.  The test the dead worker started, and the unit it took, each get an
+    error saying how the worker exited.
+
+    :component: Processes
+    :author: agent
+    :steps:
+        1. Run 3 tests with --snot-processes 2, one of them making it's worker exit
+    :expectedResults:
+        1. nose's result has the 3 tests, and errors for the test and unit of the worker that exited
+    """
+    with plugin_reporting_to_fake_slick('--snot-processes', '2') as (slick, plugin):
+        proxy = nose.proxy.ResultProxyFactory(nose.config.Config(plugins=nose.plugins.manager.PluginManager(plugins=[plugin])))
+        functions = [sample_login, sample_dying_in_worker, sample_logout]
+        tests = [nose.case.Test(nose.case.FunctionTestCase(function), resultProxy=proxy) for function in functions]
+        result = unittest.TestResult()
+        plugin.prepareTest(tests)(result)
+        assert_equal(3, result.testsRun)
+        assert_equal(["snottests.sample_dying_in_worker"] * 2, [test.id() for test, err in result.errors])
+        for test, err in result.errors:
+            assert_in("exited with 3", err)
+        assert_equal([], result.failures)
+
+
+@istest
+def test_unchanged_testcases_not_sent_again():
+    """With a testcase cache, testcases that haven't changed since the last run aren't found or sent again
+
+    --snot-testcase-cache remembers the id and a digest of each testcase sent to slick.  The next time a test is
+    scheduled with the same testcase, it's result refers to the remembered testcase without asking slick.
+
+    :component: Scheduling
+    :author: agent
+    :steps:
+        1. Prepare 2 tests with a new testcase cache
+        2. Prepare the same 2 tests and a new one with the cache
+        3. Change what the cache remembers sending for one test, and prepare them again
+        4. Delete one of the testcases from slick, and prepare them again
+    :expectedResults:
+        1. Both testcases are found and created in slick
+        2. Only the new test's testcase is found and created, and every result refers to it's test's testcase
+        3. Only the changed testcase is found and updated
+        4. slick refuses the result for the deleted testcase, so it's created again and the cache remembers the new
+           one, under the slick url
+    """
+    cache_path = os.path.join(tempfile.mkdtemp(), 'testcases.json')
+    with FakeSlick() as slick, preserved_snot_globals():
+        def prepare(*functions):
+            slick.reset_counts()
+            plugin = snot_plugin(slick.url, '--snot-testcase-cache', cache_path)
+            tests = nose_tests(*functions)
+            plugin.prepareTest(tests)
+            return dict((test.id(), slick.store['results'][plugin.results[test.id()].id]['testcase']['testcaseId'])
+                        for test in tests)
+
+        first = prepare(sample_login, sample_logout)
+        assert_equal(2, slick.count('GET', 'testcases'))
+        assert_equal(2, slick.count('POST', 'testcases'))
+        second = prepare(sample_login, sample_logout, sample_in_worker)
+        assert_equal(1, slick.count('GET', 'testcases'))
+        assert_equal(1, slick.count('POST', 'testcases'))
+        assert_equal(0, slick.count('PUT', 'testcases'))
+        assert_equal(first['snottests.sample_login'], second['snottests.sample_login'])
+        assert_equal(first['snottests.sample_logout'], second['snottests.sample_logout'])
+        assert_equal(3, len(slick.store['testcases']))
+        with open(cache_path) as cache_file:
+            saved = json.load(cache_file)
+        for key, entry in saved['testcases'].items():
+            if key.endswith('sample_login'):
+                entry[1] = 'changed'
+        with open(cache_path, 'w') as cache_file:
+            json.dump(saved, cache_file)
+        third = prepare(sample_login, sample_logout, sample_in_worker)
+        assert_equal(1, slick.count('GET', 'testcases'))
+        assert_equal(1, slick.count('PUT', 'testcases'))
+        assert_equal(0, slick.count('POST', 'testcases'))
+        del slick.store['testcases'][third['snottests.sample_logout']]
+        fourth = prepare(sample_login, sample_logout, sample_in_worker)
+        assert_equal(1, slick.count('GET', 'testcases'))
+        assert_equal(1, slick.count('POST', 'testcases'))
+        assert_in(fourth['snottests.sample_logout'], slick.store['testcases'])
+        with open(cache_path) as cache_file:
+            saved = json.load(cache_file)
+        for key, entry in saved['testcases'].items():
+            assert_true(key.startswith(slick.url + ' '))
+            if key.endswith('sample_logout'):
+                assert_equal(fourth['snottests.sample_logout'], entry[0])
+
+
+@istest
+def test_existing_testrun_fetched_once():
+    """When reporting to an existing testrun and result, they're only fetched from slick once
+
+    With --slick-testrun-id and --slick-result-id, every test reports to the same result, so it's fetched once
+    while preparing the tests, and the testrun is only fetched when it's finished.
+
+    :component: Existing Testrun
+    :author: agent
+    :steps:
+        1. Prepare 3 tests to report to an existing result
+        2. Finalize the run
+    :expectedResults:
+        1. The result was fetched once over a pooled connection, every test uses it, and the testrun wasn't fetched
+        2. The testrun was fetched once and finished, and slickqa sends it's requests with the requests module again
+    """
+    with FakeSlick() as slick, preserved_snot_globals():
+        existing_testrun = slick.create('testruns', {'name': 'Existing'})
+        existing_result = slick.create('results', {'status': 'PASS', 'testrun': {'testrunId': existing_testrun['id']}})
+        plugin = snot_plugin(slick.url, '--slick-testrun-id', existing_testrun['id'], '--slick-result-id', existing_result['id'])
+        tests = nose_tests(sample_login, sample_logout, sample_login)
+        plugin.prepareTest(tests)
+        assert_equal(1, slick.count('GET', 'results'))
+        assert_equal(0, slick.count(collection='testruns'))
+        assert_equal(set([existing_result['id']]), set(result.id for result in plugin.results.values()))
+        assert_is_instance(slickqa.connection.requests, requests.Session)
+        plugin.finalize(None)
+        assert_equal(1, slick.count('GET', 'testruns'))
+        assert_equal('FINISHED', slick.store['testruns'][existing_testrun['id']]['state'])
+        assert_is(requests, slickqa.connection.requests)
+
+
+@istest
+def test_graph_values_written_in_batches():
+    """Values written to a result's graph during a test are sent to slick in batches
+
+    write_to_graph buffers the values for the current result in a GraphBuffer, which adds them to the result's
+    graph and updates the result every batch_size values, and when it's flushed at the end of the test.
+
+    :component: Graphs
+    :author: agent
+    :steps:
+        1. Write 25 values to the graph of the current result with a batch size of 10
+        2. Flush the graph buffer
+    :expectedResults:
+        1. The result was updated twice, with 10 and 20 values
+        2. The result was updated again with all 25 values, in the order they were written, each the same as a
+           GraphValueReference made from it's dict
+    """
+    result = Result()
+    result.graph = {'columns': [{'type': 'line', 'name': 'Requests'}, {'type': 'line', 'name': 'Errors'}], 'values': []}
+    updates = []
+    result.update = lambda: updates.append(len(result.graph.values))
+    with preserved_snot_globals():
+        snot.current_result = result
+        snot.graph_buffer = snot.GraphBuffer(result, batch_size=10, batch_interval=60)
+        for i in range(25):
+            snot.write_to_graph({'date': 1500000000000 + i * 1000, 'measurements': [i, i % 3]})
+        assert_equal([10, 20], updates)
+        snot.graph_buffer.flush()
+    assert_equal([10, 20, 25], updates)
+    assert_equal([[i, i % 3] for i in range(25)], [value.measurements for value in result.graph.values])
+    assert_equal(1500000024000, result.graph.to_dict(serial=True)['values'][24]['date'])
+    expected = GraphValueReference.from_dict({'date': 1500000024000, 'measurements': [24, 0]})
+    assert_equal(expected.to_dict(serial=True), result.graph.values[24].to_dict(serial=True))
+    assert_equal(expected.date, result.graph.values[24].date)
+
+
+@istest
+def test_graph_values_written_as_a_block():
+    """Many graph values can be written at once from a sequence of dates and a block of measurements
+
+    write_values_to_graph takes the dates of the values and a row of measurements for each, and adds them to the
+    result's graph with a single update.  Dates can be millis or datetimes.
+
+    :component: Graphs
+    :author: agent
+    :steps:
+        1. Write 3 values with dates in millis and a list of rows
+        2. Write 2 values with datetime dates
+        3. Write 2 dates with only 1 row of measurements
+    :expectedResults:
+        1. The result was updated once with the 3 values
+        2. The result was updated again with all 5 values, the datetimes sent as millis
+        3. Nothing was written
+    """
+    result = Result()
+    result.graph = {'columns': [{'type': 'line', 'name': 'Latency'}, {'type': 'line', 'name': 'Throughput'}], 'values': []}
+    updates = []
+    result.update = lambda: updates.append(len(result.graph.values))
+    with preserved_snot_globals():
+        snot.current_result = result
+        snot.graph_buffer = None
+        snot.write_values_to_graph([1000, 2000, 3000], [[10, 100], [20, 200], [30, 300]])
+        assert_equal([3], updates)
+        epoch = datetime.datetime.utcfromtimestamp(0)
+        snot.write_values_to_graph([epoch + datetime.timedelta(seconds=4), epoch + datetime.timedelta(seconds=5)],
+                                   [[40, 400], [50, 500]])
+        snot.write_values_to_graph([6000, 7000], [[60, 600]])
+    assert_equal([3, 5], updates)
+    serialized = result.graph.to_dict(serial=True)['values']
+    assert_equal([1000, 2000, 3000, 4000, 5000], [value['date'] for value in serialized])
+    assert_equal([50, 500], serialized[4]['measurements'])
+
+
+class InterruptedReplayer(snotspool.SpoolReplayer):
+    """A replay that loses it's connection to slick after sending a few entries."""
+
+    def __init__(self, path, url, entries):
+        super(InterruptedReplayer, self).__init__(path, url)
+        self.entries = entries
+
+    def send_entry(self, entry, resending=False):
+        if self.entries == 0:
+            raise snotspool.SpoolReplayError("connection lost", unsent=True)
+        self.entries -= 1
+        return super(InterruptedReplayer, self).send_entry(entry, resending)
+
+
+class KilledReplayer(snotspool.SpoolReplayer):
+    """A replay that's killed right after slick gets the first entry sending to path, before it can record that."""
+
+    def __init__(self, path, url, path_end):
+        super(KilledReplayer, self).__init__(path, url)
+        self.path_end = path_end
+
+    def send_entry(self, entry, resending=False):
+        new_ids = super(KilledReplayer, self).send_entry(entry, resending)
+        if entry['method'] == 'POST' and entry['path'][-1] == self.path_end:
+            raise KeyboardInterrupt()
+        return new_ids
+
+
+def spool_sample_run(journal):
+    with preserved_snot_globals():
+        plugin = snot_plugin('http://127.0.0.1:9', '--snot-spool', journal)
+        tests = nose_tests(sample_login, sample_logout)
+        plugin.prepareTest(tests)
+        for test in tests:
+            plugin.startTest(test)
+            logging.getLogger('snottests.spooled').info("running %s", test.id())
+            plugin.addSuccess(test)
+            plugin.afterTest(test)
+        plugin.finalize(None)
+    return plugin
+
+
+@istest
+def test_spooled_run_replayed_to_slick():
+    """A run spooled to a journal without slick is sent to slick later by replaying the journal
+
+    With --snot-spool nothing is sent to slick, everything goes in the journal.  Replaying it creates the testrun,
+    testcases and results in slick, using the project that's already there.  A replay that stops part way resumes
+    where it stopped, and replaying a journal that was already sent does nothing.
+
+    :component: Spool
+    :author: agent
+    :steps:
+        1. Run 2 tests with --snot-spool and a slick url nothing is listening on
+        2. Replay the journal, losing the connection to slick after 5 entries
+        3. Replay the journal again
+        4. Replay the journal once more
+    :expectedResults:
+        1. The run finishes and writes a journal, remembering the testcases but not the results, and slickqa sends
+           it's requests with the requests module again
+        2. The replay stops with an error
+        3. The rest of the journal is sent, slick has the 2 passed results in a finished testrun of the existing project
+        4. Nothing is sent
+    """
+    journal = os.path.join(tempfile.mkdtemp(), 'run.journal')
+    plugin = spool_sample_run(journal)
+    assert_is(requests, slickqa.connection.requests)
+    assert_equal(2, len(plugin.spool.responder.store['testcases']))
+    assert_not_in('results', plugin.spool.responder.store)
+    with FakeSlick() as slick:
+        project = slick.create('projects', {'name': 'Snot', 'releases': [], 'components': []})
+        assert_raises(snotspool.SpoolReplayError, InterruptedReplayer(journal, slick.url, 5).replay)
+        assert_greater(snotspool.SpoolReplayer(journal, slick.url).replay(), 0)
+        assert_equal([project['id']], list(slick.store['projects'].keys()))
+        assert_equal(['PASS', 'PASS'], [result['status'] for result in slick.store['results'].values()])
+        assert_equal(2, len(slick.store['testcases']))
+        testrun = list(slick.store['testruns'].values())[0]
+        assert_equal(1, len(slick.store['testruns']))
+        assert_equal('FINISHED', testrun['state'])
+        for result in slick.store['results'].values():
+            assert_equal(testrun['id'], result['testrun']['testrunId'])
+            assert_in(result['testcase']['testcaseId'], slick.store['testcases'])
+        slick.reset_counts()
+        assert_equal(0, snotspool.SpoolReplayer(journal, slick.url).replay())
+        assert_equal(0, slick.count())
+
+
+@istest
+def test_replay_killed_mid_request_doesnt_duplicate():
+    """An entry a killed replay was sending is only sent again when that can't duplicate it in slick
+
+    :component: Spool
+    :author: agent
+    :steps:
+        1. Spool a run of 2 tests, replay it and kill the replay just after slick gets the first result
+        2. Replay the journal again
+        3. Spool another run, replay it and kill the replay just after slick gets the first chunk of a file
+        4. Replay the journal again
+        5. Replay it again, saying the chunk was sent
+    :expectedResults:
+        1. Slick has 1 result
+        2. The replay finds that result instead of creating it again, slick has the 2 passed results
+        3. Slick has 1 chunk
+        4. The replay stops with an error, the chunk could be added twice
+        5. The rest of the journal is sent without adding the chunk again, both files have 1 chunk
+    """
+    journal = os.path.join(tempfile.mkdtemp(), 'run.journal')
+    spool_sample_run(journal)
+    with FakeSlick() as slick:
+        slick.create('projects', {'name': 'Snot', 'releases': [], 'components': []})
+        assert_raises(KeyboardInterrupt, KilledReplayer(journal, slick.url, 'results').replay)
+        assert_equal(1, len(slick.store['results']))
+        assert_greater(snotspool.SpoolReplayer(journal, slick.url).replay(), 0)
+        assert_equal(['PASS', 'PASS'], [result['status'] for result in slick.store['results'].values()])
+    journal = os.path.join(tempfile.mkdtemp(), 'run.journal')
+    spool_sample_run(journal)
+    with FakeSlick() as slick:
+        slick.create('projects', {'name': 'Snot', 'releases': [], 'components': []})
+        assert_raises(KeyboardInterrupt, KilledReplayer(journal, slick.url, 'addchunk').replay)
+        assert_equal([1], [len(chunks) for chunks in slick.chunks.values()])
+        assert_raises(snotspool.SpoolReplayError, snotspool.SpoolReplayer(journal, slick.url).replay)
+        assert_greater(snotspool.SpoolReplayer(journal, slick.url, in_flight='sent').replay(), 0)
+        assert_equal([1, 1], [len(chunks) for chunks in slick.chunks.values()])
+
+
+@istest
+def test_files_uploaded_in_chunks():
+    """Files are uploaded to slick in chunks of the size slick asks for, from binary or text file objects
+
+    The FileUploader reads a file a chunk at a time (text is sent as utf-8), can gzip text files on the way, and
+    uploads several files at once before updating the result once.
+
+    :component: Files
+    :author: agent
+    :steps:
+        1. Upload a 600KB text file object, with some non ascii text, and 2 files from disk with 3 workers
+        2. Upload the text file object again, gzipped
+    :expectedResults:
+        1. The result has the 3 files and was updated once, the text arrived in full in chunks of 256KB and a remainder
+        2. The gzipped file is named with .gz and unzips to the same text
+    """
+    text = u"caf\u00e9 " * 120000
+    with FakeSlick() as slick:
+        result = Result.from_dict(slick.create('results', {'status': 'NO_RESULT'}))
+        snot.make_result_updatable(result, SlickConnection(slick.url))
+        uploader = snot.FileUploader(workers=3)
+        try:
+            uploader.attach(result, [("capture.txt", io.StringIO(text)), __file__, os.path.join(os.path.dirname(__file__), 'README.md')])
+        finally:
+            uploader.close()
+        assert_equal(1, slick.count('PUT', 'results'))
+        assert_equal(['capture.txt', os.path.basename(__file__), 'README.md'], [stored.filename for stored in result.files])
+        chunks = slick.chunks[result.files[0].id]
+        assert_equal([262144, 262144], [len(chunk) for chunk in chunks[:-1]])
+        assert_equal(text.encode('utf-8'), b''.join(chunks))
+        assert_equal(len(text.encode('utf-8')), slick.store['files'][result.files[0].id]['length'])
+        snot.FileUploader(gzip_text=True).attach(result, [("capture.txt", io.StringIO(text))])
+        assert_equal('capture.txt.gz', result.files[3].filename)
+        assert_equal(text.encode('utf-8'), gzip.GzipFile(fileobj=io.BytesIO(b''.join(slick.chunks[result.files[3].id]))).read())
+
+
+@istest
+def test_deferred_uploads_use_a_copy_of_the_file():
+    """Deferred uploads copy the file right away and upload the copy in the background, within the bandwidth limit
+
+    With deferred uploads, attach returns as soon as the file is copied, so the test can change or remove the file.
+    wait() blocks until the uploads are done, updates the result with the files, and returns any that failed.
+
+    :component: Files
+    :author: agent
+    :steps:
+        1. Defer the upload of a 300KB file with a bandwidth limit of 1MB a second, then change the file and the
+           result's status in slick
+        2. Defer the upload of a file to a result on a slick that isn't there
+        3. Wait for the uploads
+    :expectedResults:
+        1. attach returns before anything is uploaded
+        2. attach returns without an error, and once the background uploads are done the status in slick is unchanged
+        3. slick has the file as it was when it was attached, which took at least a quarter of a second to upload,
+           and the result of the missing slick is reported as a failure
+    """
+    path = os.path.join(tempfile.mkdtemp(), 'screenshot.png')
+    original = b"\x89PNG" + b"\x00" * 300000
+    with open(path, 'wb') as screenshot:
+        screenshot.write(original)
+    with FakeSlick(latency=0.01) as slick:
+        result = Result.from_dict(slick.create('results', {'status': 'NO_RESULT'}))
+        snot.make_result_updatable(result, SlickConnection(slick.url))
+        lost = Result.from_dict({'id': 'lost', 'status': 'NO_RESULT'})
+        snot.make_result_updatable(lost, SlickConnection('http://127.0.0.1:9'))
+        uploader = snot.FileUploader(deferred=True, bandwidth=1000000)
+        started = time.time()
+        try:
+            uploader.attach(result, [path])
+            assert_equal(0, slick.count('POST', 'files'))
+            with open(path, 'wb') as screenshot:
+                screenshot.write(b"changed")
+            slick.store['results'][result.id]['status'] = 'FAIL'
+            uploader.attach(lost, [path])
+            uploader.queue.join()
+            assert_equal('FAIL', slick.store['results'][result.id]['status'])
+            failures = uploader.wait()
+        finally:
+            uploader.close()
+        assert_greater_equal(time.time() - started, 0.25)
+        assert_equal([path], [failed_path for failed_path, error in failures])
+        stored = slick.store['results'][result.id]['files']
+        assert_equal(['screenshot.png'], [stored_file['filename'] for stored_file in stored])
+        assert_equal(original, b''.join(slick.chunks[stored[0]['id']]))
+
+
+class CollectedOutput(object):
+    def __init__(self):
+        self.written = []
+
+    def write(self, text):
+        self.written.append(text)
+
+
+@istest
+def test_timings_summary():
+    """With --snot-timings the time spent in each hook and the requests sent to slick are summarized at the end
+
+    The plugin's hooks record how long each call took, the requests to slick are counted, and finalize prints a
+    summary (and with --snot-timings-attach adds it to the testrun).
+
+    :component: Timings
+    :author: agent
+    :steps:
+        1. Run 2 tests with --snot-timings-attach
+        2. Finalize the run
+    :expectedResults:
+        1. prepareTest was timed once, and addSlickTestrun, startTest, addSlickResult and afterTest once for each test
+        2. The summary is printed with the number of requests slick got, the testrun has snot-timings.txt, and
+           slickqa sends it's requests with the requests module again
+    """
+    output = CollectedOutput()
+    with plugin_reporting_to_fake_slick('--snot-timings-attach') as (slick, plugin):
+        tests = nose_tests(sample_login, sample_logout)
+        plugin.prepareTest(tests)
+        for test in tests:
+            plugin.startTest(test)
+            plugin.addSuccess(test)
+            plugin.afterTest(test)
+        assert_equal(1, len(snot.timings.samples['prepareTest']))
+        for hook in ['addSlickTestrun', 'startTest', 'addSlickResult', 'afterTest']:
+            assert_equal(2, len(snot.timings.samples[hook]))
+        saved_stderr, sys.stderr = sys.stderr, output
+        try:
+            plugin.finalize(None)
+        finally:
+            sys.stderr = saved_stderr
+        summary = "".join(output.written)
+        assert_in("addSlickResult", summary)
+        assert_in("slick requests: {} ".format(slick.count()), summary)
+        testrun = list(slick.store['testruns'].values())[0]
+        assert_equal(['snot-timings.txt'], [stored['filename'] for stored in testrun['files']])
+        assert_is(requests, slickqa.connection.requests)
+
+
+@istest
+def test_timings_reported_when_scheduling_or_reporting_to_an_existing_testrun():
+    """The --snot-timings summary is printed and attached when scheduling and when reporting to an existing testrun
+
+    Scheduling exits from prepareTest, before finalize would report the timings, and an existing testrun isn't
+    fetched until it's finished, so both report them on their own.
+
+    :component: Timings
+    :author: agent
+    :steps:
+        1. Schedule 2 tests with --snot-timings-attach
+        2. Run a test reporting to an existing testrun and result with --snot-timings-attach
+    :expectedResults:
+        1. The summary is printed and the scheduled testrun has snot-timings.txt
+        2. The existing testrun has snot-timings.txt and is finished
+    """
+    output = CollectedOutput()
+    with plugin_reporting_to_fake_slick('--slick-schedule-results', '--snot-timings-attach') as (slick, plugin):
+        saved_stderr, sys.stderr = sys.stderr, output
+        try:
+            assert_raises(SystemExit, plugin.prepareTest, nose_tests(sample_login, sample_logout))
+        finally:
+            sys.stderr = saved_stderr
+        assert_in("addSlickTestrun", "".join(output.written))
+        testrun = list(slick.store['testruns'].values())[0]
+        assert_equal(['snot-timings.txt'], [stored['filename'] for stored in testrun['files']])
+    with FakeSlick() as slick, preserved_snot_globals():
+        existing_testrun = slick.create('testruns', {'name': 'Existing'})
+        existing_result = slick.create('results', {'status': 'PASS', 'testrun': {'testrunId': existing_testrun['id']}})
+        plugin = snot_plugin(slick.url, '--slick-testrun-id', existing_testrun['id'], '--slick-result-id',
+                             existing_result['id'], '--snot-timings-attach')
+        plugin.prepareTest(nose_tests(sample_login))
+        saved_stderr, sys.stderr = sys.stderr, output
+        try:
+            plugin.finalize(None)
+        finally:
+            sys.stderr = saved_stderr
+        testrun = slick.store['testruns'][existing_testrun['id']]
+        assert_equal(['snot-timings.txt'], [stored['filename'] for stored in testrun['files']])
+        assert_equal('FINISHED', testrun['state'])
+
+
+IMPORTED_SLICK_MODULES = """
+import optparse
+import sys
+import nose.config
+import snot
+
+def configured(*args):
+    plugin = snot.SlickAsSnotPlugin()
+    parser = optparse.OptionParser()
+    plugin.addOptions(parser, env={})
+    options, _ = parser.parse_args(list(args))
+    options.files = None
+    plugin.configure(options, nose.config.Config())
+    print(",".join(name for name in ['requests', 'slickqa', 'snotspool'] if name in sys.modules))
+
+configured()
+configured('--with-snot', '--slick-url', 'http://localhost:9999', '--slick-project-name', 'Snot')
+"""
+
+
+@istest
+def test_slickqa_imported_once_enabled():
+    """Importing snot doesn't import slickqa, requests or snotspool until the plugin is enabled
+
+    nose imports snot in every run, so snot leaves slick's modules alone until configure finds --with-snot.
+
+    :component: Nose Plugin
+    :author: agent
+    :steps:
+        1. In a new interpreter, import snot and configure the plugin without --with-snot
+        2. Configure it again with --with-snot
+    :expectedResults:
+        1. None of requests, slickqa or snotspool have been imported
+        2. All three have been imported
+    """
+    output = subprocess.check_output([sys.executable, '-c', IMPORTED_SLICK_MODULES],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert_equal(["", "requests,slickqa,snotspool"], output.decode('utf-8').splitlines())
+
+
+UNCONFIGURED_PLUGIN = """
+import sys
+import nose.case
+import nose.config
+import snot
+
+def sample():
+    pass
+
+if sys.version_info >= (3, 7):
+    from snot import Result, ResultStatus
+else:
+    snot.load_slick()
+    Result, ResultStatus = snot.Result, snot.ResultStatus
+plugin = snot.SlickAsSnotPlugin()
+plugin.enabled = True
+plugin.mode = 'normal'
+plugin.results = dict()
+plugin.results_by_suffix = dict()
+result = Result()
+result.attributes = {}
+result.update = lambda: None
+test = nose.case.Test(nose.case.FunctionTestCase(sample), config=nose.config.Config())
+plugin.indexSlickResult(test.id(), result)
+plugin.addSlickResult(test, ResultStatus.PASS)
+print(result.status)
+"""
+
+
+@istest
+def test_slick_names_load_without_configure():
+    """snot's slick names and result hooks work on a plugin that was never configured
+
+    :component: Nose Plugin
+    :author: agent
+    :steps:
+        1. In a new interpreter, import Result and ResultStatus from snot (calling load_slick first on python 2)
+        2. Add a result for a test to a plugin that configure was never called on
+    :expectedResults:
+        1. The names are imported
+        2. The result's status is set without a NameError
+    """
+    output = subprocess.check_output([sys.executable, '-c', UNCONFIGURED_PLUGIN],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert_equal(["PASS"], output.decode('utf-8').splitlines())